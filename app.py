@@ -4,16 +4,33 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from redis import Redis
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 import calendar
-import pandas as pd
-import io
+import tempfile
 import logging   # <--- ini baris import logging
 import traceback
 from flask import send_file
-from pywebpush import webpush, WebPushException
 from flask_wtf import CSRFProtect
+from contextlib import closing
+from migrations import apply_migrations
+import db
+from db import get_db
+import json
+import notifications
+from notifications import enqueue_notification, enqueue_notification_batch, save_subscription
+import migrasi_data
+import rekap
+import cuti
+import hierarki
+import cache
+import lampiran
+import pratinjau
+import arsip_laporan
+import ekspor_periode
+import metrik
+import jejak_sql
+from klasifikasi import status_absensi_batch
 
 
 # setup logging
@@ -24,10 +41,19 @@ logging.basicConfig(
 
 app = Flask(__name__)   # inisialisasi app Flask
 app.logger.info("Aplikasi Flask sudah start 🚀")   # logging pertama kali
+# Latensi, status dan SQL per request untuk /metrics (dipasang paling awal, lihat metrik.py)
+metrik.init_app(app)
+# Jejak SQL + deteksi N+1 untuk pengembangan (SQL_TRACE=1 atau FLASK_DEBUG, lihat jejak_sql.py)
+jejak_sql.init_app(app)
 
 # --- Upload folder (buat default & set ke config) ---Z
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Lampiran baru disimpan sekali per isi file di blob store (lihat lampiran.py)
+app.config["BLOB_FOLDER"] = os.path.join(UPLOAD_FOLDER, "blobs")
+# Thumbnail dan pratinjau web lampiran gambar (lihat pratinjau.py)
+app.config["TURUNAN_FOLDER"] = os.path.join(UPLOAD_FOLDER, "turunan")
+pembuat_pratinjau = pratinjau.PembuatTurunan(folder_blob=app.config["BLOB_FOLDER"], folder=app.config["TURUNAN_FOLDER"])
 # Pastikan ukuran maksimal upload (opsional): misal 16 MB
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
 
@@ -63,13 +89,95 @@ csrf = CSRFProtect(app)
 
 
 # --- Konfigurasi Path Database ---
-DATABASE = os.getenv("DATABASE", "database.db")
+# Path diambil dari env DATABASE (lihat db.py). Koneksi per request diambil
+# dari pool lewat get_db() dan dikembalikan otomatis saat request selesai.
+DATABASE = db.DATABASE
+db.init_app(app)
+
+# Pasang migrasi skema (indeks, kolom tanggal_hari, dst.) sekali saat start
+with closing(db.connect()) as _conn:
+    apply_migrations(_conn)
 
 # --- Fungsi Bantuan ---
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+
+# Rentang tanggal [awal, akhir) untuk filter kolom tanggal berformat 'YYYY-MM-DD HH:MM:SS'.
+# Dipakai sebagai pengganti strftime(...) = ? agar query bisa memakai indeks.
+def rentang_bulan(bulan):
+    year, month = map(int, bulan.split('-'))
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+# Rentang laporan (inklusif, 'YYYY-MM-DD') dari query string ?bulan=YYYY-MM atau
+# ?dari=YYYY-MM-DD&sampai=YYYY-MM-DD. Tanpa parameter: bulan terakhir yang ada datanya.
+# Melempar ValueError jika parameter tidak valid.
+def rentang_laporan(conn, args):
+    dari, sampai = args.get('dari'), args.get('sampai')
+    if dari or sampai:
+        try:
+            awal = datetime.strptime(dari or sampai, '%Y-%m-%d').date()
+            akhir = datetime.strptime(sampai or dari, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Format tanggal harus YYYY-MM-DD.")
+        if akhir < awal:
+            raise ValueError("Tanggal akhir lebih awal dari tanggal mulai.")
+        if (akhir - awal).days >= rekap.MAKS_HARI_LAPORAN:
+            raise ValueError(f"Rentang laporan maksimal {rekap.MAKS_HARI_LAPORAN} hari.")
+        return awal.isoformat(), akhir.isoformat()
+
+    bulan = args.get('bulan') or rekap.bulan_terakhir(conn)
+    try:
+        bulan_obj = datetime.strptime(bulan, '%Y-%m')
+    except ValueError:
+        raise ValueError("Format bulan harus YYYY-MM.")
+    year, month = bulan_obj.year, bulan_obj.month
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+def judul_rentang(awal, akhir):
+    mulai, selesai = datetime.strptime(awal, '%Y-%m-%d'), datetime.strptime(akhir, '%Y-%m-%d')
+    if awal[:7] == akhir[:7] and mulai.day == 1 and selesai.day == calendar.monthrange(selesai.year, selesai.month)[1]:
+        return mulai.strftime("%B %Y")
+    return f"{mulai.strftime('%d %b %Y')} - {selesai.strftime('%d %b %Y')}"
+
+# Data turunan attendance (rekap harian/bulanan dan ledger cuti) diperbarui di
+# transaksi yang sama dengan perubahan attendance; commit tetap di pemanggil.
+# Versi cache absensi (global, milik nip dan per bulan) ikut dinaikkan di transaksi itu.
+def perbarui_data_turunan(conn, nip, awal, akhir):
+    rekap.refresh_rekap(conn, nip, awal, akhir)
+    cuti.refresh_ledger(conn, nip, awal, akhir)
+    cache.naikkan_versi(conn, 'absensi', f"nip:{nip}", *rekap.kunci_bulan(awal, akhir))
+
+# --- Data Turunan Ber-cache (lihat cache.py) ---
+# Saldo cuti tahunan tahun ini; kedaluwarsa saat absensi/cuti nip atau data users berubah
+def saldo_cuti_cache(conn, nip):
+    tahun = datetime.now().year
+    return cache.ambil(conn, 'saldo_cuti', [nip, tahun], (f"nip:{nip}", 'pengguna'),
+                       lambda: cuti.saldo_cuti(conn, nip, tahun))
+
+# Daftar bawahan beserta jumlah klarifikasi yang menunggu
+def daftar_bawahan_cache(conn, nip, lewat_atasan=False):
+    return cache.ambil(conn, 'daftar_bawahan', [nip, lewat_atasan], ('absensi', 'pengguna'),
+                       lambda: [dict(row) for row in hierarki.daftar_bawahan(conn, nip, lewat_atasan=lewat_atasan)])
+
+# Data laporan rekap untuk rentang tanggal (tampilan dan download Excel)
+# File Excel laporan di bawah ukuran ini disiapkan di memori, di atasnya di disk
+LAPORAN_SPOOL_BYTES = 4 * 1024 * 1024
+
+def laporan_cache(conn, awal, akhir):
+    return cache.ambil(conn, 'laporan', [awal, akhir], ('absensi', 'pengguna'),
+                       lambda: rekap.laporan(conn, awal, akhir))
+
+# Daftar role staf yang hanya melihat dashboard absensi pribadi
+ROLES_STAF_SAJA = ['Dosen', 'P3M', 'UP3M', 'TIK', 'PP']
+
+# URL dashboard sesuai role (None jika role tidak punya dashboard)
+def url_dashboard(role):
+    if role in ROLES_STAF_SAJA:
+        return url_for('dashboard_dosen')
+    if role == 'Admin':
+        return url_for('dashboard_admin')
+    if role in DASHBOARD_PIMPINAN:
+        return url_for(f'dashboard_{role.lower()}')
+    return None
 
 # --- Rute Utama dan Login ---
 @app.route('/')
@@ -88,12 +196,11 @@ def login():
         nip = request.form['nip']
         password = request.form['password']
 
-        conn = get_db_connection()
+        conn = get_db()
         user = conn.execute(
             'SELECT * FROM users WHERE nip = ? AND password = ?',
             (nip, password)
         ).fetchone()
-        conn.close()
 
         if user:
             # Simpan data ke session
@@ -102,29 +209,12 @@ def login():
             session['user_role'] = user['role']
             session['user_jurusan'] = user['jurusan']
 
-            # Daftar role staf yang hanya melihat dashboard absensi pribadi
-            ROLES_STAF_SAJA = ['Dosen', 'P3M', 'UP3M', 'TIK', 'PP']
-
             # Redirect sesuai role
-            if user['role'] == 'Dosen':
-                return redirect(url_for('dashboard_dosen'))
-            elif user['role'] == 'Sekjur':
-                return redirect(url_for('dashboard_sekjur'))
-            elif user['role'] == 'Kajur':
-                return redirect(url_for('dashboard_kajur'))
-            elif user['role'] == 'Wadir1':
-                return redirect(url_for('dashboard_wadir1'))
-            elif user['role'] == 'Wadir2':
-                return redirect(url_for('dashboard_wadir2'))
-            elif user['role'] == 'Wadir3':
-                return redirect(url_for('dashboard_wadir3'))
-            elif user['role'] == 'Kajur':
-                return redirect(url_for('dashboard_kajur'))
-            elif user['role'] == 'Admin':
-                return redirect(url_for('dashboard_admin'))
-            else:
-                error = 'Role Anda tidak dikenali atau tidak memiliki halaman dashboard.'
-                return render_template('login.html', error=error)
+            dashboard_url = url_dashboard(user['role'])
+            if dashboard_url:
+                return redirect(dashboard_url)
+            error = 'Role Anda tidak dikenali atau tidak memiliki halaman dashboard.'
+            return render_template('login.html', error=error)
         else:
             # Password / NIP salah
             error = 'NIP atau Password salah.'
@@ -145,100 +235,82 @@ def login_blocked():
     if 'user_role' not in session:
         return redirect(url_for('login'))
 
-    # mapping role ke dashboard
-    role_redirect_map = {
-        "Dosen": url_for('dashboard_dosen'),
-        "Kajur": url_for('dashboard_kajur'),
-        "Sekjur": url_for('dashboard_sekjur'),
-        "Wadir1": url_for('dashboard_wadir1'),
-        "Wadir2": url_for('dashboard_wadir2'),
-        "Wadir3": url_for('dashboard_wadir3'),
-        "Direktur": url_for('dashboard_direktur'),
-        "Admin": url_for('dashboard_admin'),
-    }
-
-    role = session['user_role']
-    dashboard_url = role_redirect_map.get(role, url_for('login'))
+    dashboard_url = url_dashboard(session['user_role']) or url_for('login')
 
     return render_template('login_blocked.html', dashboard_url=dashboard_url)
 
 # Handle Back Session 
 @app.after_request
 def add_no_cache_headers(response):
+    # Respons ber-validator (ETag/Last-Modified: file bukti, ringkasan absensi) boleh
+    # disimpan browser pengguna sendiri, tetapi selalu divalidasi ulang (304 jika
+    # tidak berubah) dan tidak boleh disimpan proxy bersama
+    if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+        return response
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private, max-age=0"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
     return response
 
 # --- Rute Dosen ---
+ROLES_STAF = [
+    'Dosen', 'Sekjur', 'P3M', 'UP3M', 'TIK', 'PP',
+    'Wadir1', 'Wadir2', 'Wadir3', 'Kajur', 'Direktur'
+]
+
+# Jumlah baris riwayat absensi per halaman (render awal dashboard dan /api/absensi)
+HALAMAN_ABSENSI = 31
+MAKS_HALAMAN_ABSENSI = 100
+KOLOM_ABSENSI_API = ['id', 'tanggal_formatted', 'jam_masuk_formatted', 'jam_pulang_formatted',
+                     'status_text', 'status_color', 'checkbox_enabled']
+
+# Satu halaman riwayat absensi dengan keyset pagination pada (tanggal, rowid), terbaru dulu.
+# cursor berformat "<tanggal>|<rowid>" dari baris terakhir halaman sebelumnya.
+# Mengembalikan (records, next_cursor); next_cursor None jika sudah halaman terakhir.
+def halaman_absensi(conn, nip, bulan=None, cursor=None, limit=HALAMAN_ABSENSI):
+    kondisi, params = ["nip = ?"], [nip]
+    if bulan:
+        kondisi.append("tanggal >= ? AND tanggal < ?")
+        params.extend(rentang_bulan(bulan))
+    if cursor:
+        tanggal_cursor, rowid_cursor = cursor.rsplit('|', 1)
+        kondisi.append("(tanggal, rowid) < (?, ?)")
+        params.extend([tanggal_cursor, int(rowid_cursor)])
+    rows = conn.execute(
+        f"SELECT *, rowid AS id FROM attendance WHERE {' AND '.join(kondisi)} "
+        "ORDER BY tanggal DESC, rowid DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['tanggal']}|{rows[-1]['id']}"
+    records = [{kolom: rec[kolom] for kolom in KOLOM_ABSENSI_API} for rec in status_absensi_batch(rows)]
+    return records, next_cursor
+
 @app.route('/dashboard_dosen')
 def dashboard_dosen():
-    ROLES_STAF = [
-        'Dosen', 'Sekjur', 'P3M', 'UP3M', 'TIK', 'PP',
-        'Wadir1', 'Wadir2', 'Wadir3', 'Kajur', 'Direktur'
-    ]
     if 'user_role' not in session or session['user_role'] not in ROLES_STAF:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     user_nip = session['user_id']
 
-    records_raw = conn.execute('SELECT *, rowid as id FROM attendance WHERE nip = ? ORDER BY tanggal DESC', (user_nip,)).fetchall()
-    user_data = conn.execute("SELECT jatah_cuti_tahunan FROM users WHERE nip = ?", (user_nip,)).fetchone()
-    
-    current_year = str(datetime.now().year)
-    # --- PERBAIKAN: Query diubah menjadi spesifik hanya untuk 'Cuti Tahunan' ---
-    total_cuti_terpakai_data = conn.execute(
-        """
-        SELECT COUNT(*) as total FROM attendance 
-        WHERE nip = ? AND status LIKE 'Disetujui%' AND keterangan LIKE '%Cuti Tahunan%' AND strftime('%Y', tanggal) = ?
-        """,
-        (user_nip, current_year)
-    ).fetchone()
+    # Hanya halaman pertama yang dirender; halaman berikutnya dimuat lewat /api/absensi saat scroll
+    processed_records, next_cursor = halaman_absensi(conn, user_nip)
+    # Saldo 'Cuti Tahunan' tahun ini dibaca dari ledger cuti (lihat cuti.py)
+    jatah_cuti_tahunan, total_cuti_terpakai, sisa_cuti_tahunan = saldo_cuti_cache(conn, user_nip)
 
-    current_month = datetime.now().strftime('%Y-%m')
-    lupa_masuk_data = conn.execute("SELECT COUNT(*) as total FROM clarifications WHERE nip_pengaju = ? AND jenis_surat = 'Lupa Absen Masuk' AND strftime('%Y-%m', tanggal_pengajuan) = ?", (user_nip, current_month)).fetchone()
-    lupa_pulang_data = conn.execute("SELECT COUNT(*) as total FROM clarifications WHERE nip_pengaju = ? AND jenis_surat = 'Lupa Absen Pulang' AND strftime('%Y-%m', tanggal_pengajuan) = ?", (user_nip, current_month)).fetchone()
+    awal_bulan, akhir_bulan = rentang_bulan(datetime.now().strftime('%Y-%m'))
+    lupa_masuk_data = conn.execute("SELECT COUNT(*) as total FROM clarifications WHERE nip_pengaju = ? AND tanggal_pengajuan >= ? AND tanggal_pengajuan < ? AND jenis_surat = 'Lupa Absen Masuk'", (user_nip, awal_bulan, akhir_bulan)).fetchone()
+    lupa_pulang_data = conn.execute("SELECT COUNT(*) as total FROM clarifications WHERE nip_pengaju = ? AND tanggal_pengajuan >= ? AND tanggal_pengajuan < ? AND jenis_surat = 'Lupa Absen Pulang'", (user_nip, awal_bulan, akhir_bulan)).fetchone()
     
     lupa_masuk_count = lupa_masuk_data['total'] if lupa_masuk_data else 0
     lupa_pulang_count = lupa_pulang_data['total'] if lupa_pulang_data else 0
 
-    conn.close() 
-
-    jatah_cuti_tahunan = user_data['jatah_cuti_tahunan'] if user_data and user_data['jatah_cuti_tahunan'] is not None else 0
-    total_cuti_terpakai = total_cuti_terpakai_data['total'] if total_cuti_terpakai_data else 0
-    sisa_cuti_tahunan = jatah_cuti_tahunan - total_cuti_terpakai
-    
-    processed_records = []
-    # --- BLOK LENGKAP ANDA DIMASUKKAN KEMBALI ---
-    time_fmt = '%H:%M:%S.%f'
-    for record in records_raw:
-        rec = dict(record)
-        rec['tanggal_formatted'] = datetime.strptime(rec['tanggal'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-        jam_masuk, jam_pulang = rec.get('jam masuk'), rec.get('jam pulang')
-        status, keterangan = rec.get('status'), rec.get('keterangan')
-        
-        rec['jam_masuk_formatted'] = datetime.strptime(jam_masuk, time_fmt).strftime('%H:%M') if jam_masuk else " - "
-        rec['jam_pulang_formatted'] = datetime.strptime(jam_pulang, time_fmt).strftime('%H:%M') if jam_pulang else " - "
-        
-        if status and "Menunggu" in status:
-            rec.update({'status_text': 'Menunggu Persetujuan', 'status_color': 'yellow', 'checkbox_enabled': False})
-        elif status and "Disetujui" in status:
-            if keterangan:
-                rec.update({'status_text': f"Disetujui - {keterangan}", 'status_color': 'green', 'checkbox_enabled': False})
-            else:
-                rec.update({'status_text': status, 'status_color': 'green', 'checkbox_enabled': False})
-        elif status and "Ditolak" in status:
-            rec.update({'status_text': keterangan, 'status_color': 'red', 'checkbox_enabled': True})
-        elif jam_masuk and jam_pulang:
-            dur = datetime.strptime(jam_pulang, time_fmt) - datetime.strptime(jam_masuk, time_fmt)
-            if dur.total_seconds() >= 4 * 3600:
-                rec.update({'status_text': 'Kehadiran Terpenuhi', 'status_color': 'green', 'checkbox_enabled': False})
-            else:
-                rec.update({'status_text': 'Kurang Dari 4 Jam', 'status_color': 'red', 'checkbox_enabled': False})
-        else:
-            rec.update({'status_text': 'Perlu Klarifikasi', 'status_color': 'red', 'checkbox_enabled': True})
-        processed_records.append(rec)
     
     summary_message = ""
     summary_color = ""
@@ -246,7 +318,8 @@ def dashboard_dosen():
         summary_message = "Belum ada data riwayat absensi untuk ditampilkan."
         summary_color = "grey"
     else:
-        ada_klarifikasi = any(rec['status_color'] == 'red' for rec in processed_records)
+        # Dicek di SQL untuk seluruh riwayat, bukan hanya halaman yang dirender
+        ada_klarifikasi = rekap.ada_perlu_klarifikasi(conn, user_nip)
         if ada_klarifikasi:
             summary_message = "Anda Memiliki Tanggal yang Perlu di Klarifikasi"
             summary_color = "red"
@@ -258,6 +331,7 @@ def dashboard_dosen():
         'dashboard_dosen.html',
         records=processed_records,
         records_json=processed_records,
+        next_cursor=next_cursor,
         jatah_cuti=jatah_cuti_tahunan,
         cuti_terpakai=total_cuti_terpakai,
         sisa_cuti=sisa_cuti_tahunan,
@@ -267,12 +341,30 @@ def dashboard_dosen():
         summary_color=summary_color
     )
 
+# --- API Riwayat Absensi (JSON, per halaman) ---
+@app.route('/api/absensi')
+def api_absensi():
+    if 'user_role' not in session or session['user_role'] not in ROLES_STAF:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    bulan = request.args.get('bulan') or None
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = min(max(int(request.args.get('limit', HALAMAN_ABSENSI)), 1), MAKS_HALAMAN_ABSENSI)
+        if bulan:
+            datetime.strptime(bulan, '%Y-%m')
+        records, next_cursor = halaman_absensi(get_db(), session['user_id'], bulan, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Parameter bulan, cursor atau limit tidak valid"}), 400
+
+    return jsonify({"records": records, "next_cursor": next_cursor})
+
 @app.route('/submit_klarifikasi', methods=['POST'])
 def submit_klarifikasi():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     user_nip = session['user_id']
     
     # Mencari atasan dari pengguna yang mengajukan
@@ -280,250 +372,298 @@ def submit_klarifikasi():
     
     if not user_data or not user_data['id_atasan']:
         flash('Proses Gagal: Atasan Anda tidak terdaftar di sistem.', 'danger')
-        conn.close()
         return redirect(request.referrer)
 
     id_atasan = user_data['id_atasan']
 
     record_ids = request.form.getlist('record_ids')
-    
-    # Validasi duplikat
-    for record_id in record_ids:
-        attendance_record = conn.execute("SELECT status FROM attendance WHERE rowid = ?", (record_id,)).fetchone()
-        if not attendance_record or (attendance_record['status'] and "Menunggu Persetujuan" in attendance_record['status']):
-            conn.close()
-            flash("GAGAL: Salah satu tanggal yang Anda pilih sudah pernah diajukan dan sedang menunggu persetujuan.", "error")
-            return redirect(url_for('dashboard_dosen'))
+    if not record_ids or not all(record_id.isdigit() for record_id in record_ids):
+        flash("GAGAL: Pilih minimal satu tanggal yang akan diklarifikasi.", "error")
+        return redirect(url_for('dashboard_dosen'))
+
+    # Semua baris terpilih diambil sekali (hanya absensi milik pengguna sendiri)
+    attendance_records = conn.execute("""
+        SELECT rowid, tanggal, tanggal_hari, status FROM attendance
+        WHERE rowid IN (SELECT value FROM json_each(?)) AND nip = ?
+        ORDER BY tanggal
+    """, (json.dumps([int(record_id) for record_id in set(record_ids)]), user_nip)).fetchall()
+
+    # Validasi duplikat: satu lintasan atas hasil fetch di atas
+    if len(attendance_records) != len(set(record_ids)) or any(
+        record['status'] and "Menunggu Persetujuan" in record['status'] for record in attendance_records
+    ):
+        flash("GAGAL: Salah satu tanggal yang Anda pilih sudah pernah diajukan dan sedang menunggu persetujuan.", "error")
+        return redirect(url_for('dashboard_dosen'))
 
     # Jika semua validasi lolos, baru lanjutkan proses penyimpanan
     kategori_surat = request.form.get('kategori_surat')
     jenis_surat = request.form.get('jenis_surat')
 
-    # Logika untuk menangani file upload
-    file_path = None
-    if 'file_bukti' in request.files:
-        file = request.files['file_bukti']
-        if file and file.filename != '':
-            filename = secure_filename(f"bukti-{user_nip}-{datetime.now().strftime('%Y%m%d%H%M%S')}-{file.filename}")
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-
-    # Memproses setiap tanggal yang dipilih
-    for record_id in record_ids:
-        attendance_record = conn.execute("SELECT * FROM attendance WHERE rowid = ?", (record_id,)).fetchone()
-        if attendance_record:
-            conn.execute(
-                """
-                INSERT INTO clarifications (
-                    nip_pengaju, nama_lengkap, jurusan, tanggal_klarifikasi, 
-                    kategori_surat, jenis_surat, nip_approver_sekarang, status_final,
-                    file_bukti
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    user_nip, 
-                    session['user_name'], 
-                    session['user_jurusan'], 
-                    attendance_record['tanggal'], 
-                    kategori_surat,
-                    jenis_surat, 
-                    id_atasan,
-                    'Diajukan',
-                    file_path
-                )
+    file = request.files.get('file_bukti')
+
+    # Semua tanggal disimpan dalam satu transaksi: INSERT/UPDATE dengan executemany
+    try:
+        # File bukti di-hash sambil ditulis ke blob store; isi yang sama hanya disimpan sekali
+        sha256 = lampiran.simpan_upload(conn, file, app.config['BLOB_FOLDER']) if file and file.filename else None
+        file_path = lampiran.path_relatif(sha256) if sha256 else None
+
+        conn.executemany(
+            """
+            INSERT INTO clarifications (
+                nip_pengaju, nama_lengkap, jurusan, tanggal_klarifikasi,
+                kategori_surat, jenis_surat, nip_approver_sekarang, status_final,
+                file_bukti
             )
-            # Update status di tabel attendance
-            conn.execute("UPDATE attendance SET status = 'Menunggu Persetujuan' WHERE rowid = ?", (record_id,))
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (user_nip, session['user_name'], session['user_jurusan'], record['tanggal'],
+                 kategori_surat, jenis_surat, id_atasan, 'Diajukan', file_path)
+                for record in attendance_records
+            ]
+        )
+        if sha256:
+            # Baris executemany di atas ditulis di bawah write lock transaksi ini,
+            # jadi id-nya berurutan dan berakhir di last_insert_rowid()
+            id_terakhir = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            lampiran.lampirkan(conn, lampiran.TIPE_KLARIFIKASI,
+                               range(id_terakhir - len(attendance_records) + 1, id_terakhir + 1),
+                               sha256, secure_filename(file.filename))
+        # Update status di tabel attendance
+        conn.executemany(
+            "UPDATE attendance SET status = 'Menunggu Persetujuan' WHERE rowid = ?",
+            [(record['rowid'],) for record in attendance_records]
+        )
 
-    conn.commit()
+        perbarui_data_turunan(conn, user_nip, attendance_records[0]['tanggal_hari'], attendance_records[-1]['tanggal_hari'])
 
-    # ==========================================================
-    # ==          PANGGIL FUNGSI NOTIFIKASI DI SINI           ==
-    # ==========================================================
-    try:
+        # Notifikasi ke atasan masuk outbox di transaksi yang sama; dikirim oleh worker
         nama_pengaju = session.get('user_name', 'Seorang Dosen')
-        print(f"Mengirim notifikasi pengajuan baru ke atasan NIP: {id_atasan}")
-        send_push_notification(
+        enqueue_notification(
+            conn,
             target_nip=id_atasan,
             title="Pengajuan Klarifikasi Baru",
             body=f"Ada pengajuan baru dari {nama_pengaju}. Mohon segera ditinjau.",
             url="/dashboard_kajur" # Sesuaikan URL dashboard atasan jika berbeda
         )
-    except Exception as e:
-        print(f"GAGAL MENGIRIM NOTIFIKASI (submit_klarifikasi): {e}")
-    # ==========================================================
-    
-    conn.close()
 
+        conn.commit()
+    except sqlite3.Error as e:
+        # Batalkan semua tanggal jika salah satu gagal. File blob tidak dihapus di sini
+        # (isinya bisa dipakai lampiran lain); blob tanpa referensi dibersihkan lampiran.py --gc
+        conn.rollback()
+        app.logger.error(f"Gagal menyimpan klarifikasi {user_nip}: {e}")
+        flash("Proses Gagal: Klarifikasi tidak dapat disimpan, silakan coba lagi.", "danger")
+        return redirect(url_for('dashboard_dosen'))
+
+    if sha256:
+        # Thumbnail/pratinjau dibuat di latar belakang setelah data ter-commit
+        pembuat_pratinjau.jadwalkan(sha256, file.mimetype)
     flash('Klarifikasi berhasil diajukan.', 'success')
     return redirect(url_for('dashboard_dosen'))
 
-@app.route('/dashboard_sekjur')
-def dashboard_sekjur():
-    # Pengecekan role
-    if 'user_role' not in session or session['user_role'] != 'Sekjur':
+# --- Rute Dashboard Pimpinan ---
+# Satu dashboard untuk semua role approver; perbedaan antar role hanya teks
+# tampilan dan akar hierarki (Sekjur bekerja atas nama Kajur-nya).
+DASHBOARD_PIMPINAN = {
+    'Sekjur': {'judul': 'Dashboard Sekretaris Jurusan', 'judul_bawahan': 'Daftar Dosen Jurusan {jurusan}',
+               'teks_kosong': 'Tidak ada data dosen.', 'lewat_atasan': True},
+    'Kajur': {'judul': 'Dashboard Kajur', 'judul_bawahan': 'Daftar Dosen Jurusan {jurusan}',
+              'teks_kosong': 'Tidak ada data dosen.'},
+    'Wadir1': {'judul': 'Dashboard Wakil Direktur 1', 'judul_bawahan': 'Data Rekap Staf Cascading Kinerja Wadir 1',
+               'teks_kosong': 'Tidak ada data Staf Cascading Kinerja Wadir 1'},
+    'Wadir2': {'judul': 'Dashboard Wakil Direktur 2', 'judul_bawahan': 'Data Rekap Staf Cascading Kinerja Wadir 2',
+               'teks_kosong': 'Tidak ada data Staf Cascading Kinerja Wadir 2'},
+    'Wadir3': {'judul': 'Dashboard Wakil Direktur 3', 'judul_bawahan': 'Data Rekap Staf Cascading Kinerja Wadir 3',
+               'teks_kosong': 'Tidak ada data Staf Cascading Kinerja Wadir 3'},
+    'Direktur': {'judul': 'Dashboard Direktur', 'judul_bawahan': 'Daftar Pimpinan & Staf Anda',
+                 'teks_kosong': 'Tidak ada data pimpinan/staf.', 'label_unit': 'Unit Kerja',
+                 'label_pengaju': 'Nama Pengaju'},
+}
+TAMPILAN_DEFAULT = {'label_unit': 'Jurusan', 'label_pengaju': 'Nama Dosen', 'lewat_atasan': False}
+
+# Hanya kolom yang ditampilkan tabel pengajuan klarifikasi
+KOLOM_KLARIFIKASI_DASHBOARD = "id, nama_lengkap, tanggal_pengajuan, tanggal_klarifikasi, jenis_surat, file_bukti"
+
+# Klausa WHERE antrian approval milik pengguna (dashboard dan proses klarifikasi).
+# Sekjur ikut memproses tugas yang ditujukan untuk Kajur (atasannya) di jurusannya.
+def antrian_approval(role, nip, jurusan):
+    if DASHBOARD_PIMPINAN.get(role, {}).get('lewat_atasan'):
+        return ("nip_approver_sekarang IN (?, (SELECT id_atasan FROM users WHERE nip = ?)) AND jurusan = ?",
+                (nip, nip, jurusan))
+    return "nip_approver_sekarang = ?", (nip,)
+
+def data_dashboard_pimpinan(conn, role, nip, jurusan):
+    """
+    Daftar tugas approval dan daftar bawahan untuk dashboard pimpinan. Masing-masing
+    satu query berindeks: antrian lewat idx_clarifications_approver, bawahan lewat
+    users_hierarchy. Return (records, bawahan_list).
+    """
+    kondisi, params = antrian_approval(role, nip, jurusan)
+    records = conn.execute(
+        f"SELECT {KOLOM_KLARIFIKASI_DASHBOARD} FROM clarifications WHERE {kondisi} ORDER BY id", params
+    ).fetchall()
+    bawahan_list = daftar_bawahan_cache(conn, nip, lewat_atasan=DASHBOARD_PIMPINAN[role].get('lewat_atasan', False))
+    return records, bawahan_list
+
+def dashboard_pimpinan(role):
+    if 'user_role' not in session or session['user_role'] != role:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    sekjur_nip = session['user_id']
-    sekjur_jurusan = session['user_jurusan']
-    
-    # Cari tahu siapa atasan dari Sekjur ini (yaitu NIP Kajur)
-    atasan_data = conn.execute("SELECT id_atasan FROM users WHERE nip = ?", (sekjur_nip,)).fetchone()
-    
-    # Inisialisasi daftar tugas sebagai list kosong
-    pending_approvals = []
-    
-    # HANYA jalankan query jika atasan ditemukan untuk mencegah error
-    if atasan_data and atasan_data['id_atasan']:
-        kajur_nip = atasan_data['id_atasan']
-        
-        # Ambil tugas approval: yang ditujukan untuk Kajur DAN yang mungkin ditujukan untuk Sekjur
-        pending_approvals = conn.execute(
-            """
-            SELECT * FROM clarifications 
-            WHERE (nip_approver_sekarang = ? OR nip_approver_sekarang = ?) 
-            AND jurusan = ?
-            """,
-            (kajur_nip, sekjur_nip, sekjur_jurusan)
-        ).fetchall()
+    conn = get_db()
+    records, bawahan_list = data_dashboard_pimpinan(conn, role, session['user_id'], session['user_jurusan'])
 
-    # Ambil daftar dosen & sekjur di jurusan yang sama
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE jurusan = ? AND role IN ('Dosen', 'Sekjur') ORDER BY nama_lengkap",
-        (sekjur_jurusan,)
-    ).fetchall()
+    tampilan = {**TAMPILAN_DEFAULT, **DASHBOARD_PIMPINAN[role]}
+    tampilan['judul_bawahan'] = tampilan['judul_bawahan'].format(jurusan=session['user_jurusan'])
+    return render_template('dashboard_pimpinan.html', tampilan=tampilan, records=records, bawahan_list=bawahan_list)
 
-    conn.close()
-    
-    # Render template baru: dashboard_sekjur.html
-    return render_template('dashboard_sekjur.html', records=pending_approvals, dosen_list=bawahan_list)
+# Endpoint lama (dashboard_kajur, dashboard_wadir1, ...) tetap ada untuk url_for dan bookmark
+for _role in DASHBOARD_PIMPINAN:
+    app.add_url_rule(f'/dashboard_{_role.lower()}', endpoint=f'dashboard_{_role.lower()}',
+                     view_func=dashboard_pimpinan, defaults={'role': _role})
 
-# --- Rute Kajur ---
-@app.route('/dashboard_kajur')
-def dashboard_kajur():
-    if 'user_role' not in session or session['user_role'] != 'Kajur':
-        return redirect(url_for('login'))
+# Batas jumlah klarifikasi per permintaan batch
+MAKS_BATCH_KLARIFIKASI = 500
 
-    conn = get_db_connection()
-    user_nip = session['user_id'] # NIP dari Kajur yang sedang login
+# Tanggal klarifikasi yang ditulis di notifikasi gabungan sebelum diringkas "dan N lainnya"
+MAKS_TANGGAL_NOTIFIKASI = 5
 
-    # LOGIKA BARU: Ambil tugas berdasarkan NIP approver, bukan status
-    pending_approvals = conn.execute(
-        "SELECT * FROM clarifications WHERE nip_approver_sekarang = ?",
-        (user_nip,)
-    ).fetchall()
+def proses_klarifikasi_batch(conn, ids, action, role, alasan=None, antrian=None):
+    """
+    Menyetujui/menolak banyak klarifikasi dalam transaksi milik pemanggil (tanpa commit):
+    satu SELECT untuk semua id, UPDATE clarifications dan attendance dengan executemany,
+    rekap/ledger diperbarui sekali per dosen, dan satu notifikasi gabungan per dosen.
+    antrian = (kondisi, params) dari antrian_approval membatasi pada antrian pengguna.
+    Return jumlah klarifikasi yang diproses.
+    """
+    kondisi, params = antrian or ("1", ())
+    klarifikasi_list = conn.execute(f"""
+        SELECT id, nip_pengaju, tanggal_klarifikasi, kategori_surat, jenis_surat FROM clarifications
+        WHERE id IN (SELECT value FROM json_each(?)) AND {kondisi}
+        ORDER BY nip_pengaju, tanggal_klarifikasi
+    """, (json.dumps([int(i) for i in ids]), *params)).fetchall()
+    if not klarifikasi_list:
+        return 0
+
+    update_klarifikasi, update_absensi, tanggal_per_dosen = [], [], {}
+    for klarifikasi in klarifikasi_list:
+        tanggal_hari = klarifikasi['tanggal_klarifikasi'][:10]
+        tanggal_per_dosen.setdefault(klarifikasi['nip_pengaju'], []).append(tanggal_hari)
+        if action == 'setuju':
+            singkatan = "FL" if klarifikasi['kategori_surat'] == "Fleksibel" else "NF"
+            update_klarifikasi.append((f'Disetujui oleh {role}', None, klarifikasi['id']))
+            update_absensi.append((f'Disetujui - Surat {singkatan}', klarifikasi['jenis_surat'],
+                                   klarifikasi['nip_pengaju'], tanggal_hari))
+        else:
+            update_klarifikasi.append((f'Ditolak oleh {role}', alasan, klarifikasi['id']))
+            update_absensi.append(('Ditolak', f"{alasan} - Silahkan Klarifikasi Ulang",
+                                   klarifikasi['nip_pengaju'], tanggal_hari))
+
+    # catatan_revisi hanya diisi saat penolakan (COALESCE mempertahankan nilai lama saat disetujui)
+    conn.executemany(
+        "UPDATE clarifications SET status_final = ?, catatan_revisi = COALESCE(?, catatan_revisi), nip_approver_sekarang = NULL WHERE id = ?",
+        update_klarifikasi
+    )
+    conn.executemany(
+        "UPDATE attendance SET status = ?, keterangan = ? WHERE nip = ? AND tanggal_hari = ?",
+        update_absensi
+    )
 
-    # LOGIKA BARU: Ambil bawahan berdasarkan id_atasan, bukan jurusan
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE id_atasan = ? ORDER BY nama_lengkap",
-        (user_nip,)
-    ).fetchall()
+    notifikasi = []
+    for nip_pengaju, daftar_tanggal in tanggal_per_dosen.items():
+        # Rekap harian/bulanan dan ledger cuti ikut diperbarui di transaksi yang sama
+        perbarui_data_turunan(conn, nip_pengaju, min(daftar_tanggal), max(daftar_tanggal))
+
+        teks_tanggal = ", ".join(datetime.strptime(t, '%Y-%m-%d').strftime('%d %B %Y') for t in daftar_tanggal[:MAKS_TANGGAL_NOTIFIKASI])
+        if len(daftar_tanggal) > MAKS_TANGGAL_NOTIFIKASI:
+            teks_tanggal += f" dan {len(daftar_tanggal) - MAKS_TANGGAL_NOTIFIKASI} tanggal lainnya"
+        jumlah = "Pengajuan Anda" if len(daftar_tanggal) == 1 else f"{len(daftar_tanggal)} pengajuan Anda"
+        if action == 'setuju':
+            notifikasi.append((nip_pengaju, "Pengajuan Klarifikasi Disetujui",
+                               f"{jumlah} untuk tanggal {teks_tanggal} telah disetujui.", "/dashboard_dosen"))
+        else:
+            notifikasi.append((nip_pengaju, "Pengajuan Klarifikasi Ditolak",
+                               f"{jumlah} untuk tanggal {teks_tanggal} ditolak. Silakan cek dashboard Anda.", "/dashboard_dosen"))
 
-    conn.close()
-    
-    # Ganti 'dosen_list' menjadi 'bawahan_list' saat mengirim ke template
-    return render_template('dashboard_kajur.html', records=pending_approvals, dosen_list=bawahan_list)
+    # Notifikasi ke dosen masuk outbox di transaksi yang sama; dikirim oleh worker
+    enqueue_notification_batch(conn, notifikasi)
+    return len(klarifikasi_list)
 
 @app.route('/proses_klarifikasi', methods=['POST'])
 def proses_klarifikasi():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    clarification_id = request.form.get('clarification_id')
+    clarification_id = request.form.get('clarification_id', '')
     action = request.form.get('action')
-    approver_role = session.get('user_role', 'Atasan')
-
-    conn = get_db_connection()
-    
-    klarifikasi = conn.execute("SELECT * FROM clarifications WHERE id = ?", (clarification_id,)).fetchone()
-    
-    if not klarifikasi:
+    if action not in ('setuju', 'tolak') or not clarification_id.isdigit():
+        flash("Permintaan tidak valid.", "danger")
+        return redirect(request.referrer or url_dashboard(session.get('user_role')) or url_for('login'))
+
+    conn = get_db()
+    jumlah = proses_klarifikasi_batch(
+        conn, [clarification_id], action, session.get('user_role', 'Atasan'),
+        alasan=request.form.get('alasan_penolakan') or 'Tidak ada alasan spesifik'
+    )
+    if not jumlah:
         flash("Klarifikasi tidak ditemukan.", "danger")
-        conn.close()
-        return redirect(request.referrer)
+        return redirect(request.referrer or url_dashboard(session.get('user_role')) or url_for('login'))
 
-    nip_pengaju = klarifikasi['nip_pengaju']
-    tanggal_klarifikasi_obj = datetime.strptime(klarifikasi['tanggal_klarifikasi'], '%Y-%m-%d %H:%M:%S')
-    
-    # Tentukan title dan body notifikasi berdasarkan aksi
-    tanggal_str = tanggal_klarifikasi_obj.strftime('%d %B %Y')
-    notif_title = ""
-    notif_body = ""
-    
-    if action == 'setuju':
-        kategori = klarifikasi['kategori_surat']
-        singkatan = "FL" if kategori == "Fleksibel" else "NF"
-        
-        status_final_clarification = f'Disetujui oleh {approver_role}'
-        status_final_attendance = f'Disetujui - Surat {singkatan}'
-        keterangan_attendance = klarifikasi['jenis_surat']
-
-        conn.execute(
-            "UPDATE clarifications SET status_final = ?, nip_approver_sekarang = NULL WHERE id = ?",
-            (status_final_clarification, clarification_id)
-        )
-        conn.execute(
-            "UPDATE attendance SET status = ?, keterangan = ? WHERE nip = ? AND date(tanggal) = date(?)",
-            (status_final_attendance, keterangan_attendance, nip_pengaju, tanggal_klarifikasi_obj)
-        )
-        
-        # Siapkan pesan notifikasi untuk persetujuan
-        notif_title = "Pengajuan Klarifikasi Disetujui"
-        notif_body = f"Pengajuan Anda untuk tanggal {tanggal_str} telah disetujui."
-        
-    elif action == 'tolak':
-        alasan = request.form.get('alasan_penolakan', 'Tidak ada alasan spesifik')
-        
-        status_final_clarification = f'Ditolak oleh {approver_role}'
-        status_final_attendance = 'Ditolak'
-        keterangan_attendance = f"{alasan} - Silahkan Klarifikasi Ulang"
-        
-        conn.execute(
-            "UPDATE clarifications SET status_final = ?, catatan_revisi = ?, nip_approver_sekarang = NULL WHERE id = ?",
-            (status_final_clarification, alasan, clarification_id)
-        )
-        conn.execute(
-            "UPDATE attendance SET status = ?, keterangan = ? WHERE nip = ? AND date(tanggal) = date(?)",
-            (status_final_attendance, keterangan_attendance, nip_pengaju, tanggal_klarifikasi_obj)
-        )
-        
-        # Siapkan pesan notifikasi untuk penolakan
-        notif_title = "Pengajuan Klarifikasi Ditolak"
-        notif_body = f"Pengajuan Anda untuk tanggal {tanggal_str} ditolak. Silakan cek dashboard Anda."
-        
     conn.commit()
+    flash(f"Pengajuan telah berhasil di-{action}.", 'success')
+    return redirect(request.referrer or url_dashboard(session.get('user_role')) or url_for('login'))
+
+# Persetujuan/penolakan banyak klarifikasi sekaligus. Form: clarification_ids (berulang),
+# action, alasan_penolakan. Body JSON {"ids": [...], "action": ..., "alasan": ...} dijawab JSON.
+@app.route('/proses_klarifikasi_batch', methods=['POST'])
+def proses_klarifikasi_batch_view():
+    if 'user_role' not in session or session['user_role'] not in DASHBOARD_PIMPINAN:
+        if request.is_json:
+            return jsonify({"error": "Unauthorized"}), 403
+        return redirect(url_for('login'))
 
-    # ==========================================================
-    # ==          PANGGIL FUNGSI NOTIFIKASI DI SINI           ==
-    # ==========================================================
-    try:
-        print(f"Mengirim notifikasi status ke dosen NIP: {nip_pengaju}")
-        send_push_notification(
-            target_nip=nip_pengaju,
-            title=notif_title,
-            body=notif_body,
-            url="/dashboard_dosen" # Arahkan dosen ke dashboard pribadinya
-        )
-    except Exception as e:
-        print(f"GAGAL MENGIRIM NOTIFIKASI (proses_klarifikasi): {e}")
-    # ==========================================================
-
-    conn.close()
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        ids, action, alasan = data.get('ids') or [], data.get('action'), data.get('alasan')
+    else:
+        ids, action, alasan = request.form.getlist('clarification_ids'), request.form.get('action'), request.form.get('alasan_penolakan')
+
+    kembali = request.referrer or url_dashboard(session['user_role'])
+    if action not in ('setuju', 'tolak') or not ids or len(ids) > MAKS_BATCH_KLARIFIKASI \
+            or not all(str(i).isdigit() for i in ids):
+        pesan = f"Pilih 1-{MAKS_BATCH_KLARIFIKASI} klarifikasi dan aksi setuju/tolak."
+        if request.is_json:
+            return jsonify({"error": pesan}), 400
+        flash(pesan, "danger")
+        return redirect(kembali)
+
+    # Batch hanya memproses klarifikasi yang masih ada di antrian approval pengguna
+    conn = get_db()
+    jumlah = proses_klarifikasi_batch(
+        conn, ids, action, session['user_role'], alasan=alasan or 'Tidak ada alasan spesifik',
+        antrian=antrian_approval(session['user_role'], session['user_id'], session.get('user_jurusan'))
+    )
+    conn.commit()
 
-    flash(f"Pengajuan telah berhasil di-{action}.", 'success')
-    return redirect(request.referrer)
+    if request.is_json:
+        return jsonify({"diproses": jumlah, "dilewati": len(ids) - jumlah})
+    if jumlah:
+        flash(f"{jumlah} pengajuan telah berhasil di-{action}." + (f" {len(ids) - jumlah} dilewati (sudah diproses atau bukan antrian Anda)." if jumlah < len(ids) else ""), 'success')
+    else:
+        flash("Tidak ada klarifikasi yang diproses (sudah diproses atau bukan antrian Anda).", "danger")
+    return redirect(kembali)
 
 # --- Rute Admin ---
 @app.route('/dashboard_admin')
 def dashboard_admin():
     if 'user_role' not in session or session['user_role'] != 'Admin':
         return redirect(url_for('login'))
-    conn = get_db_connection()
+    conn = get_db()
     all_users = conn.execute("SELECT * FROM users ORDER BY role, nama_lengkap").fetchall()
-    all_history = conn.execute("SELECT * FROM clarifications ORDER BY tanggal_pengajuan DESC").fetchall()
-    conn.close()
+    # Seluruh riwayat klarifikasi di-cache sampai ada klarifikasi/absensi yang berubah
+    all_history = cache.ambil(conn, 'riwayat_admin', [], ('absensi',), lambda: [
+        dict(row) for row in conn.execute("SELECT * FROM clarifications ORDER BY tanggal_pengajuan DESC")
+    ])
     return render_template('dashboard_admin.html', users=all_users, histories=all_history)
 
 # Pastikan 'flash' sudah ada di baris import Anda di bagian atas file
@@ -536,7 +676,7 @@ def tambah_pengguna():
     if 'user_role' not in session or session['user_role'] != 'Admin':
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = get_db()
 
     # Logika saat form dikirim (method POST)
     if request.method == 'POST':
@@ -555,121 +695,28 @@ def tambah_pengguna():
             INSERT INTO users (nip, password, nama_lengkap, jurusan, "detail jurusan", role, id_atasan, jatah_cuti_tahunan)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (nip, password, nama_lengkap, jurusan, detail_jurusan, role, id_atasan, jatah_cuti))
+        # Indeks hierarki atasan-bawahan ikut diperbarui di transaksi yang sama
+        hierarki.rebuild_hierarki(conn)
+        cache.naikkan_versi(conn, 'pengguna')
         
         conn.commit()
-        conn.close()
         flash('Pengguna baru berhasil ditambahkan.', 'success')
         return redirect(url_for('dashboard_admin'))
 
     # Logika saat halaman pertama kali dibuka (method GET)
     # Mengambil daftar pengguna yang bisa menjadi atasan untuk mengisi dropdown
     potential_superiors = conn.execute("SELECT nip, nama_lengkap, role FROM users WHERE role IN ('Kajur', 'Wadir1', 'Wadir2', 'Wadir3', 'Direktur') ORDER BY nama_lengkap").fetchall()
-    conn.close()
     
     # Mengirim daftar atasan tersebut ke template HTML
     return render_template('tambah_pengguna.html', superiors=potential_superiors)
 
-# --- Rute Wadir 1 ---
-@app.route('/dashboard_wadir1')
-def dashboard_wadir1():
-    if 'user_role' not in session or session['user_role'] != 'Wadir1':
-        return redirect(url_for('login'))
-
-    conn = get_db_connection()
-    user_nip = session['user_id']
-
-    # Logikanya sama persis dengan Kajur
-    pending_approvals = conn.execute(
-        "SELECT * FROM clarifications WHERE nip_approver_sekarang = ?",
-        (user_nip,)
-    ).fetchall()
-
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE id_atasan = ? ORDER BY nama_lengkap",
-        (user_nip,)
-    ).fetchall()
-
-    conn.close()
-    
-    # Kirim ke template yang sesuai
-    return render_template('dashboard_wadir1.html', records=pending_approvals, bawahan_list=bawahan_list)
-
-# --- Rute Wadir 2 ---
-@app.route('/dashboard_wadir2')
-def dashboard_wadir2():
-    if 'user_role' not in session or session['user_role'] != 'Wadir2':
-        return redirect(url_for('login'))
-
-    conn = get_db_connection()
-    user_nip = session['user_id']
-
-    pending_approvals = conn.execute(
-        "SELECT * FROM clarifications WHERE nip_approver_sekarang = ?",
-        (user_nip,)
-    ).fetchall()
-
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE id_atasan = ? ORDER BY nama_lengkap",
-        (user_nip,)
-    ).fetchall()
-
-    conn.close()
-    
-    return render_template('dashboard_wadir2.html', records=pending_approvals, bawahan_list=bawahan_list)
-
-# --- Rute Wadir 3 ---
-@app.route('/dashboard_wadir3')
-def dashboard_wadir3():
-    if 'user_role' not in session or session['user_role'] != 'Wadir3':
-        return redirect(url_for('login'))
-
-    conn = get_db_connection()
-    user_nip = session['user_id']
-
-    pending_approvals = conn.execute(
-        "SELECT * FROM clarifications WHERE nip_approver_sekarang = ?",
-        (user_nip,)
-    ).fetchall()
-
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE id_atasan = ? ORDER BY nama_lengkap",
-        (user_nip,)
-    ).fetchall()
-
-    conn.close()
-    
-    return render_template('dashboard_wadir3.html', records=pending_approvals, bawahan_list=bawahan_list)
-
-# --- Rute Direktur ---
-@app.route('/dashboard_direktur')
-def dashboard_direktur():
-    if 'user_role' not in session or session['user_role'] != 'Direktur':
-        return redirect(url_for('login'))
-
-    conn = get_db_connection()
-    user_nip = session['user_id']
-
-    pending_approvals = conn.execute(
-        "SELECT * FROM clarifications WHERE nip_approver_sekarang = ?",
-        (user_nip,)
-    ).fetchall()
-
-    bawahan_list = conn.execute(
-        "SELECT * FROM users WHERE id_atasan = ? ORDER BY nama_lengkap",
-        (user_nip,)
-    ).fetchall()
-
-    conn.close()
-    
-    return render_template('dashboard_direktur.html', records=pending_approvals, bawahan_list=bawahan_list)
-
 # --- Rute Tambah Cuti ---
 @app.route('/input_cuti', methods=['GET', 'POST'])
 def input_cuti():
     if 'user_role' not in session or session['user_role'] != 'Admin':
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
 
     if request.method == 'POST':
         nip = request.form['nip']
@@ -682,82 +729,93 @@ def input_cuti():
 
         user_info = conn.execute("SELECT * FROM users WHERE nip = ?", (nip,)).fetchone()
         if not user_info:
-            conn.close()
             flash(f"GAGAL: NIP '{nip}' tidak ditemukan di database.", "error")
             return redirect(url_for('input_cuti'))
 
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        
-        dates_to_update = []
-        current_date_check = start_date
-        while current_date_check <= end_date:
-            if current_date_check.weekday() < 5:
-                date_str_check = current_date_check.strftime('%Y-%m-%d')
-                
-                record = conn.execute("SELECT rowid, status, \"jam masuk\", \"jam pulang\" FROM attendance WHERE nip = ? AND date(tanggal) = ?", (nip, date_str_check)).fetchone()
-                
-                if not record:
-                    full_date_str = date_str_check + " 00:00:00"
-                    cursor = conn.cursor()
-                    cursor.execute("INSERT INTO attendance (nip, tanggal) VALUES (?, ?)", (nip, full_date_str))
-                    conn.commit()
-                    record_id = cursor.lastrowid
-                    # Buat dictionary tiruan agar sisa kode berjalan
-                    record = {'rowid': record_id, 'status': None, 'jam masuk': None, 'jam pulang': None}
-
-                is_jam_masuk_filled = record['jam masuk'] is not None
-                is_jam_pulang_filled = record['jam pulang'] is not None
-                current_status = record['status'] if record['status'] else ""
-                INVALID_STATUSES = ['Disetujui', 'Kehadiran Terpenuhi', 'Menunggu Persetujuan']
-                is_status_final = any(invalid_status in current_status for invalid_status in INVALID_STATUSES)
-
-                if is_jam_masuk_filled or is_jam_pulang_filled or is_status_final:
-                    conn.close()
-                    flash(f"GAGAL: Input cuti untuk tanggal {date_str_check} tidak diizinkan karena sudah ada aktivitas.", "error")
-                    return redirect(url_for('input_cuti'))
-                
-                dates_to_update.append(record['rowid'])
-            current_date_check += timedelta(days=1)
-        
-        requested_workdays = len(dates_to_update)
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            flash("GAGAL: Format tanggal cuti tidak valid.", "error")
+            return redirect(url_for('input_cuti'))
+        if end_date < start_date:
+            flash("GAGAL: Tanggal selesai cuti tidak boleh sebelum tanggal mulai.", "error")
+            return redirect(url_for('input_cuti'))
+
+        # Hari kerja di rentang cuti (Senin-Jumat di luar tabel hari_libur)
+        workdays = cuti.hari_kerja(conn, start_date_str, end_date_str)
+        if not workdays:
+            flash("GAGAL: Tidak ada hari kerja pada rentang tanggal cuti tersebut.", "error")
+            return redirect(url_for('input_cuti'))
+
+        # Absensi yang sudah ada di rentang cuti diambil sekali (idx_attendance_nip_hari);
+        # jika satu tanggal punya beberapa baris, baris pertama yang dipakai
+        existing = {}
+        for record in conn.execute("""
+            SELECT rowid, tanggal_hari, status, "jam masuk", "jam pulang" FROM attendance
+            WHERE nip = ? AND tanggal_hari BETWEEN ? AND ?
+            ORDER BY rowid
+        """, (nip, workdays[0], workdays[-1])):
+            existing.setdefault(record['tanggal_hari'], record)
+
+        # Validasi konflik di memori, sebelum ada yang ditulis
+        INVALID_STATUSES = ['Disetujui', 'Kehadiran Terpenuhi', 'Menunggu Persetujuan']
+        for date_str_check in workdays:
+            record = existing.get(date_str_check)
+            if not record:
+                continue
+            current_status = record['status'] if record['status'] else ""
+            is_status_final = any(invalid_status in current_status for invalid_status in INVALID_STATUSES)
+            if record['jam masuk'] is not None or record['jam pulang'] is not None or is_status_final:
+                flash(f"GAGAL: Input cuti untuk tanggal {date_str_check} tidak diizinkan karena sudah ada aktivitas.", "error")
+                return redirect(url_for('input_cuti'))
+
+        requested_workdays = len(workdays)
         # --- PERBAIKAN: Validasi sisa cuti HANYA untuk 'Cuti Tahunan' ---
         if jenis_cuti == 'Cuti Tahunan':
-            jatah_cuti_tahunan = user_info['jatah_cuti_tahunan']
-            current_year = str(datetime.now().year)
-            total_cuti_terpakai_data = conn.execute(
-                "SELECT COUNT(*) as total FROM attendance WHERE nip = ? AND status LIKE 'Disetujui%' AND keterangan LIKE '%Cuti Tahunan%' AND strftime('%Y', tanggal) = ?",
-                (nip, current_year)
-            ).fetchone()
-            total_cuti_terpakai = total_cuti_terpakai_data['total']
-            sisa_cuti = jatah_cuti_tahunan - total_cuti_terpakai
+            _, _, sisa_cuti = cuti.saldo_cuti(conn, nip, jatah=user_info['jatah_cuti_tahunan'] or 0)
             if requested_workdays > sisa_cuti:
-                conn.close()
                 flash(f"GAGAL: Jatah cuti tidak cukup. Sisa {sisa_cuti}, diminta {requested_workdays}.", "error")
                 return redirect(url_for('input_cuti'))
 
-        file_path = None
-        if 'file_surat_cuti' in request.files:
-            file = request.files['file_surat_cuti']
-            if file.filename != '':
-                filename = secure_filename(f"cuti-{nip}-{start_date_str}-{file.filename}")
-                file_path = os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), filename)
-                file.save(file_path)
-        
-        conn.execute("""
-            INSERT INTO cuti_dosen (nip, nama_lengkap, tanggal_surat, tanggal_mulai, tanggal_selesai, 
-                                     jenis_cuti, alasan_cuti, file_surat_cuti, diinput_oleh)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (nip, nama_lengkap, tanggal_surat, start_date_str, end_date_str, jenis_cuti, 
-              alasan_cuti, file_path, session.get('user_name')))
-        
+        file = request.files.get('file_surat_cuti')
         keterangan_lengkap = f"{jenis_cuti} - {alasan_cuti}" if alasan_cuti else jenis_cuti
-        
-        for row_id in dates_to_update:
-            conn.execute("UPDATE attendance SET status = 'Disetujui (Input Admin)', keterangan = ? WHERE rowid = ?", (keterangan_lengkap, row_id))
-        
-        conn.commit()
-        conn.close()
+
+        # Surat cuti dan seluruh hari cuti ditulis dalam satu transaksi
+        try:
+            # Surat cuti disimpan di blob store (lihat lampiran.py)
+            sha256 = lampiran.simpan_upload(conn, file, app.config['BLOB_FOLDER']) if file and file.filename else None
+            file_path = lampiran.path_relatif(sha256) if sha256 else None
+
+            cuti_id = conn.execute("""
+                INSERT INTO cuti_dosen (nip, nama_lengkap, tanggal_surat, tanggal_mulai, tanggal_selesai, 
+                                         jenis_cuti, alasan_cuti, file_surat_cuti, diinput_oleh)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (nip, nama_lengkap, tanggal_surat, start_date_str, end_date_str, jenis_cuti, 
+                  alasan_cuti, file_path, session.get('user_name'))).lastrowid
+            if sha256:
+                lampiran.lampirkan(conn, lampiran.TIPE_CUTI, [cuti_id], sha256, secure_filename(file.filename))
+
+            # Hari tanpa baris absensi langsung dibuat dengan status cuti
+            conn.executemany(
+                "INSERT INTO attendance (nip, tanggal, status, keterangan) VALUES (?, ?, 'Disetujui (Input Admin)', ?)",
+                [(nip, f"{tanggal} 00:00:00", keterangan_lengkap) for tanggal in workdays if tanggal not in existing]
+            )
+            conn.executemany(
+                "UPDATE attendance SET status = 'Disetujui (Input Admin)', keterangan = ? WHERE rowid = ?",
+                [(keterangan_lengkap, existing[tanggal]['rowid']) for tanggal in workdays if tanggal in existing]
+            )
+
+            perbarui_data_turunan(conn, nip, start_date_str, end_date_str)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()  # Tidak ada hari cuti yang tersimpan sebagian
+            app.logger.error(f"Gagal menyimpan cuti {nip}: {e}")
+            flash("GAGAL: Cuti tidak dapat disimpan, silakan coba lagi.", "error")
+            return redirect(url_for('input_cuti'))
+
+        if sha256:
+            pembuat_pratinjau.jadwalkan(sha256, file.mimetype)
         flash(f"Cuti berhasil diinput untuk {nama_lengkap} selama {requested_workdays} hari kerja.", "success")
         return redirect(url_for('input_cuti'))
 
@@ -765,10 +823,44 @@ def input_cuti():
     staff_rows = conn.execute("SELECT nip, nama_lengkap FROM users WHERE role != 'Admin' ORDER BY nama_lengkap").fetchall()
     list_staff = [dict(row) for row in staff_rows]
     history_cuti = conn.execute("SELECT * FROM cuti_dosen ORDER BY tanggal_input DESC").fetchall()
-    conn.close()
     
     return render_template('input_cuti.html', list_staff=list_staff, histories=history_cuti)
 
+# --- Rute Impor Data Absensi (Excel) ---
+@app.route('/import_absensi', methods=['GET', 'POST'])
+def import_absensi():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return redirect(url_for('login'))
+
+    if request.method == 'POST':
+        file = request.files.get('file_excel')
+        if not file or not file.filename.lower().endswith('.xlsx'):
+            flash("GAGAL: Pilih file Excel (.xlsx) terlebih dahulu.", "error")
+            return redirect(url_for('import_absensi'))
+
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as tmp:
+            file.save(tmp.name)
+            try:
+                # Serial di dalam request: tidak membuat ProcessPool/Manager di proses web
+                hasil = migrasi_data.impor_excel(get_db(), tmp.name, workers=1)
+            except Exception as e:
+                traceback.print_exc()
+                flash(f"GAGAL: File tidak dapat diimpor ({e}).", "error")
+                return redirect(url_for('import_absensi'))
+
+        flash(
+            f"Impor selesai. User baru: {hasil['users_added']} (dilewati {hasil['users_skipped']}), "
+            f"absensi baru: {hasil['attendance_added']} (duplikat dilewati {hasil['attendance_skipped']}).",
+            "success"
+        )
+        return redirect(url_for('import_absensi'))
+
+    return render_template(
+        'import_absensi.html',
+        users_sheet=migrasi_data.USERS_SHEET,
+        attendance_sheets=migrasi_data.ATTENDANCE_SHEETS
+    )
+
 # --- Rute Absensi ---
 @app.route('/get_absensi_summary/<nip>')
 def get_absensi_summary(nip):
@@ -780,26 +872,35 @@ def get_absensi_summary(nip):
     if 'user_role' not in session or session['user_role'] not in ROLES_APPROVAL:
         return jsonify({"error": "Unauthorized"}), 403
 
-    conn = get_db_connection()
-    
+    conn = get_db()
+    # Ringkasan di-cache per pegawai; kedaluwarsa saat absensi/cuti nip atau data users berubah.
+    # Kunci cache yang sama menjadi ETag, sehingga modal yang dibuka ulang cukup dijawab 304.
+    kunci_ringkasan = cache.kunci(conn, 'ringkasan_absensi', [nip, datetime.now().year], (f"nip:{nip}", 'pengguna'))
+    etag = cache.etag(kunci_ringkasan)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    ringkasan = cache.ambil_kunci('ringkasan_absensi', kunci_ringkasan, lambda: ringkasan_absensi(conn, nip))
+    if not ringkasan:
+        return jsonify({'error': 'User not found'}), 404
+    response = jsonify(ringkasan)
+    response.set_etag(etag)
+    return response
+
+# Data modal "Cek Absensi": saldo cuti tahun ini dan absensi bulan terakhir pegawai.
+# None jika NIP tidak ditemukan.
+def ringkasan_absensi(conn, nip):
     target_user = conn.execute('SELECT * FROM users WHERE nip = ?', (nip,)).fetchone()
     if not target_user:
-        conn.close()
-        return jsonify({'error': 'User not found'}), 404
+        return None
     
     # --- PERBAIKAN SATU-SATUNYA ADA DI SINI ---
     # Perhitungan Cuti Tahunan yang Akurat
-    jatah_cuti_tahunan = target_user['jatah_cuti_tahunan'] if target_user and target_user['jatah_cuti_tahunan'] is not None else 0
-    current_year = str(datetime.now().year)
-    total_cuti_terpakai_data = conn.execute(
-        """
-        SELECT COUNT(*) as total FROM attendance 
-        WHERE nip = ? AND status LIKE 'Disetujui%' AND keterangan LIKE '%Cuti Tahunan%' AND strftime('%Y', tanggal) = ?
-        """,
-        (nip, current_year)
-    ).fetchone()
-    total_cuti_terpakai = total_cuti_terpakai_data['total'] if total_cuti_terpakai_data else 0
-    sisa_cuti_tahunan = jatah_cuti_tahunan - total_cuti_terpakai
+    jatah_cuti_tahunan, total_cuti_terpakai, sisa_cuti_tahunan = cuti.saldo_cuti(
+        conn, nip, jatah=target_user['jatah_cuti_tahunan'] if target_user['jatah_cuti_tahunan'] is not None else 0
+    )
     # --- AKHIR PERBAIKAN ---
 
     # Mengambil data absensi bulan terakhir (Logika Anda yang sudah benar)
@@ -810,52 +911,22 @@ def get_absensi_summary(nip):
 
     processed_records = []
     if last_month_record:
-        target_month = last_month_record['last_month']
+        awal_bulan, akhir_bulan = rentang_bulan(last_month_record['last_month'])
         records_raw = conn.execute(
-            "SELECT * FROM attendance WHERE nip = ? AND strftime('%Y-%m', tanggal) = ? ORDER BY tanggal DESC", 
-            (nip, target_month)
+            "SELECT * FROM attendance WHERE nip = ? AND tanggal >= ? AND tanggal < ? ORDER BY tanggal DESC", 
+            (nip, awal_bulan, akhir_bulan)
         ).fetchall()
 
-        time_fmt = '%H:%M:%S.%f'
-        for record in records_raw:
-            rec = dict(record)
-            rec['tanggal_formatted'] = datetime.strptime(rec['tanggal'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-            jam_masuk, jam_pulang = rec.get('jam masuk'), rec.get('jam pulang')
-            status, keterangan = rec.get('status'), rec.get('keterangan') # Menggunakan .get() di sini aman
-            rec['jam_masuk_formatted'] = datetime.strptime(jam_masuk, time_fmt).strftime('%H:%M') if jam_masuk else "-"
-            rec['jam_pulang_formatted'] = datetime.strptime(jam_pulang, time_fmt).strftime('%H:%M') if jam_pulang else "-"
-
-            # --- BLOK LOGIKA PEWARNAAN ANDA YANG SUDAH TERBUKTI BENAR ---
-            if status and "Menunggu" in status:
-                rec.update({'status_text': 'Menunggu Persetujuan', 'status_color': 'status-yellow'})
-            elif status and "Disetujui" in status:
-                if keterangan:
-                    rec.update({'status_text': f"Disetujui - {keterangan}", 'status_color': 'status-green'})
-                else:
-                    rec.update({'status_text': status, 'status_color': 'status-green'})
-            elif status and "Ditolak" in status:
-                rec.update({'status_text': keterangan, 'status_color': 'status-red'})
-            elif jam_masuk and jam_pulang:
-                dur = datetime.strptime(jam_pulang, time_fmt) - datetime.strptime(jam_masuk, time_fmt)
-                if dur.total_seconds() >= 4 * 3600:
-                    rec.update({'status_text': 'Kehadiran Terpenuhi', 'status_color': 'status-green'})
-                else:
-                    rec.update({'status_text': 'Kurang Dari 4 Jam', 'status_color': 'status-red'})
-            else:
-                rec.update({'status_text': 'Perlu Klarifikasi', 'status_color': 'status-red'})
-            
-            processed_records.append(rec)
-    
-    conn.close()
+        processed_records = status_absensi_batch(records_raw, prefix_warna='status-', jam_kosong="-")
 
     # Mengembalikan data dengan format yang benar
-    return jsonify({
+    return {
         "nama_lengkap": target_user['nama_lengkap'],
         "records": processed_records,
         "jatah_cuti": jatah_cuti_tahunan,
         "cuti_terpakai": total_cuti_terpakai,
         "sisa_cuti": sisa_cuti_tahunan
-    })
+    }
 
 # --- Rute Rekap Laporan ---
 @app.route('/rekap_laporan_view')
@@ -864,104 +935,24 @@ def rekap_laporan_view():
         return redirect(url_for('login'))
 
     try:
-        conn = get_db_connection()
-
-        # --- Bagian Pengambilan Data (Sudah Benar) ---
-        target_month = '2025-07'
-        year, month = map(int, target_month.split('-'))
-
-        all_staff = conn.execute("SELECT nip, nama_lengkap, jurusan, \"detail jurusan\" FROM users WHERE role != 'Admin' ORDER BY jurusan, nama_lengkap").fetchall()
-        attendance_data = conn.execute("SELECT * FROM attendance WHERE strftime('%Y-%m', tanggal) = ?", (target_month,)).fetchall()
-        approved_clarifications = conn.execute(
-            "SELECT nip_pengaju, tanggal_klarifikasi, kategori_surat FROM clarifications WHERE strftime('%Y-%m', tanggal_klarifikasi) = ? AND status_final LIKE 'Disetujui%'", 
-            (target_month,)
-        ).fetchall()
-        
-        conn.close()
-
-        # --- Bagian Pemrosesan Data ---
-        num_days = calendar.monthrange(year, month)[1]
-        days_in_month = list(range(1, num_days + 1))
-        selected_bulan_formatted = datetime(year, month, 1).strftime("%B %Y")
-
-        report_data = {}
-        for staff in all_staff:
-            jurusan = staff['jurusan']
-            detail_jurusan = staff['detail jurusan']
-            if jurusan not in report_data:
-                report_data[jurusan] = { 'nama_jurusan': detail_jurusan, 'staff_data': {} }
-            report_data[jurusan]['staff_data'][staff['nip']] = {
-                'nama': staff['nama_lengkap'],
-                'absensi': {},
-                'summary_counts': {'KT': 0, 'PK': 0, 'NF': 0, 'FL': 0, 'CT': 0, 'IZ': 0}
-            }
-
-        clarif_dict = {(item['nip_pengaju'], item['tanggal_klarifikasi'].split(' ')[0]): item['kategori_surat'] for item in approved_clarifications}
-
-        # --- PERBAIKAN UTAMA ADA DI DALAM LOOP INI ---
-        for record in attendance_data:
-            nip = record['nip']
-            
-            current_unit_data = None
-            for unit_data in report_data.values():
-                if nip in unit_data['staff_data']:
-                    current_unit_data = unit_data['staff_data'][nip]
-                    break
-            
-            if not current_unit_data:
-                continue
-
-            try:
-                # --- PERBAIKAN: Menggunakan akses dictionary `record['...']` ---
-                tanggal_obj = datetime.strptime(record['tanggal'], '%Y-%m-%d %H:%M:%S')
-                day = tanggal_obj.day
-                tanggal_str = tanggal_obj.strftime('%Y-%m-%d')
-                
-                status = record['status'] if 'status' in record.keys() else ''
-                jam_masuk = record['jam masuk'] if 'jam masuk' in record.keys() else None
-                jam_pulang = record['jam pulang'] if 'jam pulang' in record.keys() else None
-                keterangan = record['keterangan'] if 'keterangan' in record.keys() else ''
-
-                kode = 'PK'
-
-                if status and "Disetujui" in status:
-                    if 'Cuti' in keterangan: kode = 'CT'
-                    elif (nip, tanggal_str) in clarif_dict:
-                        kategori = clarif_dict.get((nip, tanggal_str))
-                        if kategori and 'Non Fleksibel' in kategori: kode = 'NF'
-                        elif kategori and 'Fleksibel' in kategori: kode = 'FL'
-                        else: kode = 'IZ'
-                    else: kode = 'IZ'
-                elif jam_masuk and jam_pulang:
-                    dur = datetime.strptime(jam_pulang, '%H:%M:%S.%f') - datetime.strptime(jam_masuk, '%H:%M:%S.%f')
-                    if dur.total_seconds() >= 4 * 3600:
-                        kode = 'KT'
-                
-                current_unit_data['absensi'][day] = kode
-                current_unit_data['summary_counts'][kode] += 1
-
-            except Exception as e:
-                # Logging yang lebih baik untuk debugging
-                print(f"Melewatkan data error untuk NIP {nip} pada tanggal {record['tanggal']}: {e}")
-                continue
-
-        # --- Finalisasi Data (Tidak Ada Perubahan di Sini) ---
-        report_data_per_jurusan = []
-        for jurusan_key, data in report_data.items():
-            staff_list = []
-            for nip, staff_data in data['staff_data'].items():
-                summary_counts = staff_data['summary_counts']
-                summary_str = ", ".join([f"{k}:{v}" for k, v in summary_counts.items() if v > 0])
-                staff_data['summary'] = summary_str
-                staff_list.append(staff_data)
-            
-            report_data_per_jurusan.append({
-                'nama_jurusan': data['nama_jurusan'],
-                'staff_data': staff_list
-            })
-
-        session['report_for_download'] = report_data_per_jurusan
-        return render_template('rekap_laporan.html', report_data=report_data_per_jurusan, days_in_month=days_in_month, selected_bulan_formatted=selected_bulan_formatted)
+        conn = get_db()
+        try:
+            awal, akhir = rentang_laporan(conn, request.args)
+        except ValueError as e:
+            flash(f"Parameter laporan tidak valid: {e}", "error")
+            awal, akhir = rentang_laporan(conn, {})
+
+        # Data laporan dibaca dari tabel rekap yang sudah dihitung sebelumnya (rekap.py)
+        report_data = laporan_cache(conn, awal, akhir)
+
+        return render_template(
+            'rekap_laporan.html',
+            report_data=report_data,
+            kolom_tanggal=rekap.kolom_laporan(awal, akhir),
+            selected_bulan_formatted=judul_rentang(awal, akhir),
+            awal=awal, akhir=akhir, bulan=awal[:7],
+            query_args=request.args.to_dict()
+        )
 
     except Exception as e:
         print(f"Terjadi Internal Server Error di rekap_laporan_view: {e}")
@@ -975,106 +966,56 @@ def download_laporan():
         return redirect(url_for('login'))
 
     try:
-        # --- LANGKAH 1: KITA PROSES ULANG SEMUA DATA DI SINI ---
-        conn = get_db_connection()
-        target_month = '2025-07' # Nanti bisa dibuat dinamis
-        year, month = map(int, target_month.split('-'))
-
-        all_staff = conn.execute("SELECT nip, nama_lengkap, jurusan, \"detail jurusan\" FROM users WHERE role != 'Admin' ORDER BY jurusan, nama_lengkap").fetchall()
-        attendance_data = conn.execute("SELECT * FROM attendance WHERE strftime('%Y-%m', tanggal) = ?", (target_month,)).fetchall()
-        approved_clarifications = conn.execute(
-            "SELECT nip_pengaju, tanggal_klarifikasi, kategori_surat FROM clarifications WHERE strftime('%Y-%m', tanggal_klarifikasi) = ? AND status_final LIKE 'Disetujui%'", 
-            (target_month,)
-        ).fetchall()
-        conn.close()
-
-        # (Logika pemrosesan data disalin persis dari rekap_laporan_view)
-        report_data = {}
-        for staff in all_staff:
-            jurusan = staff['jurusan']
-            detail_jurusan = staff['detail jurusan']
-            if jurusan not in report_data:
-                report_data[jurusan] = { 'nama_jurusan': detail_jurusan, 'staff_data': {} }
-            report_data[jurusan]['staff_data'][staff['nip']] = {
-                'nama': staff['nama_lengkap'], 'absensi': {},
-                'summary_counts': {'KT': 0, 'PK': 0, 'NF': 0, 'FL': 0, 'CT': 0, 'IZ': 0}
-            }
-        
-        clarif_dict = {(item['nip_pengaju'], item['tanggal_klarifikasi'].split(' ')[0]): item['kategori_surat'] for item in approved_clarifications}
-
-        for record in attendance_data:
-            nip = record['nip']
-            current_unit_data = next((unit['staff_data'][nip] for unit in report_data.values() if nip in unit['staff_data']), None)
-            if not current_unit_data: continue
-
-            try:
-                tanggal_obj = datetime.strptime(record['tanggal'], '%Y-%m-%d %H:%M:%S')
-                day = tanggal_obj.day
-                tanggal_str = tanggal_obj.strftime('%Y-%m-%d')
-                status = record['status'] if 'status' in record.keys() else ''
-                jam_masuk = record['jam masuk'] if 'jam masuk' in record.keys() else None
-                jam_pulang = record['jam pulang'] if 'jam pulang' in record.keys() else None
-                keterangan = record['keterangan'] if 'keterangan' in record.keys() else ''
-                kode = 'PK'
-                if status and "Disetujui" in status:
-                    if 'Cuti' in keterangan: kode = 'CT'
-                    elif (nip, tanggal_str) in clarif_dict:
-                        kategori = clarif_dict.get((nip, tanggal_str))
-                        if kategori and 'Non Fleksibel' in kategori: kode = 'NF'
-                        elif kategori and 'Fleksibel' in kategori: kode = 'FL'
-                        else: kode = 'IZ'
-                    else: kode = 'IZ'
-                elif jam_masuk and jam_pulang:
-                    dur = datetime.strptime(jam_pulang, '%H:%M:%S.%f') - datetime.strptime(jam_masuk, '%H:%M:%S.%f')
-                    if dur.total_seconds() >= 4 * 3600: kode = 'KT'
-                current_unit_data['absensi'][day] = kode
-                current_unit_data['summary_counts'][kode] += 1
-            except Exception:
-                continue
-
-        report_data_per_jurusan = []
-        for jurusan_key, data in report_data.items():
-            staff_list = []
-            for nip, staff_data in data['staff_data'].items():
-                summary_counts = staff_data['summary_counts']
-                summary_str = ", ".join([f"{k}:{v}" for k, v in summary_counts.items() if v > 0])
-                staff_data['summary'] = summary_str
-                staff_list.append(staff_data)
-            report_data_per_jurusan.append({ 'nama_jurusan': data['nama_jurusan'], 'staff_data': staff_list })
-        
-        # --- LANGKAH 2: BUAT FILE EXCEL (Logika ini sudah benar) ---
-        output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-
-        for unit_data in report_data_per_jurusan:
-            nama_jurusan = unit_data['nama_jurusan']
-            staff_list = unit_data['staff_data']
-            if not staff_list: continue
-
-            data_for_df = []
-            for staff in staff_list:
-                row = {'Nama Staf': staff['nama']}
-                row.update(staff['absensi'])
-                row['Jumlah'] = staff['summary']
-                data_for_df.append(row)
-            
-            df = pd.DataFrame(data_for_df)
-            day_columns = [col for col in df.columns if isinstance(col, int)]
-            sorted_days = sorted(day_columns)
-            column_order = ['Nama Staf'] + sorted_days + ['Jumlah']
-            df = df[column_order]
-
-            sheet_name = ''.join(filter(str.isalnum, nama_jurusan))[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-        writer.close()
+        # --- LANGKAH 1: TENTUKAN RENTANG LAPORAN ---
+        conn = get_db()
+        try:
+            awal, akhir = rentang_laporan(conn, request.args)
+        except ValueError as e:
+            flash(f"Parameter laporan tidak valid: {e}", "error")
+            return redirect(url_for('rekap_laporan_view'))
+
+        # Satu bulan penuh: kirim workbook dari arsip (dibangun di latar belakang oleh
+        # arsip_laporan.py). Jika belum ada atau sudah usang, pembuat arsip diminta
+        # membangunnya dan unduhan kali ini ditulis streaming seperti rentang bebas.
+        bulan = arsip_laporan.bulan_dari_rentang(awal, akhir)
+        if bulan:
+            siap = arsip_laporan.berkas_siap(conn, bulan)
+            if siap:
+                path, versi = siap
+                try:
+                    return send_file(
+                        path,
+                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        as_attachment=True,
+                        download_name=f"Laporan_Absensi_{awal}_{akhir}.xlsx",
+                        conditional=True,
+                        etag=f"laporan-{bulan}-{versi}"
+                    )
+                except FileNotFoundError:
+                    # File versi ini baru saja diganti versi yang lebih baru oleh pembuat
+                    # arsip (file yang sudah dibuka send_file tetap aman); tulis streaming
+                    pass
+            else:
+                arsip_laporan.minta(conn, bulan)
+                conn.commit()
+
+        # --- LANGKAH 2: TULIS EXCEL SECARA STREAMING ---
+        # Workbook ditulis baris per baris (openpyxl write-only, lihat rekap.tulis_excel)
+        # ke file sementara yang baru pindah ke disk bila melewati LAPORAN_SPOOL_BYTES,
+        # lalu dikirim bertahap oleh send_file; file ditutup setelah respons selesai.
+        output = tempfile.SpooledTemporaryFile(max_size=LAPORAN_SPOOL_BYTES)
+        try:
+            rekap.tulis_excel(conn, awal, akhir, output)
+        except BaseException:
+            output.close()
+            raise
         output.seek(0)
-        
+
         return send_file(
             output,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
-            download_name='Laporan_Absensi_Bulanan.xlsx'
+            download_name=f"Laporan_Absensi_{awal}_{akhir}.xlsx"
         )
 
     except Exception as e:
@@ -1094,13 +1035,12 @@ def riwayat_cuti():
     nip = session['user_id']
     nama_pengguna = session['user_name'] # Menggunakan nama variabel yang lebih umum
     
-    conn = get_db_connection()
+    conn = get_db()
     # Query ini sudah benar dan universal, tidak perlu diubah.
     cuti_records = conn.execute(
         "SELECT * FROM cuti_dosen WHERE nip = ? ORDER BY tanggal_mulai DESC", 
         (nip,)
     ).fetchall()
-    conn.close()
 
     # Mengirim nama pengguna ke template
     return render_template('riwayat_cuti.html', riwayat=cuti_records, nama_pengguna=nama_pengguna)
@@ -1116,12 +1056,11 @@ def riwayat_cuti_bawahan(nip):
     if 'user_role' not in session or session['user_role'] not in ROLES_APPROVAL:
         return "Akses Ditolak", 403
 
-    conn = get_db_connection()
+    conn = get_db()
     
     # Ambil nama bawahan untuk ditampilkan di judul halaman
     bawahan = conn.execute("SELECT nama_lengkap FROM users WHERE nip = ?", (nip,)).fetchone()
     if not bawahan:
-        conn.close()
         return "Pengguna tidak ditemukan", 404
     
     nama_bawahan = bawahan['nama_lengkap']
@@ -1132,7 +1071,6 @@ def riwayat_cuti_bawahan(nip):
         (nip,)
     ).fetchall()
     
-    conn.close()
 
     # Render sebuah template HTML BARU yang didedikasikan untuk ini
     return render_template('riwayat_cuti_bawahan.html', riwayat=cuti_records, nama_bawahan=nama_bawahan)
@@ -1143,7 +1081,7 @@ def history():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     user_nip = session['user_id']
     user_role = session['user_role']
     
@@ -1154,29 +1092,9 @@ def history():
 
     if user_role in ROLES_APPROVAL:
         
-        # --- LOGIKA SPESIAL UNTUK SEKJUR ---
-        if user_role == 'Sekjur':
-            # 1. Cari tahu siapa atasan dari Sekjur ini (yaitu NIP Kajur)
-            atasan_data = conn.execute("SELECT id_atasan FROM users WHERE nip = ?", (user_nip,)).fetchone()
-            
-            bawahan = [] # Inisialisasi sebagai list kosong
-            if atasan_data and atasan_data['id_atasan']:
-                kajur_nip = atasan_data['id_atasan']
-                # 2. Ambil daftar bawahan dari KAJUR, bukan dari Sekjur
-                bawahan = conn.execute("SELECT nip FROM users WHERE id_atasan = ?", (kajur_nip,)).fetchall()
-        
-        # --- LOGIKA NORMAL UNTUK PIMPINAN LAINNYA ---
-        else:
-            # Ambil daftar bawahan langsung dari pimpinan yang login
-            bawahan = conn.execute("SELECT nip FROM users WHERE id_atasan = ?", (user_nip,)).fetchall()
-        
-        # --- LOGIKA BERSAMA UNTUK MENGAMBIL RIWAYAT ---
-        list_nip_bawahan = [b['nip'] for b in bawahan]
-        
-        if list_nip_bawahan:
-            placeholders = ', '.join('?' for _ in list_nip_bawahan)
-            query = f"SELECT * FROM clarifications WHERE nip_pengaju IN ({placeholders}) ORDER BY tanggal_pengajuan DESC"
-            history_records = conn.execute(query, list_nip_bawahan).fetchall()
+        # Riwayat seluruh bawahan (langsung dan tidak langsung) lewat indeks hierarki.
+        # Sekjur melihat bawahan Kajur-nya, bukan bawahannya sendiri.
+        history_records = hierarki.riwayat_klarifikasi_bawahan(conn, user_nip, lewat_atasan=(user_role == 'Sekjur'))
 
     else:
         # JIKA STAF BIASA: Ambil riwayat diri sendiri
@@ -1185,9 +1103,39 @@ def history():
             (user_nip,)
         ).fetchall()
 
-    conn.close()
-    return render_template('history.html', records=history_records)
-
+    return render_template('history.html', records=history_records, tampilkan_nama=user_role in ROLES_APPROVAL,
+                           dashboard_url=url_dashboard(user_role))
+
+
+# Lokasi file lampiran sebuah record: dari blob store jika sudah tercatat di
+# attachments, atau file upload lama di UPLOAD_FOLDER. Dengan varian ('preview'/'thumb'),
+# turunan JPEG dari pratinjau.py dipakai bila sudah ada; bila belum, pembuatannya
+# dijadwalkan dan file asli yang dikirim. Return dict (path, mimetype, etag, nama)
+# atau None jika file tidak ada.
+def lokasi_lampiran(conn, tipe, pemilik_id, path_db, varian=None):
+    info = lampiran.lampiran(conn, tipe, pemilik_id)
+    if info and varian:
+        path = pratinjau.path_turunan(info['sha256'], varian, app.config['TURUNAN_FOLDER'])
+        if os.path.isfile(path):
+            nama = os.path.splitext(info['nama_asli'] or info['sha256'])[0] + ".jpg"
+            return {'path': path, 'mimetype': 'image/jpeg', 'etag': f"{info['sha256']}-{varian}", 'nama': nama}
+        pembuat_pratinjau.jadwalkan(info['sha256'], info['mimetype'])
+    if info:
+        path = lampiran.path_blob(info['sha256'], app.config['BLOB_FOLDER'])
+        if os.path.isfile(path):
+            # Isi blob tidak pernah berubah, jadi SHA-256-nya langsung menjadi ETag
+            return {'path': path, 'mimetype': info['mimetype'], 'etag': info['sha256'], 'nama': info['nama_asli']}
+    path = lampiran.path_lama(path_db, app.config['UPLOAD_FOLDER'])
+    if path:
+        return {'path': path, 'mimetype': None, 'etag': True, 'nama': os.path.basename(path)}
+    return None
+
+# Mengirim lampiran dengan dukungan Range dan respons bersyarat (304)
+def kirim_lampiran(lokasi, as_attachment=False, download_name=None):
+    return send_file(
+        lokasi['path'], mimetype=lokasi['mimetype'], as_attachment=as_attachment,
+        download_name=download_name or lokasi['nama'], conditional=True, etag=lokasi['etag']
+    )
 
 @app.route('/preview_bukti/<int:clarification_id>')
 def preview_bukti(clarification_id):
@@ -1195,61 +1143,68 @@ def preview_bukti(clarification_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     klarifikasi = conn.execute(
         "SELECT file_bukti FROM clarifications WHERE id = ?", 
         (clarification_id,)
     ).fetchone()
-    conn.close()
 
-    if not klarifikasi or not klarifikasi['file_bukti']:
+    # Pratinjau terkompresi secara default (?ukuran=thumb untuk thumbnail); file asli lewat download_bukti
+    varian = 'thumb' if request.args.get('ukuran') == 'thumb' else 'preview'
+    lokasi = lokasi_lampiran(conn, lampiran.TIPE_KLARIFIKASI, clarification_id, klarifikasi['file_bukti'], varian) \
+        if klarifikasi and klarifikasi['file_bukti'] else None
+    if not lokasi:
         flash('File bukti tidak ditemukan.', 'error')
         # Kembali ke halaman sebelumnya jika tidak ada file, aman untuk semua peran
         return redirect(request.referrer or url_for('dashboard_admin'))
 
-    # Menggunakan os.path untuk mendapatkan direktori dan nama file
-    # Pastikan app.config['UPLOAD_FOLDER'] sudah di-set di awal script Anda
-    directory = app.config['UPLOAD_FOLDER']
-    filename = os.path.basename(klarifikasi['file_bukti'])
-
     # Mengirim file untuk ditampilkan (bukan diunduh)
-    return send_from_directory(directory, filename)
+    return kirim_lampiran(lokasi)
 
 @app.route('/download_bukti/<int:clarification_id>')
 def download_bukti(clarification_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     klarifikasi = conn.execute(
         "SELECT * FROM clarifications WHERE id = ?", 
         (clarification_id,)
     ).fetchone()
-    conn.close()
 
-    if not klarifikasi or not klarifikasi['file_bukti']:
+    lokasi = lokasi_lampiran(conn, lampiran.TIPE_KLARIFIKASI, clarification_id, klarifikasi['file_bukti']) \
+        if klarifikasi and klarifikasi['file_bukti'] else None
+    if not lokasi:
         flash('File bukti tidak ditemukan.', 'error')
         return redirect(request.referrer or url_for('dashboard_admin'))
 
     # Membuat nama file baru yang deskriptif
-    file_path_db = klarifikasi['file_bukti']
-    directory = app.config['UPLOAD_FOLDER']
-    original_filename = os.path.basename(file_path_db)
-    
     nama_pengaju = klarifikasi['nama_lengkap'].replace(' ', '_')
     jenis_surat = klarifikasi['jenis_surat'].replace(' ', '_')
     tanggal_klarifikasi = klarifikasi['tanggal_klarifikasi'].split(' ')[0]
-    file_extension = os.path.splitext(original_filename)[1]
+    file_extension = os.path.splitext(lokasi['nama'])[1]
 
     new_filename = f"Bukti_{jenis_surat}_{nama_pengaju}_{tanggal_klarifikasi}{file_extension}"
 
     # Mengirim file dengan perintah untuk mengunduh (as_attachment=True)
-    return send_from_directory(
-        directory, 
-        original_filename, 
-        as_attachment=True, 
-        download_name=new_filename
-    )
+    return kirim_lampiran(lokasi, as_attachment=True, download_name=new_filename)
+
+# Surat cuti (input Admin): dapat dibuka pemilik cuti, pimpinan dan Admin
+@app.route('/surat_cuti/<int:cuti_id>')
+def surat_cuti(cuti_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    ROLES_APPROVAL = ['Admin', 'Kajur', 'Sekjur', 'Wadir1', 'Wadir2', 'Wadir3', 'Direktur']
+    conn = get_db()
+    record = conn.execute("SELECT nip, file_surat_cuti FROM cuti_dosen WHERE id = ?", (cuti_id,)).fetchone()
+    if not record or (record['nip'] != session['user_id'] and session.get('user_role') not in ROLES_APPROVAL):
+        return "Akses Ditolak", 403
+
+    lokasi = lokasi_lampiran(conn, lampiran.TIPE_CUTI, cuti_id, record['file_surat_cuti']) if record['file_surat_cuti'] else None
+    if not lokasi:
+        return "File surat cuti tidak ditemukan", 404
+    return kirim_lampiran(lokasi)
 
 @app.route('/uploads/<path:filename>')
 def serve_uploaded_file(filename):
@@ -1265,46 +1220,90 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
-# if __name__ == '__main__':
-#     if not os.path.exists(UPLOAD_FOLDER):
-#         os.makedirs(UPLOAD_FOLDER)
-#     app.run(debug=True)
-
-# if __name__ == "__main__":
-#     # Pastikan folder upload ada
-#     if not os.path.exists(app.config["UPLOAD_FOLDER"]):
-#         os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-
-# if __name__ == "__main__":
-#     port = int(os.environ.get("PORT", 5000))
-#     app.run(host="0.0.0.0", port=port)
-
-    # Baca debug dari ENV
-# debug_mode = str(os.environ.get("FLASK_DEBUG", "0")).lower() in ("1", "true", "yes")
-
-    # Port default 5000 (lokal), Railway inject $PORT
-# port = int(os.environ.get("PORT", 5000))
-
-if __name__ == "__main__":
-    # Hanya untuk lokal development
-    if not os.path.exists(app.config["UPLOAD_FOLDER"]):
-        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+# --- Metrik pengiriman per perangkat (khusus Admin) ---
+@app.route('/api/push_stats')
+def push_stats():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify({"endpoints": notifications.endpoint_stats(get_db())})
 
-    debug_mode = str(os.environ.get("FLASK_DEBUG", "0")).lower() in ("1", "true", "yes")
-    port = int(os.environ.get("PORT", 5000))
+# --- Statistik cache aplikasi (khusus Admin) ---
+@app.route('/api/cache_stats')
+def cache_stats():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(cache.statistik())
 
-    app.run(host="0.0.0.0", port=port, debug=debug_mode)
+# --- Ekspor rekap multi-bulan (semester/tahunan, khusus Admin) ---
+# Request hanya memasukkan job ke antrean; workbook dibuat oleh proses `worker`
+# (lihat ekspor_periode.py) dan halaman rekap memantau progresnya lewat polling.
+@app.route('/ekspor_periode', methods=['POST'])
+def ekspor_periode_mulai():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        dari, sampai = ekspor_periode.rentang_periode(request.get_json(silent=True) or request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job_id, _ = ekspor_periode.buat_job(get_db(), dari, sampai, session['user_id'])
+    return jsonify({"id": job_id, "url_status": url_for('ekspor_periode_status', job_id=job_id)}), 202
+
+@app.route('/ekspor_periode/<int:job_id>')
+def ekspor_periode_status(job_id):
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    job = ekspor_periode.status_job(get_db(), job_id)
+    if not job:
+        return jsonify({"error": "Job tidak ditemukan"}), 404
+    if job['status'] == 'selesai':
+        job['url_unduh'] = url_for('ekspor_periode_unduh', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/ekspor_periode/<int:job_id>/unduh')
+def ekspor_periode_unduh(job_id):
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return redirect(url_for('login'))
+    job = ekspor_periode.status_job(get_db(), job_id)
+    path = os.path.join(ekspor_periode.EKSPOR_FOLDER, job['berkas']) if job and job['berkas'] else None
+    if not path or not os.path.isfile(path):
+        flash("File ekspor tidak ditemukan atau sudah kedaluwarsa.", "error")
+        return redirect(url_for('rekap_laporan_view'))
+    return send_file(path, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     as_attachment=True, download_name=f"Rekap_Absensi_{job['dari']}_{job['sampai']}.xlsx")
+
+# Job ekspor periode dijalankan proses `worker` (lihat worker.py); EKSPOR_PEMBUAT=thread untuk
+# menjalankannya di proses web bila proses worker tidak dijalankan.
+if os.getenv("EKSPOR_PEMBUAT", "worker") == "thread":
+    ekspor_periode.start_background_pembuat()
+
+# --- Metrik performa format Prometheus (khusus Admin / token scraper) ---
+@app.route('/metrics')
+def metrics():
+    if not metrik.boleh_scrape(session):
+        return jsonify({"error": "Unauthorized"}), 403
+    return app.response_class(metrik.render(), mimetype='text/plain; version=0.0.4')
 
+# --- Jejak SQL per request dan dugaan N+1 (khusus Admin, mode pengembangan) ---
+@app.route('/debug/sql')
+def debug_sql():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return redirect(url_for('login'))
+    jejak = jejak_sql.jejak_terakhir()
+    if request.args.get('format') == 'json':
+        return jsonify({"aktif": jejak_sql.aktif(app), "ambang": jejak_sql.SQL_TRACE_AMBANG, "jejak": jejak})
+    hanya_n1 = request.args.get('n1') == '1'
+    if hanya_n1:
+        jejak = [item for item in jejak if item['dugaan_n_plus_1']]
+    return render_template('debug_sql.html', jejak=jejak, aktif=jejak_sql.aktif(app),
+                           ambang=jejak_sql.SQL_TRACE_AMBANG, hanya_n1=hanya_n1)
 
 # --- 1. KONFIGURASI VAPID KEYS ---
 # Letakkan ini di bagian atas app.py, di bawah baris import
 
 
 # --- VAPID keys (ambil dari environment) ---
-VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
+# Private key & claims dipakai oleh dispatcher di notifications.py
 VAPID_PUBLIC_KEY  = os.getenv("VAPID_PUBLIC_KEY")
-VAPID_MAILTO      = os.getenv("VAPID_MAILTO", "admin@example.com")
-VAPID_CLAIMS = {"sub": f"mailto:{VAPID_MAILTO}"}
 
 @app.route("/vapid_public_key")
 def vapid_public_key():
@@ -1328,16 +1327,10 @@ def subscribe():
         return jsonify({"error": "User not authenticated"}), 401
 
     try:
-        # Simpan data subscription ke database
-        conn = sqlite3.connect('database.db')
-        conn.row_factory = sqlite3.Row
-        subscription_json = json.dumps(subscription_data)
-        
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET push_subscription_info = ? WHERE nip = ?", 
-                       (subscription_json, user_nip))
+        # Simpan data subscription ke database (satu baris per perangkat)
+        conn = get_db()
+        save_subscription(conn, user_nip, subscription_data)
         conn.commit()
-        conn.close()
         
         print(f"[SUCCESS] Subscription berhasil disimpan untuk NIP: {user_nip}")
         return jsonify({"success": True}), 200
@@ -1346,55 +1339,77 @@ def subscribe():
         print(f"[ERROR] Gagal menyimpan subscription: {e}")
         return jsonify({"error": str(e)}), 500
 
-# --- 3. FUNGSI UTAMA UNTUK MENGIRIM NOTIFIKASI ---
-def send_push_notification(target_nip, title, body, url="/"):
-    """
-    Mengirim notifikasi push ke NIP tertentu.
-    """
-    try:
-        # Ambil data subscription user dari database berdasarkan NIP target
-        conn = sqlite3.connect('database.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT push_subscription_info FROM users WHERE nip = ?", (target_nip,))
-        result = cursor.fetchone()
-        conn.close()
-
-        if result and result['push_subscription_info']:
-            # Ubah string JSON dari database kembali menjadi dictionary
-            subscription_info = json.loads(result['push_subscription_info'])
-            
-            # Siapkan data payload notifikasi
-            payload = {
-                "title": title,
-                "body": body,
-                "url": url
-            }
-
-            # Kirim notifikasi menggunakan webpush
-            webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(payload),
-                vapid_private_key=VAPID_PRIVATE_KEY,
-                vapid_claims=VAPID_CLAIMS.copy()
-            )
-            print(f"Push notification sent successfully to NIP: {target_nip}")
-            return True
-        else:
-            print(f"No subscription info found for NIP: {target_nip}")
-            return False
-
-    except WebPushException as ex:
-        print(f"WebPushException error for NIP {target_nip}: {ex}")
-        if ex.response and ex.response.status_code == 410:
-            print("Subscription expired or invalid. Consider removing from DB.")
-        return False
-    except Exception as e:
-        print(f"Generic error sending push notification: {e}")
-        return False
+# --- Arsip workbook laporan bulanan (khusus Admin) ---
+@app.route('/arsip_laporan')
+def arsip_laporan_view():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return redirect(url_for('login'))
+    conn = get_db()
+    return render_template('arsip_laporan.html', arsip=arsip_laporan.status_arsip(conn),
+                           bulan_aktif=arsip_laporan.bulan_aktif(conn), mode_pembuat=ARSIP_PEMBUAT)
 
+@app.route('/arsip_laporan/bangun', methods=['POST'])
+def arsip_laporan_bangun():
+    if 'user_role' not in session or session['user_role'] != 'Admin':
+        return redirect(url_for('login'))
+    bulan = request.form.get('bulan', '')
+    try:
+        datetime.strptime(bulan, '%Y-%m')
+    except ValueError:
+        flash("Format bulan harus YYYY-MM.", "error")
+        return redirect(url_for('arsip_laporan_view'))
+    conn = get_db()
+    arsip_laporan.minta(conn, bulan)
+    conn.commit()
+    flash(f"Workbook {bulan} dijadwalkan untuk dibangun ulang.", "success")
+    return redirect(url_for('arsip_laporan_view'))
+
+# --- 3. PENGIRIMAN NOTIFIKASI ---
+# Notifikasi dikirim dari outbox (lihat notifications.py) oleh proses `worker` di
+# Procfile. Set NOTIFICATION_DISPATCHER=thread bila proses worker tidak dijalankan,
+# agar dispatcher berjalan sebagai thread di setiap proses web.
+if os.getenv("NOTIFICATION_DISPATCHER", "worker") == "thread":
+    notifications.start_background_dispatcher()
+
+# Workbook laporan bulanan dibangun oleh proses `worker` (lihat worker.py). Set
+# ARSIP_PEMBUAT=thread bila proses worker tidak dijalankan; tanpa pembuat sama sekali
+# download_laporan tetap mengirim laporan secara streaming, tetapi arsip tidak terisi.
+ARSIP_PEMBUAT = os.getenv("ARSIP_PEMBUAT", "worker")
+if ARSIP_PEMBUAT == "thread":
+    arsip_laporan.start_background_pembuat()
 
 # --- Service Worker route ---
 @app.route('/service-worker.js')
 def service_worker():
-    return app.send_static_file('service-worker.js')
\ No newline at end of file
+    return app.send_static_file('service-worker.js')
+
+
+# if __name__ == '__main__':
+#     if not os.path.exists(UPLOAD_FOLDER):
+#         os.makedirs(UPLOAD_FOLDER)
+#     app.run(debug=True)
+
+# if __name__ == "__main__":
+#     # Pastikan folder upload ada
+#     if not os.path.exists(app.config["UPLOAD_FOLDER"]):
+#         os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+# if __name__ == "__main__":
+#     port = int(os.environ.get("PORT", 5000))
+#     app.run(host="0.0.0.0", port=port)
+
+    # Baca debug dari ENV
+# debug_mode = str(os.environ.get("FLASK_DEBUG", "0")).lower() in ("1", "true", "yes")
+
+    # Port default 5000 (lokal), Railway inject $PORT
+# port = int(os.environ.get("PORT", 5000))
+
+if __name__ == "__main__":
+    # Hanya untuk lokal development
+    if not os.path.exists(app.config["UPLOAD_FOLDER"]):
+        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    debug_mode = str(os.environ.get("FLASK_DEBUG", "0")).lower() in ("1", "true", "yes")
+    port = int(os.environ.get("PORT", 5000))
+
+    app.run(host="0.0.0.0", port=port, debug=debug_mode)
@@ -0,0 +1,275 @@
+# arsip_laporan.py
+# Arsip workbook Excel laporan bulanan yang dibuat di latar belakang, sehingga
+# download_laporan untuk satu bulan penuh cukup mengirim file yang sudah jadi.
+#
+# Setiap file disimpan di ARSIP_FOLDER dengan nama berisi bulan dan versi datanya:
+#   Laporan_Absensi_<YYYY-MM>_<versi>.xlsx
+# Versi bulan = versi cache ('semua', 'pengguna', 'bulan:YYYY-MM') dari cache.py,
+# yang dinaikkan di transaksi yang sama dengan perubahan absensi bulan itu. File
+# dianggap siap hanya jika versinya sama dengan versi data saat ini.
+#
+# Tabel arsip_laporan (migrasi 011) mencatat job terakhir per bulan:
+#   antri -> proses -> selesai / gagal
+# PembuatArsip (proses `worker`, lihat worker.py) setiap interval menjadwalkan ulang
+# bulan aktif yang file-nya usang (data berubah, atau bulan baru saja ditutup dan
+# belum pernah dibuat), lalu membangun job antri satu per satu.
+#
+# Pemakaian:
+#   python arsip_laporan.py --bulan 2025-07   -> bangun workbook satu bulan sekarang
+#   python arsip_laporan.py --aktif           -> bangun semua bulan aktif yang usang
+#   python arsip_laporan.py                   -> tampilkan status arsip
+import argparse
+import calendar
+import glob
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+
+import cache
+import db
+import rekap
+
+ARSIP_FOLDER = os.getenv("ARSIP_FOLDER", os.path.join(os.getcwd(), "laporan_arsip"))
+# Jumlah bulan terakhir yang workbook-nya selalu dijaga tetap baru
+ARSIP_BULAN_AKTIF = int(os.getenv("ARSIP_BULAN_AKTIF", "3"))
+ARSIP_POLL_INTERVAL = float(os.getenv("ARSIP_POLL_INTERVAL", "30"))  # detik
+# Job 'proses' yang lebih tua dari ini dianggap milik worker yang mati
+ARSIP_CLAIM_TIMEOUT = int(os.getenv("ARSIP_CLAIM_TIMEOUT", "900"))  # detik
+
+
+def rentang_bulan(bulan):
+    """(awal, akhir) inklusif YYYY-MM-DD untuk bulan YYYY-MM."""
+    tahun, nomor = int(bulan[:4]), int(bulan[5:7])
+    return f"{bulan}-01", f"{bulan}-{calendar.monthrange(tahun, nomor)[1]:02d}"
+
+
+def bulan_dari_rentang(awal, akhir):
+    """Bulan YYYY-MM jika rentang tepat satu bulan penuh, selain itu None."""
+    return awal[:7] if (awal, akhir) == rentang_bulan(awal[:7]) else None
+
+
+def versi_bulan(conn, bulan):
+    return ".".join(map(str, cache.versi(conn, cache.KUNCI_SEMUA, 'pengguna', f"bulan:{bulan}")))
+
+
+def path_berkas(bulan, versi, folder=None):
+    return os.path.join(folder or ARSIP_FOLDER, f"Laporan_Absensi_{bulan}_{versi}.xlsx")
+
+
+def bulan_aktif(conn, jumlah=ARSIP_BULAN_AKTIF):
+    """Bulan terakhir (sampai bulan ini atau bulan data terbaru) yang dijaga tetap baru."""
+    terakhir = max(date.today().strftime('%Y-%m'), rekap.bulan_terakhir(conn))
+    tahun, nomor = int(terakhir[:4]), int(terakhir[5:7])
+    hasil = []
+    for _ in range(jumlah):
+        hasil.append(f"{tahun:04d}-{nomor:02d}")
+        tahun, nomor = (tahun - 1, 12) if nomor == 1 else (tahun, nomor - 1)
+    return hasil
+
+
+# --- Arsip ---
+def berkas_siap(conn, bulan, folder=None):
+    """(path, versi) workbook bulan yang sesuai data saat ini, atau None."""
+    row = conn.execute("SELECT versi FROM arsip_laporan WHERE bulan = ? AND status = 'selesai'", (bulan,)).fetchone()
+    if not row:
+        return None
+    versi = versi_bulan(conn, bulan)
+    path = path_berkas(bulan, versi, folder)
+    return (path, versi) if row[0] == versi and os.path.isfile(path) else None
+
+
+def minta(conn, bulan):
+    """Menjadwalkan pembangunan ulang workbook bulan. Tidak melakukan commit."""
+    conn.execute("""
+        INSERT INTO arsip_laporan (bulan, status, diminta_pada) VALUES (?, 'antri', CURRENT_TIMESTAMP)
+        ON CONFLICT(bulan) DO UPDATE SET status = 'antri', diminta_pada = CURRENT_TIMESTAMP
+        WHERE status != 'proses'
+    """, (bulan,))
+
+
+def jadwalkan_usang(conn, daftar_bulan):
+    """Menjadwalkan bulan yang belum punya workbook atau workbook-nya usang. Return daftar bulan."""
+    tersimpan = {row[0]: (row[1], row[2]) for row in conn.execute(
+        "SELECT bulan, status, versi FROM arsip_laporan WHERE bulan IN (%s)" % ",".join("?" * len(daftar_bulan)),
+        daftar_bulan
+    )}
+    usang = []
+    for bulan in daftar_bulan:
+        status, versi = tersimpan.get(bulan, (None, None))
+        if status in ('antri', 'proses'):
+            continue
+        # Job gagal (versi = versi data saat gagal) baru dicoba lagi setelah datanya
+        # berubah atau diminta ulang oleh admin
+        if versi != versi_bulan(conn, bulan):
+            minta(conn, bulan)
+            usang.append(bulan)
+    return usang
+
+
+def bangun(conn, bulan, folder=None):
+    """
+    Membangun workbook satu bulan ke arsip lalu mencatatnya sebagai 'selesai'
+    (commit). Versi data dan isi laporan dibaca dalam satu transaksi baca sehingga
+    file selalu cocok dengan versinya. File versi lama bulan itu dihapus.
+    Return (path, versi).
+    """
+    folder = folder or ARSIP_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    awal, akhir = rentang_bulan(bulan)
+    mulai = time.perf_counter()
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".laporan-", suffix=".xlsx", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            versi = versi_bulan(conn, bulan)
+            rekap.tulis_excel(conn, awal, akhir, tmp)
+            conn.commit()
+        path = path_berkas(bulan, versi, folder)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    for lama in glob.glob(os.path.join(folder, f"Laporan_Absensi_{bulan}_*.xlsx")):
+        if lama != path:
+            os.remove(lama)
+    conn.execute("""
+        INSERT INTO arsip_laporan (bulan, status, versi, berkas, ukuran, durasi_ms, error, selesai_pada)
+        VALUES (?, 'selesai', ?, ?, ?, ?, NULL, CURRENT_TIMESTAMP)
+        ON CONFLICT(bulan) DO UPDATE SET status = 'selesai', versi = excluded.versi, berkas = excluded.berkas,
+            ukuran = excluded.ukuran, durasi_ms = excluded.durasi_ms, error = NULL,
+            selesai_pada = excluded.selesai_pada
+    """, (bulan, versi, os.path.basename(path), os.path.getsize(path), int((time.perf_counter() - mulai) * 1000)))
+    conn.commit()
+    return path, versi
+
+
+def status_arsip(conn):
+    """Status arsip per bulan untuk halaman admin, termasuk apakah file-nya masih sesuai data."""
+    hasil = []
+    for row in conn.execute("SELECT * FROM arsip_laporan ORDER BY bulan DESC"):
+        item = dict(row)
+        item['versi_data'] = versi_bulan(conn, item['bulan'])
+        item['segar'] = item['status'] == 'selesai' and item['versi'] == item['versi_data']
+        hasil.append(item)
+    return hasil
+
+
+# --- Pembuat Latar Belakang ---
+class PembuatArsip:
+    """
+    Loop latar belakang: menjadwalkan bulan aktif yang usang, mengklaim job antri
+    (atau job 'proses' yang ditinggal worker mati) satu per satu dan membangunnya.
+    """
+
+    def __init__(self, database=None, folder=None, poll_interval=ARSIP_POLL_INTERVAL):
+        self.database = database
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = db.connect(self.database)
+        return self._conn
+
+    def klaim(self):
+        row = self.conn.execute("""
+            UPDATE arsip_laporan SET status = 'proses', mulai_pada = CURRENT_TIMESTAMP
+            WHERE bulan = (
+                SELECT bulan FROM arsip_laporan
+                WHERE status = 'antri' OR (status = 'proses' AND mulai_pada <= datetime('now', ?))
+                ORDER BY diminta_pada LIMIT 1
+            )
+            RETURNING bulan
+        """, (f"-{ARSIP_CLAIM_TIMEOUT} seconds",)).fetchone()
+        self.conn.commit()
+        return row[0] if row else None
+
+    def run_once(self):
+        """Menjadwalkan bulan usang lalu membangun satu job. Return bulan yang dibangun atau None."""
+        jadwalkan_usang(self.conn, bulan_aktif(self.conn))
+        self.conn.commit()
+        bulan = self.klaim()
+        if bulan is None:
+            return None
+        try:
+            path, versi = bangun(self.conn, bulan, self.folder)
+            print(f"Arsip laporan {bulan} dibangun ({os.path.basename(path)})")
+        except Exception as e:
+            self.conn.rollback()
+            self.conn.execute("""
+                UPDATE arsip_laporan SET status = 'gagal', versi = ?, error = ?, selesai_pada = CURRENT_TIMESTAMP
+                WHERE bulan = ?
+            """, (versi_bulan(self.conn, bulan), str(e)[:500], bulan))
+            self.conn.commit()
+            print(f"[ERROR] Arsip laporan {bulan}: {e}")
+        return bulan
+
+    def run_forever(self):
+        print(f"Pembuat arsip laporan berjalan ({ARSIP_BULAN_AKTIF} bulan aktif, interval {self.poll_interval} detik)")
+        try:
+            while not self._stop.is_set():
+                try:
+                    dibangun = self.run_once()
+                except Exception as e:
+                    print(f"[ERROR] Pembuat arsip laporan: {e}")
+                    if self._conn is not None:
+                        self._conn.rollback()
+                    dibangun = None
+                # Masih ada job antri: langsung lanjut tanpa menunggu
+                if dibangun is None:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def start_background_pembuat():
+    """Menjalankan pembuat arsip sebagai daemon thread di dalam proses saat ini."""
+    pembuat = PembuatArsip()
+    thread = threading.Thread(target=pembuat.run_forever, name="arsip-laporan", daemon=True)
+    thread.start()
+    return pembuat
+
+
+if __name__ == '__main__':
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Arsip workbook laporan bulanan")
+    parser.add_argument('--bulan', action='append', help="bangun workbook bulan YYYY-MM (boleh berulang)")
+    parser.add_argument('--aktif', action='store_true', help="bangun semua bulan aktif yang usang")
+    parser.add_argument('--folder', default=ARSIP_FOLDER)
+    parser.add_argument('--db', default=db.DATABASE)
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    try:
+        apply_migrations(conn)
+        daftar = list(args.bulan or [])
+        if args.aktif:
+            daftar += jadwalkan_usang(conn, bulan_aktif(conn))
+            conn.commit()
+        for bulan in daftar:
+            path, versi = bangun(conn, bulan, args.folder)
+            print(f"{bulan}: {path} (versi {versi}, {os.path.getsize(path) / 1024:.0f} KB)")
+        if not daftar:
+            for item in status_arsip(conn):
+                print(f"{item['bulan']}  {item['status']:<8} {'segar' if item['segar'] else 'usang':<6} "
+                      f"{item['berkas'] or '-'}  {item['durasi_ms'] or 0} ms  {item['error'] or ''}")
+    finally:
+        conn.close()
@@ -0,0 +1,189 @@
+# cache.py
+# Cache aplikasi untuk data turunan yang mahal dihitung (laporan rekap, daftar
+# bawahan, saldo cuti, ringkasan absensi). Backend:
+#   memory (default) -> LRU di dalam proses dengan TTL per entri
+#   redis            -> Redis bersama antar worker (CACHE_REDIS, default SESSION_REDIS)
+#   none             -> tanpa cache (selalu hitung ulang)
+#
+# Invalidasi memakai kunci versi di tabel data_versi (migrasi 009): setiap entri
+# disimpan dengan versi data yang dipakainya, dan jalur tulis menaikkan versi di
+# transaksi yang sama dengan perubahannya. Karena versi dibaca dari SQLite, cache
+# in-process di setiap worker gunicorn ikut kedaluwarsa tanpa perlu pesan antar proses.
+# TTL hanya batas atas untuk perubahan yang tidak lewat aplikasi (mis. edit manual DB).
+# Kunci yang sama juga menjadi ETag respons HTTP (lihat etag()).
+#
+# Kunci versi yang dipakai:
+#   'absensi'    -> attendance, clarifications, cuti dan data turunannya (semua pegawai)
+#   'nip:<nip>'  -> data absensi/cuti satu pegawai
+#   'bulan:YYYY-MM' -> data absensi/cuti satu bulan (workbook arsip_laporan.py)
+#   'pengguna'   -> users dan hierarki atasan-bawahan
+#   'semua'      -> ikut di setiap entri; dinaikkan oleh rebuild/rekonsiliasi lewat CLI
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+KUNCI_SEMUA = 'semua'
+
+
+# --- Backend ---
+class MemoryBackend:
+    """LRU dengan TTL per entri, aman dipakai beberapa thread."""
+    nama = 'memory'
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            kedaluwarsa, nilai = item
+            if kedaluwarsa < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return nilai
+
+    def set(self, key, nilai, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, nilai)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def jumlah_entri(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Entri di-pickle ke Redis dengan SETEX; dipakai bersama oleh semua worker."""
+    nama = 'redis'
+
+    def __init__(self, url, prefix="cache:"):
+        from redis import Redis
+        self.redis = Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.redis.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, nilai, ttl):
+        self.redis.setex(self.prefix + key, ttl, pickle.dumps(nilai, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        for key in self.redis.scan_iter(self.prefix + "*"):
+            self.redis.delete(key)
+
+    def jumlah_entri(self):
+        return sum(1 for _ in self.redis.scan_iter(self.prefix + "*"))
+
+
+def buat_backend(nama=CACHE_BACKEND):
+    if nama == 'redis':
+        return RedisBackend(os.getenv("CACHE_REDIS") or os.getenv("SESSION_REDIS"))
+    if nama == 'none':
+        return None
+    return MemoryBackend()
+
+
+backend = buat_backend()
+
+# Hit/miss per nama cache, dihitung per proses
+_statistik = {}
+_statistik_lock = threading.Lock()
+
+
+def _catat(nama, kolom):
+    with _statistik_lock:
+        _statistik.setdefault(nama, {'hit': 0, 'miss': 0})[kolom] += 1
+
+
+# --- Kunci Versi ---
+def versi(conn, *kunci):
+    """Versi saat ini untuk setiap kunci (0 jika belum pernah dinaikkan), satu query."""
+    tersimpan = dict(conn.execute(
+        "SELECT kunci, versi FROM data_versi WHERE kunci IN (SELECT value FROM json_each(?))",
+        (json.dumps(kunci),)
+    ).fetchall())
+    return tuple(tersimpan.get(k, 0) for k in kunci)
+
+
+def naikkan_versi(conn, *kunci):
+    """
+    Menaikkan versi kunci-kunci data. Tidak melakukan commit; dipanggil di dalam
+    transaksi yang mengubah data sehingga invalidasi ikut ter-commit/rollback.
+    """
+    conn.executemany(
+        "INSERT INTO data_versi (kunci, versi) VALUES (?, 1) "
+        "ON CONFLICT(kunci) DO UPDATE SET versi = versi + 1",
+        [(k,) for k in dict.fromkeys(kunci)]
+    )
+
+
+# --- Pembacaan ---
+def kunci(conn, nama, params, kunci_versi):
+    """Kunci cache (nama, params) pada versi data saat ini."""
+    versi_data = versi(conn, KUNCI_SEMUA, *kunci_versi)
+    return f"{nama}:{json.dumps(params, default=str)}:{'.'.join(map(str, versi_data))}"
+
+
+def etag(key):
+    """ETag dari kunci cache: berubah tepat ketika versi data di dalam kunci berubah."""
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def ambil(conn, nama, params, kunci_versi, hitung, ttl=CACHE_TTL):
+    """
+    Nilai cache untuk (nama, params) pada versi data saat ini; jika belum ada,
+    hitung() dipanggil dan hasilnya disimpan. Nilai harus bisa di-pickle (untuk
+    Redis) dan tidak boleh diubah oleh pemanggil.
+    """
+    if backend is None:
+        return hitung()
+    return ambil_kunci(nama, kunci(conn, nama, params, kunci_versi), hitung, ttl)
+
+
+def ambil_kunci(nama, key, hitung, ttl=CACHE_TTL):
+    """Seperti ambil(), untuk kunci yang sudah dihitung dengan kunci()."""
+    if backend is None:
+        return hitung()
+    nilai = backend.get(key)
+    if nilai is not None:
+        _catat(nama, 'hit')
+        return nilai
+    _catat(nama, 'miss')
+    nilai = hitung()
+    backend.set(key, nilai, ttl)
+    return nilai
+
+
+def statistik():
+    """Ringkasan hit/miss per nama cache (proses ini) untuk endpoint admin."""
+    with _statistik_lock:
+        per_nama = {nama: dict(angka) for nama, angka in _statistik.items()}
+    for angka in per_nama.values():
+        total = angka['hit'] + angka['miss']
+        angka['hit_rate'] = round(angka['hit'] / total, 3) if total else None
+    return {
+        'backend': backend.nama if backend else 'none',
+        'ttl': CACHE_TTL,
+        'entri': backend.jumlah_entri() if backend else 0,
+        'pid': os.getpid(),
+        'cache': per_nama,
+    }
@@ -0,0 +1,219 @@
+# cuti.py
+# Ledger cuti: satu baris per hari cuti yang sudah disetujui (leave_ledger) dan
+# saldo terpakai per (nip, tahun, jenis) (leave_balance), sehingga sisa cuti
+# tahunan cukup dibaca dengan satu lookup primary key, tanpa COUNT + LIKE '%...%'
+# pada tabel attendance. Diperbarui di transaksi yang sama oleh input_cuti,
+# submit_klarifikasi dan proses_klarifikasi.
+#
+# Hari kerja cuti = Senin-Jumat yang tidak tercantum di tabel hari_libur.
+#
+# Pemakaian:
+#   python cuti.py --rebuild   -> bangun ulang ledger dari attendance + cuti_dosen
+#   python cuti.py --check     -> rekonsiliasi: bandingkan ledger dengan data mentah
+#   python cuti.py --libur 2025-08-17 "Hari Kemerdekaan"   -> tambah/ubah hari libur
+#   python cuti.py --hapus-libur 2025-08-17                -> hapus hari libur
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+
+JENIS_CUTI_TAHUNAN = 'Cuti Tahunan'
+
+# Hari absensi yang dihitung sebagai cuti terpakai (sama dengan perhitungan lama
+# di dashboard: status disetujui dan keterangan menyebut cuti). Jenis diambil dari
+# awal keterangan ("Cuti Sakit - demam" -> "Cuti Sakit").
+_SELECT_LEDGER = f"""
+    SELECT a.nip, a.tanggal_hari, CAST(substr(a.tanggal_hari, 1, 4) AS INTEGER),
+           CASE WHEN a.keterangan LIKE '%{JENIS_CUTI_TAHUNAN}%' THEN '{JENIS_CUTI_TAHUNAN}'
+                ELSE trim(substr(a.keterangan, 1, instr(a.keterangan || ' - ', ' - ') - 1)) END,
+           (SELECT max(c.id) FROM cuti_dosen c
+            WHERE c.nip = a.nip AND c.tanggal_mulai <= a.tanggal_hari AND c.tanggal_selesai >= a.tanggal_hari)
+    FROM attendance a
+    WHERE a.status LIKE 'Disetujui%' AND a.keterangan LIKE '%Cuti%' AND a.tanggal_hari IS NOT NULL
+"""
+
+
+def _cakupan(nip, awal, akhir, alias=""):
+    # Klausa tambahan untuk satu NIP dan/atau rentang tanggal inklusif (YYYY-MM-DD)
+    kondisi, params = [], []
+    if nip is not None:
+        kondisi.append(f"{alias}nip = ?")
+        params.append(nip)
+    if awal is not None:
+        kondisi.append(f"{alias}tanggal_hari >= ?")
+        params.append(awal[:10])
+    if akhir is not None:
+        kondisi.append(f"{alias}tanggal_hari <= ?")
+        params.append(akhir[:10])
+    return kondisi, params
+
+
+# --- Pemeliharaan Ledger ---
+def refresh_ledger(conn, nip=None, awal=None, akhir=None):
+    """
+    Menyinkronkan ledger dan saldo cuti untuk satu NIP dan/atau rentang tanggal.
+    Tidak melakukan commit; dipanggil di dalam transaksi yang mengubah attendance.
+    """
+    kondisi, params = _cakupan(nip, awal, akhir)
+    where = (" WHERE " + " AND ".join(kondisi)) if kondisi else ""
+    # Tahun yang tersentuh dicatat sebelum dihapus, agar saldonya ikut dihitung ulang
+    tersentuh = set(conn.execute(f"SELECT DISTINCT nip, tahun FROM leave_ledger{where}", params).fetchall())
+    conn.execute(f"DELETE FROM leave_ledger{where}", params)
+
+    kondisi_a, params_a = _cakupan(nip, awal, akhir, alias="a.")
+    conn.execute(
+        "INSERT OR REPLACE INTO leave_ledger (nip, tanggal_hari, tahun, jenis, cuti_id) "
+        + _SELECT_LEDGER + "".join(f" AND {k}" for k in kondisi_a),
+        params_a
+    )
+    tersentuh |= set(conn.execute(f"SELECT DISTINCT nip, tahun FROM leave_ledger{where}", params).fetchall())
+
+    for row_nip, tahun in tersentuh:
+        conn.execute("DELETE FROM leave_balance WHERE nip = ? AND tahun = ?", (row_nip, tahun))
+        conn.execute("""
+            INSERT INTO leave_balance (nip, tahun, jenis, terpakai)
+            SELECT nip, tahun, jenis, COUNT(*) FROM leave_ledger
+            WHERE nip = ? AND tahun = ?
+            GROUP BY jenis
+        """, (row_nip, tahun))
+    return len(tersentuh)
+
+
+def rebuild_ledger(conn):
+    """Rekonsiliasi penuh: ledger dan saldo dibangun ulang dari attendance + cuti_dosen."""
+    conn.execute("DELETE FROM leave_ledger")
+    conn.execute("DELETE FROM leave_balance")
+    conn.execute("INSERT OR REPLACE INTO leave_ledger (nip, tanggal_hari, tahun, jenis, cuti_id) " + _SELECT_LEDGER)
+    conn.execute("""
+        INSERT INTO leave_balance (nip, tahun, jenis, terpakai)
+        SELECT nip, tahun, jenis, COUNT(*) FROM leave_ledger GROUP BY nip, tahun, jenis
+    """)
+    return conn.execute("SELECT COUNT(*) FROM leave_ledger").fetchone()[0]
+
+
+def cek_ledger(conn):
+    """
+    Membandingkan ledger/saldo tersimpan dengan hasil hitung ulang dari data mentah,
+    ditambah hari kerja di cuti_dosen yang tidak tercatat sebagai cuti di attendance.
+    Mengembalikan list pesan selisih.
+    """
+    selisih = []
+    seharusnya = {row[:2]: row[2:] for row in conn.execute(_SELECT_LEDGER)}
+    tersimpan = {row[:2]: row[2:] for row in conn.execute("SELECT nip, tanggal_hari, tahun, jenis, cuti_id FROM leave_ledger")}
+    for kunci in sorted(set(seharusnya) | set(tersimpan)):
+        if seharusnya.get(kunci) != tersimpan.get(kunci):
+            selisih.append(f"leave_ledger {kunci}: tersimpan={tersimpan.get(kunci)} seharusnya={seharusnya.get(kunci)}")
+
+    saldo_seharusnya = {}
+    for (row_nip, _), (tahun, jenis, _) in seharusnya.items():
+        saldo_seharusnya[(row_nip, tahun, jenis)] = saldo_seharusnya.get((row_nip, tahun, jenis), 0) + 1
+    saldo_tersimpan = {row[:3]: row[3] for row in conn.execute("SELECT nip, tahun, jenis, terpakai FROM leave_balance")}
+    for kunci in sorted(set(saldo_seharusnya) | set(saldo_tersimpan)):
+        if saldo_seharusnya.get(kunci) != saldo_tersimpan.get(kunci):
+            selisih.append(f"leave_balance {kunci}: tersimpan={saldo_tersimpan.get(kunci)} seharusnya={saldo_seharusnya.get(kunci)}")
+
+    # Hari kerja dalam surat cuti yang tidak (lagi) berstatus cuti di attendance
+    for cuti_id, row_nip, tanggal_hari in conn.execute("""
+        WITH RECURSIVE hari(id, nip, tanggal, selesai) AS (
+            SELECT id, nip, date(tanggal_mulai), date(tanggal_selesai) FROM cuti_dosen
+            WHERE date(tanggal_mulai) IS NOT NULL AND date(tanggal_selesai) IS NOT NULL
+            UNION ALL
+            SELECT id, nip, date(tanggal, '+1 day'), selesai FROM hari WHERE tanggal < selesai
+        )
+        SELECT h.id, h.nip, h.tanggal FROM hari h
+        WHERE strftime('%w', h.tanggal) NOT IN ('0', '6')
+          AND h.tanggal NOT IN (SELECT tanggal FROM hari_libur)
+          AND NOT EXISTS (SELECT 1 FROM leave_ledger l WHERE l.nip = h.nip AND l.tanggal_hari = h.tanggal)
+        ORDER BY h.id, h.tanggal
+    """):
+        selisih.append(f"cuti_dosen #{cuti_id} {row_nip} {tanggal_hari}: tidak tercatat sebagai cuti di attendance")
+    return selisih
+
+
+# --- Kalender Hari Kerja ---
+def hari_kerja(conn, awal, akhir):
+    """
+    Tanggal hari kerja (YYYY-MM-DD) dalam rentang inklusif: Senin-Jumat yang bukan
+    hari libur. Hari libur di rentang itu dibaca dengan satu query.
+    """
+    awal, akhir = awal[:10], akhir[:10]
+    libur = {row[0] for row in conn.execute("SELECT tanggal FROM hari_libur WHERE tanggal BETWEEN ? AND ?", (awal, akhir))}
+    hasil = []
+    tanggal = datetime.strptime(awal, '%Y-%m-%d').date()
+    selesai = datetime.strptime(akhir, '%Y-%m-%d').date()
+    while tanggal <= selesai:
+        tanggal_str = tanggal.strftime('%Y-%m-%d')
+        if tanggal.weekday() < 5 and tanggal_str not in libur:
+            hasil.append(tanggal_str)
+        tanggal += timedelta(days=1)
+    return hasil
+
+
+def simpan_hari_libur(conn, tanggal, keterangan=None):
+    """Menambah atau mengubah satu hari libur. Tidak melakukan commit."""
+    tanggal = datetime.strptime(tanggal[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    conn.execute("INSERT OR REPLACE INTO hari_libur (tanggal, keterangan) VALUES (?, ?)", (tanggal, keterangan))
+
+
+# --- Pembacaan Saldo ---
+def saldo_cuti(conn, nip, tahun=None, jatah=None):
+    """
+    Saldo cuti tahunan satu NIP untuk satu tahun (default tahun ini), dibaca dari
+    leave_balance dengan lookup primary key. Mengembalikan (jatah, terpakai, sisa).
+    """
+    tahun = int(tahun or datetime.now().year)
+    if jatah is None:
+        row = conn.execute("SELECT jatah_cuti_tahunan FROM users WHERE nip = ?", (nip,)).fetchone()
+        jatah = row[0] if row and row[0] is not None else 0
+    row = conn.execute(
+        "SELECT terpakai FROM leave_balance WHERE nip = ? AND tahun = ? AND jenis = ?",
+        (nip, tahun, JENIS_CUTI_TAHUNAN)
+    ).fetchone()
+    terpakai = row[0] if row else 0
+    return jatah, terpakai, jatah - terpakai
+
+
+if __name__ == '__main__':
+    import cache
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Pemeliharaan ledger cuti")
+    parser.add_argument('--rebuild', action='store_true', help="bangun ulang ledger dari attendance + cuti_dosen")
+    parser.add_argument('--check', action='store_true', help="rekonsiliasi ledger dengan data mentah")
+    parser.add_argument('--libur', nargs='+', metavar=('TANGGAL', 'KETERANGAN'), help="tambah/ubah hari libur")
+    parser.add_argument('--hapus-libur', metavar='TANGGAL', help="hapus hari libur")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        apply_migrations(conn)
+        if args.libur or args.hapus_libur:
+            if args.libur:
+                simpan_hari_libur(conn, args.libur[0], " ".join(args.libur[1:]) or None)
+                print(f"Hari libur {args.libur[0]} disimpan.")
+            if args.hapus_libur:
+                conn.execute("DELETE FROM hari_libur WHERE tanggal = ?", (args.hapus_libur,))
+                print(f"Hari libur {args.hapus_libur} dihapus.")
+            conn.commit()
+            sys.exit(0)
+        if args.rebuild:
+            jumlah = rebuild_ledger(conn)
+            cache.naikkan_versi(conn, cache.KUNCI_SEMUA)
+            conn.commit()
+            print(f"Ledger cuti dibangun ulang: {jumlah} hari cuti.")
+        if args.check or not args.rebuild:
+            selisih = cek_ledger(conn)
+            for pesan in selisih[:50]:
+                print(f"  {pesan}")
+            ledger_tidak_sinkron = [pesan for pesan in selisih if not pesan.startswith('cuti_dosen')]
+            if ledger_tidak_sinkron:
+                print(f"TIDAK KONSISTEN: {len(ledger_tidak_sinkron)} selisih ledger. Jalankan --rebuild untuk memperbaiki.")
+                sys.exit(1)
+            print("Ledger cuti konsisten dengan data absensi."
+                  + (f" ({len(selisih)} hari di cuti_dosen tanpa status cuti di attendance)" if selisih else ""))
+    finally:
+        conn.close()
@@ -0,0 +1,222 @@
+# db.py
+# Lapisan koneksi SQLite: satu pool koneksi per proses worker, dan satu koneksi
+# per request yang diikat ke Flask `g` lalu dikembalikan ke pool saat teardown.
+# Setiap koneksi mengukur statement yang dijalankannya jika thread saat ini
+# sedang mencatat (lihat mulai_pencatatan dan metrik.py).
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import g
+
+DATABASE = os.getenv("DATABASE", "database.db")
+
+# Jumlah koneksi yang disimpan per proses. 0 = tanpa pool (buka-tutup tiap request).
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Jumlah prepared statement yang di-cache per koneksi oleh modul sqlite3
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",            # pembaca tidak memblokir penulis
+    "PRAGMA synchronous = NORMAL",          # aman untuk WAL, fsync lebih sedikit
+    "PRAGMA cache_size = -16000",           # ~16 MB page cache per koneksi
+    "PRAGMA mmap_size = 134217728",         # 128 MB memory-mapped I/O
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",  # tunggu lock, jangan langsung 'database is locked'
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+# --- Pengukuran SQL ---
+_lokal = threading.local()
+
+
+class PencatatSQL:
+    """Jumlah statement dan total waktu SQL (detik) yang dijalankan satu thread."""
+
+    def __init__(self):
+        self.jumlah = 0
+        self.durasi = 0.0
+
+    def catat(self, sql, durasi):
+        self.jumlah += 1
+        self.durasi += durasi
+
+    def catat_fetch(self, durasi):
+        # Waktu mengambil baris hasil ikut dihitung, tetapi bukan statement baru
+        self.durasi += durasi
+
+
+def mulai_pencatatan(pencatat=None):
+    """Mulai mencatat semua statement SQL di thread ini. Return pencatatnya."""
+    _lokal.pencatat = pencatat if pencatat is not None else PencatatSQL()
+    return _lokal.pencatat
+
+
+def pencatat_aktif():
+    return getattr(_lokal, 'pencatat', None)
+
+
+def selesai_pencatatan():
+    """Berhenti mencatat di thread ini. Return pencatat terakhir atau None."""
+    return _lokal.__dict__.pop('pencatat', None)
+
+
+class CursorTerukur(sqlite3.Cursor):
+    """
+    Cursor yang melaporkan durasi execute*/fetch* ke pencatat thread aktif.
+    Tanpa pencatat aktif (worker, script CLI) hanya menambah satu lookup.
+    Baris yang diambil dengan iterasi langsung (`for row in cursor`) tidak ikut diukur.
+    """
+
+    def execute(self, sql, parameters=(), /):
+        pencatat = getattr(_lokal, 'pencatat', None)
+        if pencatat is None:
+            return super().execute(sql, parameters)
+        mulai = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            pencatat.catat(sql, time.perf_counter() - mulai)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        pencatat = getattr(_lokal, 'pencatat', None)
+        if pencatat is None:
+            return super().executemany(sql, seq_of_parameters)
+        mulai = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            pencatat.catat(sql, time.perf_counter() - mulai)
+
+    def executescript(self, sql_script, /):
+        pencatat = getattr(_lokal, 'pencatat', None)
+        if pencatat is None:
+            return super().executescript(sql_script)
+        mulai = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            pencatat.catat(sql_script, time.perf_counter() - mulai)
+
+    def _fetch(self, ambil, *args):
+        pencatat = getattr(_lokal, 'pencatat', None)
+        if pencatat is None:
+            return ambil(*args)
+        mulai = time.perf_counter()
+        try:
+            return ambil(*args)
+        finally:
+            pencatat.catat_fetch(time.perf_counter() - mulai)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class KoneksiTerukur(sqlite3.Connection):
+    """Koneksi yang selalu membuat CursorTerukur, termasuk untuk conn.execute(...)."""
+
+    def cursor(self, factory=CursorTerukur):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script, /):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database=None):
+    """
+    Membuka koneksi baru dengan pragma yang sudah di-tuning.
+    Dipakai langsung oleh script/worker di luar konteks request Flask.
+    """
+    conn = sqlite3.connect(
+        database or DATABASE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # koneksi bisa dipakai thread lain setelah kembali ke pool
+        factory=KoneksiTerukur,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, database, size):
+        self.database = database
+        self.size = size
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue(maxsize=max(size, 1))
+
+    def _reset_after_fork(self):
+        # Koneksi SQLite tidak boleh dibawa melewati fork(); buang milik proses induk
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = queue.LifoQueue(maxsize=max(self.size, 1))
+                self._pid = os.getpid()
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        if self.size > 0:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        return connect(self.database)
+
+    def release(self, conn):
+        if self.size <= 0 or self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            # Jangan kembalikan koneksi dengan transaksi yang menggantung
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        except sqlite3.Error:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+pool = ConnectionPool(DATABASE, POOL_SIZE)
+
+
+def get_db():
+    """Koneksi untuk request saat ini (diambil dari pool sekali per request)."""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
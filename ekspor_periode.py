@@ -0,0 +1,349 @@
+# ekspor_periode.py
+# Ekspor rekap absensi multi-bulan (semester/tahunan) untuk semua unit, dihitung
+# per bulan dari attendance_daily_code. Hasilnya satu workbook: satu sheet per unit
+# (kolom per bulan + total per kode) dan sheet "Ringkasan" per unit per bulan.
+#
+# Request web hanya memasukkan job ke tabel ekspor_periode (migrasi 012) lalu
+# memantau progresnya lewat polling; job dijalankan oleh PembuatEkspor di proses
+# `worker` (lihat worker.py), yang mengklaim job satu per satu:
+#   antri -> proses -> selesai / gagal
+# Job 'proses' yang tidak ada progres selama EKSPOR_TIMEOUT (worker di-restart)
+# diklaim ulang dan dijalankan dari awal.
+#
+# Pemakaian:
+#   python ekspor_periode.py --dari 2025-01 --sampai 2025-12 [--keluaran rekap.xlsx]
+import argparse
+import calendar
+import os
+import threading
+import time
+
+import db
+
+EKSPOR_FOLDER = os.getenv("EKSPOR_FOLDER", os.path.join(os.getcwd(), "laporan_arsip", "periode"))
+# Rentang ekspor terpanjang (bulan)
+MAKS_BULAN_EKSPOR = 24
+EKSPOR_POLL_INTERVAL = float(os.getenv("EKSPOR_POLL_INTERVAL", "2"))  # detik
+# Job 'proses' tanpa progres selama ini dianggap milik worker yang mati
+EKSPOR_TIMEOUT = int(os.getenv("EKSPOR_TIMEOUT", "600"))  # detik
+# File hasil ekspor yang lebih tua dari ini dihapus saat ekspor baru selesai
+EKSPOR_SIMPAN_HARI = int(os.getenv("EKSPOR_SIMPAN_HARI", "7"))
+
+
+def daftar_bulan(dari, sampai):
+    """Semua bulan YYYY-MM dari 'dari' sampai 'sampai' (inklusif)."""
+    tahun, nomor = int(dari[:4]), int(dari[5:7])
+    hasil = []
+    while f"{tahun:04d}-{nomor:02d}" <= sampai:
+        hasil.append(f"{tahun:04d}-{nomor:02d}")
+        tahun, nomor = (tahun + 1, 1) if nomor == 12 else (tahun, nomor + 1)
+    return hasil
+
+
+def rentang_periode(args):
+    """
+    (dari, sampai) bulan YYYY-MM dari parameter request: tahun=YYYY, semester=YYYY-1/YYYY-2,
+    atau dari=YYYY-MM&sampai=YYYY-MM. ValueError jika tidak valid.
+    """
+    if args.get('tahun'):
+        tahun = args['tahun']
+        if not (tahun.isdigit() and len(tahun) == 4):
+            raise ValueError("Format tahun harus YYYY.")
+        return f"{tahun}-01", f"{tahun}-12"
+    if args.get('semester'):
+        tahun, _, ke = args['semester'].partition('-')
+        if not (tahun.isdigit() and len(tahun) == 4 and ke in ('1', '2')):
+            raise ValueError("Format semester harus YYYY-1 atau YYYY-2.")
+        return (f"{tahun}-01", f"{tahun}-06") if ke == '1' else (f"{tahun}-07", f"{tahun}-12")
+
+    dari, sampai = args.get('dari', ''), args.get('sampai', '')
+    for bulan in (dari, sampai):
+        if not (len(bulan) == 7 and bulan[4] == '-' and bulan[:4].isdigit() and bulan[5:].isdigit()
+                and 1 <= int(bulan[5:]) <= 12):
+            raise ValueError("Format bulan harus YYYY-MM.")
+    if sampai < dari:
+        raise ValueError("Bulan akhir lebih awal dari bulan mulai.")
+    if len(daftar_bulan(dari, sampai)) > MAKS_BULAN_EKSPOR:
+        raise ValueError(f"Rentang ekspor maksimal {MAKS_BULAN_EKSPOR} bulan.")
+    return dari, sampai
+
+
+# --- Perhitungan ---
+def hitung_bulan(conn, bulan):
+    """Jumlah setiap kode rekap per pegawai (selain Admin) untuk satu bulan. Return {nip: {kode: jumlah}}."""
+    tahun, nomor = int(bulan[:4]), int(bulan[5:7])
+    awal = f"{bulan}-01"
+    akhir = f"{bulan}-{calendar.monthrange(tahun, nomor)[1]:02d}"
+    hasil = {}
+    for nip, kode, jumlah in conn.execute("""
+        SELECT d.nip, d.kode, COUNT(*) FROM attendance_daily_code d
+        JOIN users u ON u.nip = d.nip
+        WHERE d.tanggal_hari >= ? AND d.tanggal_hari <= ? AND u.role != 'Admin'
+        GROUP BY d.nip, d.kode
+    """, (awal, akhir)):
+        hasil.setdefault(nip, {})[kode] = jumlah
+    return hasil
+
+
+def hitung_periode(conn, dari, sampai, progres=None):
+    """
+    Menghitung rekap per bulan dalam periode. progres(selesai, total) dipanggil
+    setiap satu bulan selesai.
+    Return (unit, per_bulan): unit = [{'jurusan', 'nama_jurusan', 'pegawai': [(nip, nama)]}],
+    per_bulan = {(bulan, nip): {kode: jumlah}}.
+    """
+    unit = {}
+    for nip, nama, jurusan, detail_jurusan in conn.execute("""
+        SELECT nip, nama_lengkap, jurusan, "detail jurusan" FROM users
+        WHERE role != 'Admin' ORDER BY jurusan, nama_lengkap, nip
+    """):
+        unit.setdefault(jurusan, {'jurusan': jurusan, 'nama_jurusan': detail_jurusan, 'pegawai': []})['pegawai'].append((nip, nama))
+
+    bulan_list = daftar_bulan(dari, sampai)
+    per_bulan = {}
+    if progres:
+        progres(0, len(bulan_list))
+    for selesai, bulan in enumerate(bulan_list, 1):
+        per_bulan.update({(bulan, nip): jumlah for nip, jumlah in hitung_bulan(conn, bulan).items()})
+        if progres:
+            progres(selesai, len(bulan_list))
+    return list(unit.values()), per_bulan
+
+
+# --- Workbook ---
+def tulis_workbook(unit, per_bulan, dari, sampai, berkas):
+    """Menulis hasil hitung_periode() sebagai workbook (openpyxl write-only) ke berkas."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from klasifikasi import KODE_REKAP
+    from rekap import nama_sheet
+
+    bulan_list = daftar_bulan(dari, sampai)
+    workbook = Workbook(write_only=True)
+
+    def header(sheet, label):
+        sel_header = []
+        for teks in label:
+            sel = WriteOnlyCell(sheet, value=teks)
+            sel.font = Font(bold=True)
+            sel_header.append(sel)
+        sheet.append(sel_header)
+
+    ringkasan = workbook.create_sheet("Ringkasan")
+    header(ringkasan, ['Unit', 'Bulan', 'Pegawai'] + list(KODE_REKAP))
+    for data_unit in unit:
+        sheet = workbook.create_sheet(nama_sheet(data_unit['nama_jurusan']))
+        header(sheet, ['Nama Staf', 'NIP'] + bulan_list + [f"Total {kode}" for kode in KODE_REKAP])
+        total_unit = {bulan: dict.fromkeys(KODE_REKAP, 0) for bulan in bulan_list}
+        for nip, nama in data_unit['pegawai']:
+            total_pegawai = dict.fromkeys(KODE_REKAP, 0)
+            kolom_bulan = []
+            for bulan in bulan_list:
+                jumlah = per_bulan.get((bulan, nip), {})
+                kolom_bulan.append(", ".join(f"{kode}:{jumlah[kode]}" for kode in KODE_REKAP if jumlah.get(kode)) or None)
+                for kode, n in jumlah.items():
+                    total_pegawai[kode] += n
+                    total_unit[bulan][kode] += n
+            sheet.append([nama, nip] + kolom_bulan + [total_pegawai[kode] for kode in KODE_REKAP])
+
+        nama_unit = data_unit['nama_jurusan'] or data_unit['jurusan']
+        jumlah_pegawai = len(data_unit['pegawai'])
+        for bulan in bulan_list:
+            ringkasan.append([nama_unit, bulan, jumlah_pegawai] + [total_unit[bulan][kode] for kode in KODE_REKAP])
+        ringkasan.append([nama_unit, f"{dari} s.d. {sampai}", jumlah_pegawai]
+                         + [sum(total_unit[bulan][kode] for bulan in bulan_list) for kode in KODE_REKAP])
+    workbook.save(berkas)
+
+
+def buat_ekspor(conn, dari, sampai, berkas, progres=None):
+    """Menghitung dan menulis workbook periode [dari, sampai] ke berkas."""
+    unit, per_bulan = hitung_periode(conn, dari, sampai, progres)
+    tulis_workbook(unit, per_bulan, dari, sampai, berkas)
+
+
+# --- Antrean Job ---
+def buat_job(conn, dari, sampai, nip):
+    """
+    Memasukkan job baru ke antrean, atau id job periode yang sama yang masih
+    antri/berjalan. Commit. Return (id, baru).
+    """
+    row = conn.execute("""
+        SELECT id FROM ekspor_periode
+        WHERE dari = ? AND sampai = ? AND status IN ('antri', 'proses')
+          AND diperbarui_pada > datetime('now', ?)
+    """, (dari, sampai, f"-{EKSPOR_TIMEOUT} seconds")).fetchone()
+    if row:
+        return row[0], False
+    job_id = conn.execute(
+        "INSERT INTO ekspor_periode (dari, sampai, diminta_oleh) VALUES (?, ?, ?)", (dari, sampai, nip)
+    ).lastrowid
+    conn.commit()
+    return job_id, True
+
+
+def jalankan_job(conn, job_id, folder=None):
+    """Menjalankan satu job yang sudah diklaim dan mencatat progres/hasilnya (commit)."""
+    folder = folder or EKSPOR_FOLDER
+    dari, sampai = conn.execute("SELECT dari, sampai FROM ekspor_periode WHERE id = ?", (job_id,)).fetchone()
+
+    def progres(selesai, total):
+        # Sekaligus tanda hidup: job 'proses' tanpa progres diklaim ulang setelah EKSPOR_TIMEOUT
+        conn.execute("""
+            UPDATE ekspor_periode SET tugas_selesai = ?, tugas_total = ?, diperbarui_pada = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (selesai, total, job_id))
+        conn.commit()
+
+    os.makedirs(folder, exist_ok=True)
+    nama = f"Rekap_Absensi_{dari}_{sampai}_{job_id}.xlsx"
+    tmp_path = os.path.join(folder, f".{nama}")
+    mulai = time.perf_counter()
+    try:
+        buat_ekspor(conn, dari, sampai, tmp_path, progres=progres)
+        os.replace(tmp_path, os.path.join(folder, nama))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    conn.execute("""
+        UPDATE ekspor_periode SET status = 'selesai', berkas = ?, durasi_ms = ?,
+            diperbarui_pada = CURRENT_TIMESTAMP WHERE id = ?
+    """, (nama, int((time.perf_counter() - mulai) * 1000), job_id))
+    conn.commit()
+    hapus_kedaluwarsa(folder)
+    return nama
+
+
+def status_job(conn, job_id):
+    """Status job untuk endpoint polling, atau None jika tidak ada."""
+    row = conn.execute("""
+        SELECT id, dari, sampai, status, tugas_selesai, tugas_total, berkas, error, durasi_ms,
+               diperbarui_pada <= datetime('now', ?) AS macet
+        FROM ekspor_periode WHERE id = ?
+    """, (f"-{EKSPOR_TIMEOUT} seconds", job_id)).fetchone()
+    if not row:
+        return None
+    job = dict(zip(('id', 'dari', 'sampai', 'status', 'selesai', 'total', 'berkas', 'error', 'durasi_ms', 'macet'), row))
+    # Job 'proses' yang macet akan diklaim ulang worker; job yang tidak pernah
+    # diambil sama sekali berarti tidak ada pembuat ekspor yang berjalan
+    if job.pop('macet') and job['status'] == 'antri':
+        job['status'], job['error'] = 'gagal', "Job belum diambil worker (proses worker berjalan?)"
+    job['persen'] = round(100 * job['selesai'] / job['total']) if job['total'] else 0
+    return job
+
+
+# --- Pembuat Latar Belakang ---
+class PembuatEkspor:
+    """
+    Loop latar belakang (proses `worker`, lihat worker.py): mengklaim job antri
+    (atau job 'proses' yang ditinggal worker mati) satu per satu dan menjalankannya.
+    """
+
+    def __init__(self, database=None, folder=None, poll_interval=EKSPOR_POLL_INTERVAL):
+        self.database = database
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = db.connect(self.database)
+        return self._conn
+
+    def klaim(self):
+        row = self.conn.execute("""
+            UPDATE ekspor_periode SET status = 'proses', diperbarui_pada = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM ekspor_periode
+                WHERE status = 'antri' OR (status = 'proses' AND diperbarui_pada <= datetime('now', ?))
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id
+        """, (f"-{EKSPOR_TIMEOUT} seconds",)).fetchone()
+        self.conn.commit()
+        return row[0] if row else None
+
+    def run_once(self):
+        """Menjalankan satu job antri. Return id job atau None jika antrean kosong."""
+        job_id = self.klaim()
+        if job_id is None:
+            return None
+        try:
+            nama = jalankan_job(self.conn, job_id, self.folder)
+            print(f"Ekspor periode #{job_id} selesai ({nama})")
+        except Exception as e:
+            self.conn.rollback()
+            self.conn.execute("""
+                UPDATE ekspor_periode SET status = 'gagal', error = ?, diperbarui_pada = CURRENT_TIMESTAMP WHERE id = ?
+            """, (str(e)[:500], job_id))
+            self.conn.commit()
+            print(f"[ERROR] Ekspor periode #{job_id}: {e}")
+        return job_id
+
+    def run_forever(self):
+        print(f"Pembuat ekspor periode berjalan (interval {self.poll_interval} detik)")
+        try:
+            while not self._stop.is_set():
+                try:
+                    job_id = self.run_once()
+                except Exception as e:
+                    print(f"[ERROR] Pembuat ekspor periode: {e}")
+                    if self._conn is not None:
+                        self._conn.rollback()
+                    job_id = None
+                # Masih ada job antri: langsung lanjut tanpa menunggu
+                if job_id is None:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def start_background_pembuat():
+    """Menjalankan pembuat ekspor sebagai daemon thread di dalam proses saat ini."""
+    pembuat = PembuatEkspor()
+    thread = threading.Thread(target=pembuat.run_forever, name="ekspor-periode", daemon=True)
+    thread.start()
+    return pembuat
+
+
+def hapus_kedaluwarsa(folder=None):
+    batas = time.time() - EKSPOR_SIMPAN_HARI * 86400
+    folder = folder or EKSPOR_FOLDER
+    for nama in os.listdir(folder):
+        path = os.path.join(folder, nama)
+        if nama.startswith("Rekap_Absensi_") and os.path.getmtime(path) < batas:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Ekspor rekap absensi multi-bulan")
+    parser.add_argument('--dari', required=True, help="bulan awal YYYY-MM")
+    parser.add_argument('--sampai', required=True, help="bulan akhir YYYY-MM")
+    parser.add_argument('--keluaran', help="file .xlsx (default: Rekap_Absensi_<dari>_<sampai>.xlsx)")
+    parser.add_argument('--db', default=db.DATABASE)
+    args = parser.parse_args()
+
+    dari, sampai = rentang_periode({'dari': args.dari, 'sampai': args.sampai})
+    keluaran = args.keluaran or f"Rekap_Absensi_{dari}_{sampai}.xlsx"
+    conn = db.connect(args.db)
+    try:
+        apply_migrations(conn)
+        mulai = time.perf_counter()
+        buat_ekspor(conn, dari, sampai, keluaran,
+                    progres=lambda selesai, total: print(f"\r  {selesai}/{total} bulan", end="", flush=True))
+        print(f"\n{keluaran} selesai dalam {time.perf_counter() - mulai:.1f} detik.")
+    finally:
+        conn.close()
@@ -0,0 +1,118 @@
+# hierarki.py
+# Indeks hierarki organisasi (closure table): satu baris per pasangan
+# (atasan, bawahan) untuk bawahan langsung maupun tidak langsung, beserta
+# kedalamannya. Dashboard approver dan riwayat klarifikasi cukup membaca satu
+# rentang primary key, tanpa menelusuri users.id_atasan level demi level.
+# Dibangun ulang di transaksi yang sama setiap kali tambah_pengguna mengubah users.
+#
+# Pemakaian:
+#   python hierarki.py --rebuild   -> bangun ulang dari users.id_atasan
+#   python hierarki.py --check     -> rekonsiliasi dengan users.id_atasan
+import argparse
+import os
+import sqlite3
+import sys
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+
+# Batas kedalaman penelusuran, sekaligus pengaman jika id_atasan membentuk siklus
+MAKS_KEDALAMAN = 16
+
+_SELECT_HIERARKI = f"""
+    WITH RECURSIVE rantai(atasan_nip, bawahan_nip, kedalaman) AS (
+        SELECT id_atasan, nip, 1 FROM users
+        WHERE id_atasan IS NOT NULL AND id_atasan != '' AND id_atasan != nip
+        UNION
+        SELECT u.id_atasan, r.bawahan_nip, r.kedalaman + 1
+        FROM rantai r JOIN users u ON u.nip = r.atasan_nip
+        WHERE u.id_atasan IS NOT NULL AND u.id_atasan != '' AND r.kedalaman < {MAKS_KEDALAMAN}
+    )
+    SELECT atasan_nip, bawahan_nip, MIN(kedalaman) FROM rantai
+    WHERE atasan_nip != bawahan_nip
+    GROUP BY atasan_nip, bawahan_nip
+"""
+
+# Akar penelusuran: NIP pimpinan itu sendiri, atau atasannya untuk Sekjur
+# (Sekjur bekerja atas nama Kajur dan melihat bawahan Kajur).
+_AKAR = "?"
+_AKAR_LEWAT_ATASAN = "(SELECT id_atasan FROM users WHERE nip = ?)"
+
+
+# --- Pemeliharaan Indeks ---
+def rebuild_hierarki(conn):
+    """
+    Membangun ulang users_hierarchy dari users.id_atasan. Tidak melakukan commit;
+    dipanggil di dalam transaksi yang mengubah users. Return jumlah pasangan.
+    """
+    conn.execute("DELETE FROM users_hierarchy")
+    conn.execute("INSERT INTO users_hierarchy (atasan_nip, bawahan_nip, kedalaman) " + _SELECT_HIERARKI)
+    return conn.execute("SELECT COUNT(*) FROM users_hierarchy").fetchone()[0]
+
+
+def cek_hierarki(conn):
+    """Membandingkan users_hierarchy dengan hasil hitung ulang. Return list pesan selisih."""
+    seharusnya = {row[:2]: row[2] for row in conn.execute(_SELECT_HIERARKI)}
+    tersimpan = {row[:2]: row[2] for row in conn.execute("SELECT atasan_nip, bawahan_nip, kedalaman FROM users_hierarchy")}
+    return [
+        f"{kunci}: tersimpan={tersimpan.get(kunci)} seharusnya={seharusnya.get(kunci)}"
+        for kunci in sorted(set(seharusnya) | set(tersimpan))
+        if seharusnya.get(kunci) != tersimpan.get(kunci)
+    ]
+
+
+# --- Query Bawahan ---
+def daftar_bawahan(conn, nip, lewat_atasan=False):
+    """
+    Semua bawahan (langsung dan tidak langsung) dari nip dalam satu query, beserta
+    kedalaman (1 = bawahan langsung) dan jumlah klarifikasinya yang masih menunggu
+    persetujuan. lewat_atasan=True memakai atasan nip sebagai akar (Sekjur).
+    """
+    akar = _AKAR_LEWAT_ATASAN if lewat_atasan else _AKAR
+    return conn.execute(f"""
+        SELECT u.nip, u.nama_lengkap, u.role, h.kedalaman,
+               (SELECT COUNT(*) FROM clarifications c
+                WHERE c.nip_pengaju = u.nip AND c.nip_approver_sekarang IS NOT NULL) AS jumlah_menunggu
+        FROM users_hierarchy h JOIN users u ON u.nip = h.bawahan_nip
+        WHERE h.atasan_nip = {akar}
+        ORDER BY h.kedalaman, u.nama_lengkap
+    """, (nip,)).fetchall()
+
+
+def riwayat_klarifikasi_bawahan(conn, nip, lewat_atasan=False):
+    """Riwayat klarifikasi seluruh bawahan nip (terbaru dulu) dalam satu query."""
+    akar = _AKAR_LEWAT_ATASAN if lewat_atasan else _AKAR
+    return conn.execute(f"""
+        SELECT c.* FROM users_hierarchy h JOIN clarifications c ON c.nip_pengaju = h.bawahan_nip
+        WHERE h.atasan_nip = {akar}
+        ORDER BY c.tanggal_pengajuan DESC
+    """, (nip,)).fetchall()
+
+
+if __name__ == '__main__':
+    import cache
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Pemeliharaan indeks hierarki organisasi")
+    parser.add_argument('--rebuild', action='store_true', help="bangun ulang dari users.id_atasan")
+    parser.add_argument('--check', action='store_true', help="rekonsiliasi dengan users.id_atasan")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        apply_migrations(conn)
+        if args.rebuild:
+            jumlah = rebuild_hierarki(conn)
+            cache.naikkan_versi(conn, cache.KUNCI_SEMUA)
+            conn.commit()
+            print(f"Hierarki dibangun ulang: {jumlah} pasangan atasan-bawahan.")
+        if args.check or not args.rebuild:
+            selisih = cek_hierarki(conn)
+            for pesan in selisih[:50]:
+                print(f"  {pesan}")
+            if selisih:
+                print(f"TIDAK KONSISTEN: {len(selisih)} selisih. Jalankan --rebuild untuk memperbaiki.")
+                sys.exit(1)
+            print("Hierarki konsisten dengan users.id_atasan.")
+    finally:
+        conn.close()
@@ -0,0 +1,213 @@
+# jejak_sql.py
+# Jejak SQL per request untuk pengembangan: setiap statement dicatat beserta
+# durasi dan lokasi pemanggilnya di kode aplikasi, lalu dikelompokkan per bentuk
+# (literal dan daftar IN (?, ?, ...) diseragamkan). Bentuk yang dijalankan lebih
+# dari SQL_TRACE_AMBANG kali dalam satu request ditandai sebagai dugaan N+1
+# (query di dalam loop yang seharusnya executemany / satu query IN / JOIN).
+#
+# Aktif hanya jika SQL_TRACE=1 atau aplikasi berjalan dalam mode debug. Jejak
+# terakhir bisa dilihat di /debug/sql (khusus Admin), ?format=json untuk JSON,
+# dan dugaan N+1 ikut ditulis ke log. Jika SQL_TRACE_FOLDER diset, jejak request
+# yang punya dugaan N+1 juga disimpan sebagai file JSON.
+#
+# Untuk script/CLI:
+#   with jejak_sql.lacak("impor") as jejak:
+#       ...
+#   print(jejak.ringkasan())
+# (koneksi harus dibuat dengan factory=db.KoneksiTerukur, lihat db.connect)
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+from flask import g, request
+
+import db
+
+SQL_TRACE = os.getenv("SQL_TRACE", "0") == "1"
+SQL_TRACE_AMBANG = int(os.getenv("SQL_TRACE_AMBANG", "10"))
+SQL_TRACE_SIMPAN = int(os.getenv("SQL_TRACE_SIMPAN", "50"))
+SQL_TRACE_FOLDER = os.getenv("SQL_TRACE_FOLDER")
+# Statement per jejak yang disimpan lengkap untuk ditampilkan (ringkasan per bentuk tetap utuh)
+MAKS_STATEMENT = 500
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Frame di file ini dan db.py bukan pemanggil yang menarik
+_LEWATI = {os.path.abspath(__file__), os.path.abspath(db.__file__)}
+# Endpoint yang tidak dijejak (halaman jejak itu sendiri dan file statis)
+_TIDAK_DIJEJAK = {'debug_sql', 'static'}
+
+# Kontrol transaksi dan PRAGMA wajar berulang (mis. satu transaksi per migrasi), bukan N+1
+_BUKAN_N1 = re.compile(r"^(BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)\b", re.I)
+
+_POLA_BENTUK = (
+    (re.compile(r"--[^\n]*|/\*.*?\*/", re.S), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+@lru_cache(maxsize=2048)
+def bentuk(sql):
+    """Bentuk statement: literal jadi ?, daftar (?, ?, ...) diseragamkan, spasi dirapikan."""
+    for pola, ganti in _POLA_BENTUK:
+        sql = pola.sub(ganti, sql)
+    return sql.strip()
+
+
+@lru_cache(maxsize=512)
+def _kode_aplikasi(filename):
+    path = os.path.abspath(filename)
+    return path not in _LEWATI and path.startswith(ROOT) and "site-packages" not in path
+
+
+def situs_pemanggil():
+    """'file.py:baris (fungsi)' dari frame terdekat di kode aplikasi, atau None."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        kode = frame.f_code
+        if _kode_aplikasi(kode.co_filename):
+            return f"{os.path.relpath(kode.co_filename, ROOT)}:{frame.f_lineno} ({kode.co_name})"
+        frame = frame.f_back
+    return None
+
+
+# --- Jejak ---
+class JejakSQL:
+    """
+    Pencatat SQL (antarmuka sama dengan db.PencatatSQL) yang menyimpan setiap
+    statement. Pencatat yang sudah aktif sebelumnya (metrik.py) tetap diteruskan.
+    """
+
+    def __init__(self, nama, teruskan=None):
+        self.nama = nama
+        self.teruskan = teruskan
+        self.waktu = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.statement = []  # [sql, durasi, situs]
+
+    def catat(self, sql, durasi):
+        self.statement.append([sql, durasi, situs_pemanggil()])
+        if self.teruskan is not None:
+            self.teruskan.catat(sql, durasi)
+
+    def catat_fetch(self, durasi):
+        # Waktu fetch dibebankan ke statement terakhir (biasanya cursor yang sama)
+        if self.statement:
+            self.statement[-1][1] += durasi
+        if self.teruskan is not None:
+            self.teruskan.catat_fetch(durasi)
+
+    def ringkasan(self, ambang=None):
+        """Dict jejak: total, bentuk statement urut jumlah eksekusi, dan dugaan N+1."""
+        ambang = SQL_TRACE_AMBANG if ambang is None else ambang
+        per_bentuk = {}
+        for sql, durasi, situs in self.statement:
+            kunci = bentuk(sql)
+            data = per_bentuk.get(kunci)
+            if data is None:
+                data = per_bentuk[kunci] = {'bentuk': kunci, 'jumlah': 0, 'durasi_ms': 0.0, 'situs': Counter()}
+            data['jumlah'] += 1
+            data['durasi_ms'] += durasi * 1000
+            data['situs'][situs] += 1
+        daftar = sorted(per_bentuk.values(), key=lambda d: (-d['jumlah'], -d['durasi_ms']))
+        for data in daftar:
+            data['durasi_ms'] = round(data['durasi_ms'], 3)
+            data['situs'] = [{'situs': situs, 'jumlah': jumlah} for situs, jumlah in data['situs'].most_common()]
+            data['n_plus_1'] = data['jumlah'] > ambang and not _BUKAN_N1.match(data['bentuk'])
+        return {
+            'nama': self.nama,
+            'waktu': self.waktu,
+            'jumlah': len(self.statement),
+            'durasi_ms': round(sum(durasi for _, durasi, _ in self.statement) * 1000, 3),
+            'ambang': ambang,
+            'dugaan_n_plus_1': [data for data in daftar if data['n_plus_1']],
+            'bentuk': daftar,
+            'statement': [{'sql': sql, 'durasi_ms': round(durasi * 1000, 3), 'situs': situs}
+                          for sql, durasi, situs in self.statement[:MAKS_STATEMENT]],
+        }
+
+
+@contextmanager
+def lacak(nama):
+    """Menjejak semua statement SQL di thread ini selama blok `with`."""
+    sebelumnya = db.pencatat_aktif()
+    jejak = db.mulai_pencatatan(JejakSQL(nama, teruskan=sebelumnya))
+    try:
+        yield jejak
+    finally:
+        if sebelumnya is not None:
+            db.mulai_pencatatan(sebelumnya)
+        else:
+            db.selesai_pencatatan()
+
+
+# --- Jejak per request ---
+_lock = threading.Lock()
+_terakhir = deque(maxlen=SQL_TRACE_SIMPAN)
+_nomor = 0
+
+
+def jejak_terakhir():
+    """Jejak request terakhir di proses ini, terbaru dulu."""
+    with _lock:
+        return list(reversed(_terakhir))
+
+
+def aktif(app):
+    return SQL_TRACE or app.debug
+
+
+def _simpan_json(hasil):
+    os.makedirs(SQL_TRACE_FOLDER, exist_ok=True)
+    nama = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{hasil['id']}-{hasil['endpoint']}.json"
+    with open(os.path.join(SQL_TRACE_FOLDER, nama), "w", encoding="utf-8") as f:
+        json.dump(hasil, f, ensure_ascii=False, indent=2)
+
+
+def _mulai():
+    if request.endpoint in _TIDAK_DIJEJAK:
+        return
+    g._jejak_sql = JejakSQL(f"{request.method} {request.path}", teruskan=db.pencatat_aktif())
+    db.mulai_pencatatan(g._jejak_sql)
+
+
+def _selesai(app):
+    def selesai(response):
+        global _nomor
+        jejak = g.pop('_jejak_sql', None)
+        if jejak is None:
+            return response
+        hasil = jejak.ringkasan()
+        with _lock:
+            _nomor += 1
+            hasil.update(id=_nomor, endpoint=request.endpoint or 'none', status=response.status_code)
+            _terakhir.append(hasil)
+        for data in hasil['dugaan_n_plus_1']:
+            situs = ", ".join(f"{s['situs']} x{s['jumlah']}" for s in data['situs'][:3])
+            app.logger.warning(f"Dugaan N+1 di {hasil['endpoint']}: {data['jumlah']}x "
+                               f"'{data['bentuk'][:120]}' dari {situs}")
+        if SQL_TRACE_FOLDER and hasil['dugaan_n_plus_1']:
+            _simpan_json(hasil)
+        return response
+    return selesai
+
+
+def _bersihkan(exc=None):
+    db.selesai_pencatatan()
+
+
+def init_app(app):
+    """Dipasang setelah metrik.init_app agar pencatat metrik ikut diteruskan."""
+    if not aktif(app):
+        return
+    app.logger.info(f"Jejak SQL aktif (dugaan N+1 jika satu bentuk > {SQL_TRACE_AMBANG}x per request)")
+    app.before_request(_mulai)
+    app.after_request(_selesai(app))
+    app.teardown_request(_bersihkan)
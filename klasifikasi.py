@@ -0,0 +1,167 @@
+# klasifikasi.py
+# Klasifikasi status absensi yang dipakai bersama oleh dashboard, ringkasan
+# absensi bawahan dan rekap laporan. Semua fungsi *_batch memproses banyak baris
+# sekaligus: jam diparse dengan parser format tetap berbasis NumPy, durasi
+# dihitung sebagai array, dan strptime hanya dipakai untuk format yang tidak baku.
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+KODE_REKAP = ('KT', 'PK', 'NF', 'FL', 'CT', 'IZ')
+# Durasi minimal (detik) agar kehadiran dihitung "Kehadiran Terpenuhi"
+DURASI_MINIMAL_KT = 4 * 3600
+
+# Format baku kolom jam dari impor Excel: 'HH:MM:SS.ffffff' (15 karakter)
+PANJANG_JAM = 15
+# Format lain yang masih diterima (setara strptime '%H:%M:%S.%f')
+POLA_JAM = re.compile(r'([01]?\d|2[0-3]):([0-5]?\d):([0-5]?\d)\.(\d{1,6})')
+
+
+# --- Parsing Jam ---
+def detik_jam(teks):
+    """Jam 'H:M:S.f' -> detik sejak tengah malam (float), None jika kosong/tidak valid."""
+    if not teks or not isinstance(teks, str):
+        return None
+    cocok = POLA_JAM.fullmatch(teks)
+    if not cocok:
+        return None
+    jam, menit, detik, pecahan = cocok.groups()
+    # '.5' berarti 0.5 detik (sama dengan %f pada strptime)
+    return int(jam) * 3600 + int(menit) * 60 + int(detik) + int(pecahan) / 10 ** len(pecahan)
+
+
+def detik_jam_batch(values):
+    """
+    Versi array dari detik_jam(). Nilai berformat baku diparse langsung dari byte
+    (tanpa regex/strptime); sisanya jatuh ke detik_jam(). NaN untuk kosong/tidak valid.
+    """
+    values = list(values)
+    n = len(values)
+    hasil = np.full(n, np.nan)
+    if n == 0:
+        return hasil
+
+    baku = np.array(
+        [v if isinstance(v, str) and len(v) == PANJANG_JAM and v.isascii() else '' for v in values],
+        dtype=f'S{PANJANG_JAM}'
+    )
+    d = baku.view(np.uint8).reshape(n, PANJANG_JAM).astype(np.int32) - ord('0')
+    digit = np.delete(d, [2, 5, 8], axis=1)
+    jam = d[:, 0] * 10 + d[:, 1]
+    menit = d[:, 3] * 10 + d[:, 4]
+    detik = d[:, 6] * 10 + d[:, 7]
+    valid = (
+        (d[:, 2] == ord(':') - ord('0')) & (d[:, 5] == ord(':') - ord('0')) & (d[:, 8] == ord('.') - ord('0'))
+        & ((digit >= 0) & (digit <= 9)).all(axis=1)
+        & (jam < 24) & (menit < 60) & (detik < 60)
+    )
+    mikro = d[:, 9:15] @ np.array([100000, 10000, 1000, 100, 10, 1])
+    hasil[valid] = (jam * 3600 + menit * 60 + detik)[valid] + mikro[valid] / 1e6
+
+    for i in np.flatnonzero(~valid):
+        nilai = detik_jam(values[i])
+        if nilai is not None:
+            hasil[i] = nilai
+    return hasil
+
+
+def format_jam(detik, kosong=" - "):
+    """Detik sejak tengah malam -> 'HH:MM' (NaN/None -> teks pengganti)."""
+    if detik is None or detik != detik:
+        return kosong
+    detik = int(detik)
+    return f"{detik // 3600:02d}:{detik % 3600 // 60:02d}"
+
+
+def format_tanggal(teks):
+    """'YYYY-MM-DD HH:MM:SS' -> 'dd/mm/YYYY'."""
+    if len(teks) == 19 and teks[4] == '-' and teks[7] == '-' and teks[10] == ' ':
+        return f"{teks[8:10]}/{teks[5:7]}/{teks[0:4]}"
+    return datetime.strptime(teks, '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+
+
+# --- Kode Rekap (KT/PK/NF/FL/CT/IZ) ---
+def kode_rekap(status, keterangan, jam_masuk, jam_pulang, kategori_klarifikasi=None):
+    """
+    Menentukan kode rekap satu hari absensi. kategori_klarifikasi adalah
+    kategori_surat dari klarifikasi yang disetujui pada hari tersebut (jika ada).
+    Mengembalikan None jika data jam tidak bisa dibaca (hari dilewati di laporan).
+    """
+    if status and "Disetujui" in status:
+        if 'Cuti' in (keterangan or ''):
+            return 'CT'
+        if kategori_klarifikasi and 'Non Fleksibel' in kategori_klarifikasi:
+            return 'NF'
+        if kategori_klarifikasi and 'Fleksibel' in kategori_klarifikasi:
+            return 'FL'
+        return 'IZ'
+    if jam_masuk and jam_pulang:
+        masuk, pulang = detik_jam(jam_masuk), detik_jam(jam_pulang)
+        if masuk is None or pulang is None:
+            return None
+        if pulang - masuk >= DURASI_MINIMAL_KT:
+            return 'KT'
+    return 'PK'
+
+
+def kode_rekap_batch(df):
+    """
+    Versi batch dari kode_rekap(). df berisi kolom status, keterangan, jam masuk,
+    jam pulang, kategori. Mengembalikan Series kode (None untuk baris yang dilewati).
+    """
+    disetujui = df['status'].fillna('').astype(str).str.contains('Disetujui', regex=False)
+    cuti = df['keterangan'].fillna('').astype(str).str.contains('Cuti', regex=False)
+    kategori = df['kategori'].fillna('').astype(str)
+    non_fleksibel = kategori.str.contains('Non Fleksibel', regex=False)
+    fleksibel = kategori.str.contains('Fleksibel', regex=False)
+
+    ada_jam = df['jam masuk'].fillna('').astype(bool) & df['jam pulang'].fillna('').astype(bool)
+    durasi = detik_jam_batch(df['jam pulang']) - detik_jam_batch(df['jam masuk'])
+
+    kode = np.select(
+        [disetujui & cuti, disetujui & non_fleksibel, disetujui & fleksibel, disetujui,
+         ada_jam & np.isnan(durasi), ada_jam & (durasi >= DURASI_MINIMAL_KT)],
+        ['CT', 'NF', 'FL', 'IZ', '', 'KT'],
+        default='PK'
+    )
+    return pd.Series(kode, index=df.index).replace('', None)
+
+
+# --- Status Tampilan (dashboard / ringkasan absensi) ---
+def status_absensi_batch(records, prefix_warna='', jam_kosong=" - "):
+    """
+    Menambahkan kolom tampilan ke setiap baris attendance: tanggal_formatted,
+    jam_masuk_formatted, jam_pulang_formatted, status_text, status_color
+    ('green'/'yellow'/'red', diberi prefix_warna mis. 'status-') dan checkbox_enabled.
+    Mengembalikan list dict baru.
+    """
+    records = [dict(record) for record in records]
+    masuk = detik_jam_batch(rec.get('jam masuk') for rec in records)
+    pulang = detik_jam_batch(rec.get('jam pulang') for rec in records)
+    terpenuhi = (pulang - masuk) >= DURASI_MINIMAL_KT
+
+    for i, rec in enumerate(records):
+        jam_masuk, jam_pulang = rec.get('jam masuk'), rec.get('jam pulang')
+        status, keterangan = rec.get('status'), rec.get('keterangan')
+
+        rec['tanggal_formatted'] = format_tanggal(rec['tanggal'])
+        rec['jam_masuk_formatted'] = format_jam(masuk[i], jam_masuk) if jam_masuk else jam_kosong
+        rec['jam_pulang_formatted'] = format_jam(pulang[i], jam_pulang) if jam_pulang else jam_kosong
+
+        if status and "Menunggu" in status:
+            teks, warna, checkbox = 'Menunggu Persetujuan', 'yellow', False
+        elif status and "Disetujui" in status:
+            teks, warna, checkbox = (f"Disetujui - {keterangan}" if keterangan else status), 'green', False
+        elif status and "Ditolak" in status:
+            teks, warna, checkbox = keterangan, 'red', True
+        elif jam_masuk and jam_pulang and not np.isnan(masuk[i]) and not np.isnan(pulang[i]):
+            if terpenuhi[i]:
+                teks, warna, checkbox = 'Kehadiran Terpenuhi', 'green', False
+            else:
+                teks, warna, checkbox = 'Kurang Dari 4 Jam', 'red', False
+        else:
+            teks, warna, checkbox = 'Perlu Klarifikasi', 'red', True
+        rec.update({'status_text': teks, 'status_color': prefix_warna + warna, 'checkbox_enabled': checkbox})
+    return records
@@ -0,0 +1,261 @@
+# lampiran.py
+# Penyimpanan lampiran berbasis isi (content-addressed): setiap file disimpan sekali
+# dengan nama = SHA-256 isinya di folder bertingkat uploads/blobs/ab/cd/<sha256>.
+# Hash dihitung sambil file ditulis ke disk (tanpa membaca ulang), dan file yang
+# isinya sudah ada tidak disimpan lagi. Tabel attachments menghubungkan klarifikasi
+# dan surat cuti ke blob; blobs.ref_count dijaga oleh trigger (migrasi 010).
+#
+# Pemakaian:
+#   python lampiran.py --migrasi-uploads  -> pindahkan file lama di uploads/ ke blob store
+#   python lampiran.py --laporan          -> laporan deduplikasi uploads/ dan blob store
+#   python lampiran.py --gc               -> hapus blob tanpa referensi, file sementara dan turunannya
+import argparse
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import time
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(os.getcwd(), "uploads"))
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+
+# Ukuran potongan saat menyalin + meng-hash stream upload
+CHUNK_SIZE = 64 * 1024
+# File blob tanpa baris di tabel blobs baru dianggap yatim setelah umur ini (detik),
+# agar upload yang transaksinya belum commit tidak ikut terhapus oleh --gc
+UMUR_MIN_YATIM = 3600
+
+TIPE_KLARIFIKASI = 'klarifikasi'
+TIPE_CUTI = 'cuti'
+
+
+# --- Blob Store ---
+def path_blob(sha256, folder=None):
+    """Lokasi file blob: <folder>/ab/cd/<sha256>."""
+    return os.path.join(folder or BLOB_FOLDER, sha256[:2], sha256[2:4], sha256)
+
+
+def path_relatif(sha256):
+    """Lokasi blob relatif terhadap UPLOAD_FOLDER (disimpan di kolom file_bukti/file_surat_cuti)."""
+    return "/".join(["blobs", sha256[:2], sha256[2:4], sha256])
+
+
+def simpan_stream(stream, folder=None):
+    """
+    Menyalin stream ke blob store sambil menghitung SHA-256-nya. File ditulis ke
+    file sementara di folder yang sama lalu dipindah secara atomik; jika isi yang
+    sama sudah ada, file sementara dibuang. Return (sha256, ukuran).
+    """
+    folder = folder or BLOB_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    hasher = hashlib.sha256()
+    ukuran = 0
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                potongan = stream.read(CHUNK_SIZE)
+                if not potongan:
+                    break
+                hasher.update(potongan)
+                tmp.write(potongan)
+                ukuran += len(potongan)
+        sha256 = hasher.hexdigest()
+        tujuan = path_blob(sha256, folder)
+        if os.path.exists(tujuan):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(tujuan), exist_ok=True)
+            os.replace(tmp_path, tujuan)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, ukuran
+
+
+def simpan_upload(conn, file, folder=None):
+    """
+    Menyimpan FileStorage (request.files) ke blob store dan mencatatnya di tabel
+    blobs. Tidak melakukan commit. Return sha256.
+    """
+    sha256, ukuran = simpan_stream(file.stream, folder)
+    mimetype = file.mimetype or mimetypes.guess_type(file.filename or "")[0] or "application/octet-stream"
+    conn.execute(
+        "INSERT OR IGNORE INTO blobs (sha256, ukuran, mimetype) VALUES (?, ?, ?)",
+        (sha256, ukuran, mimetype)
+    )
+    return sha256
+
+
+def lampirkan(conn, tipe, pemilik_ids, sha256, nama_asli):
+    """Menghubungkan satu blob ke satu atau beberapa record (klarifikasi/cuti). Tidak melakukan commit."""
+    # Lampiran lama dihapus eksplisit (bukan INSERT OR REPLACE) agar trigger ref_count ikut jalan
+    conn.executemany(
+        "DELETE FROM attachments WHERE pemilik_tipe = ? AND pemilik_id = ?",
+        [(tipe, pemilik_id) for pemilik_id in pemilik_ids]
+    )
+    conn.executemany(
+        "INSERT INTO attachments (pemilik_tipe, pemilik_id, sha256, nama_asli) VALUES (?, ?, ?, ?)",
+        [(tipe, pemilik_id, sha256, nama_asli) for pemilik_id in pemilik_ids]
+    )
+
+
+def lampiran(conn, tipe, pemilik_id):
+    """Lampiran satu record beserta info blob-nya, atau None."""
+    return conn.execute("""
+        SELECT a.sha256, a.nama_asli, b.ukuran, b.mimetype FROM attachments a
+        JOIN blobs b ON b.sha256 = a.sha256
+        WHERE a.pemilik_tipe = ? AND a.pemilik_id = ?
+    """, (tipe, pemilik_id)).fetchone()
+
+
+def path_lama(path_db, upload_folder=None):
+    """Lokasi file upload lama (sebelum blob store) dari nilai kolom di DB, atau None."""
+    if not path_db:
+        return None
+    # Nilai lama bisa berupa path Windows ("uploads\\nama.jpg")
+    nama = path_db.replace("\\", "/").split("/")[-1]
+    path = os.path.join(upload_folder or UPLOAD_FOLDER, nama)
+    return path if os.path.isfile(path) else None
+
+
+def hapus_yatim(conn, folder=None):
+    """
+    Menghapus blob dengan ref_count 0 (baris dan file-nya), serta file di blob store
+    yang tidak tercatat di tabel blobs (upload yang transaksinya gagal) dan lebih tua
+    dari UMUR_MIN_YATIM. Tidak melakukan commit. Return jumlah file dihapus.
+    """
+    folder = folder or BLOB_FOLDER
+    yatim = [row[0] for row in conn.execute("SELECT sha256 FROM blobs WHERE ref_count <= 0")]
+    conn.executemany("DELETE FROM blobs WHERE sha256 = ?", [(sha256,) for sha256 in yatim])
+    dihapus = 0
+    for sha256 in yatim:
+        path = path_blob(sha256, folder)
+        if os.path.exists(path):
+            os.remove(path)
+            dihapus += 1
+
+    tercatat = {row[0] for row in conn.execute("SELECT sha256 FROM blobs")}
+    batas = time.time() - UMUR_MIN_YATIM
+    for akar, _, nama_file in os.walk(folder):
+        for nama in nama_file:
+            path = os.path.join(akar, nama)
+            if nama not in tercatat and os.path.getmtime(path) < batas:
+                os.remove(path)
+                dihapus += 1
+    return dihapus
+
+
+# --- Migrasi Upload Lama ---
+def migrasi_uploads(conn, upload_folder=None, folder=None):
+    """
+    Memindahkan file yang dirujuk clarifications.file_bukti dan cuti_dosen.file_surat_cuti
+    ke blob store (file asli tidak dihapus), membuat baris attachments, dan mengganti
+    kolom path dengan lokasi blob. Tidak melakukan commit. Return ringkasan hitungan.
+    """
+    hasil = {'dipindah': 0, 'sudah': 0, 'hilang': []}
+    sumber = (
+        (TIPE_KLARIFIKASI, "SELECT id, file_bukti FROM clarifications WHERE file_bukti IS NOT NULL AND file_bukti != ''",
+         "UPDATE clarifications SET file_bukti = ? WHERE id = ?"),
+        (TIPE_CUTI, "SELECT id, file_surat_cuti FROM cuti_dosen WHERE file_surat_cuti IS NOT NULL AND file_surat_cuti != ''",
+         "UPDATE cuti_dosen SET file_surat_cuti = ? WHERE id = ?"),
+    )
+    for tipe, query, update in sumber:
+        for pemilik_id, path_db in conn.execute(query).fetchall():
+            if lampiran(conn, tipe, pemilik_id):
+                hasil['sudah'] += 1
+                continue
+            path = path_lama(path_db, upload_folder)
+            if not path:
+                hasil['hilang'].append(f"{tipe} #{pemilik_id}: {path_db}")
+                continue
+            with open(path, "rb") as f:
+                sha256, ukuran = simpan_stream(f, folder)
+            conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, ukuran, mimetype) VALUES (?, ?, ?)",
+                (sha256, ukuran, mimetypes.guess_type(path)[0] or "application/octet-stream")
+            )
+            lampirkan(conn, tipe, [pemilik_id], sha256, os.path.basename(path))
+            conn.execute(update, (path_relatif(sha256), pemilik_id))
+            hasil['dipindah'] += 1
+    return hasil
+
+
+def laporan_dedup(conn, upload_folder=None):
+    """
+    Laporan deduplikasi: file lama di uploads/ dikelompokkan menurut isi (SHA-256)
+    dan dibandingkan dengan isi blob store. Return dict ringkasan.
+    """
+    upload_folder = upload_folder or UPLOAD_FOLDER
+    per_isi = {}
+    if os.path.isdir(upload_folder):
+        for nama in sorted(os.listdir(upload_folder)):
+            path = os.path.join(upload_folder, nama)
+            if not os.path.isfile(path):
+                continue
+            hasher = hashlib.sha256()
+            with open(path, "rb") as f:
+                for potongan in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(potongan)
+            sha256 = hasher.hexdigest()
+            per_isi.setdefault(sha256, []).append((nama, os.path.getsize(path)))
+
+    total_file = sum(len(daftar) for daftar in per_isi.values())
+    total_byte = sum(ukuran for daftar in per_isi.values() for _, ukuran in daftar)
+    unik_byte = sum(daftar[0][1] for daftar in per_isi.values())
+    blob = conn.execute("SELECT COUNT(*), COALESCE(SUM(ukuran), 0), COALESCE(SUM(ref_count), 0) FROM blobs").fetchone()
+    return {
+        'uploads_file': total_file,
+        'uploads_isi_unik': len(per_isi),
+        'uploads_byte': total_byte,
+        'uploads_byte_unik': unik_byte,
+        'duplikat': {sha256: [nama for nama, _ in daftar] for sha256, daftar in per_isi.items() if len(daftar) > 1},
+        'blob_jumlah': blob[0],
+        'blob_byte': blob[1],
+        'lampiran_jumlah': blob[2],
+    }
+
+
+if __name__ == '__main__':
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Pemeliharaan blob store lampiran")
+    parser.add_argument('--migrasi-uploads', action='store_true', help="pindahkan file lama di uploads/ ke blob store")
+    parser.add_argument('--laporan', action='store_true', help="laporan deduplikasi")
+    parser.add_argument('--gc', action='store_true', help="hapus blob tanpa referensi")
+    parser.add_argument('--uploads', default=UPLOAD_FOLDER, help="folder upload (default: ./uploads)")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+    folder_blob = os.path.join(args.uploads, "blobs")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        apply_migrations(conn)
+        if args.migrasi_uploads:
+            hasil = migrasi_uploads(conn, args.uploads, folder_blob)
+            conn.commit()
+            print(f"Migrasi uploads: {hasil['dipindah']} lampiran dipindah, {hasil['sudah']} sudah ada di blob store.")
+            for pesan in hasil['hilang']:
+                print(f"  file tidak ditemukan: {pesan}")
+        if args.gc:
+            jumlah = hapus_yatim(conn, folder_blob)
+            conn.commit()
+            print(f"GC: {jumlah} file blob tanpa referensi dihapus.")
+            import pratinjau
+            jumlah = pratinjau.hapus_turunan_yatim(conn, os.path.join(args.uploads, "turunan"))
+            print(f"GC: {jumlah} file turunan (thumbnail/pratinjau) dihapus.")
+        if args.laporan or not (args.migrasi_uploads or args.gc):
+            hasil = laporan_dedup(conn, args.uploads)
+            hemat = hasil['uploads_byte'] - hasil['uploads_byte_unik']
+            print(f"uploads/: {hasil['uploads_file']} file, {hasil['uploads_isi_unik']} isi unik, "
+                  f"{hasil['uploads_byte'] / 1024:.0f} KB (unik {hasil['uploads_byte_unik'] / 1024:.0f} KB, "
+                  f"duplikat {hemat / 1024:.0f} KB)")
+            for sha256, nama_file in hasil['duplikat'].items():
+                print(f"  {sha256[:12]}  x{len(nama_file)}: {', '.join(nama_file)}")
+            print(f"blob store: {hasil['blob_jumlah']} blob, {hasil['blob_byte'] / 1024:.0f} KB, "
+                  f"{hasil['lampiran_jumlah']} lampiran")
+    finally:
+        conn.close()
@@ -0,0 +1,224 @@
+# metrik.py
+# Metrik performa per request: latensi, status, ukuran respons, serta jumlah dan
+# total waktu statement SQL per request (diukur oleh KoneksiTerukur di db.py).
+# Semuanya dikeluarkan dalam format teks Prometheus lewat rute /metrics (khusus
+# Admin, atau token METRIK_TOKEN untuk scraper).
+#
+# Registry disimpan di memori proses: setiap worker gunicorn punya angkanya
+# sendiri (sama seperti cache.statistik()); label `pid` di app_info membedakannya.
+#
+# Log request lambat (opsional):
+#   METRIK_LAMBAT_MS=1000        -> request >= 1 detik dicatat ke log (0 = mati)
+#   METRIK_PROFIL_SAMPEL=0.05    -> 5% request diprofil dengan cProfile; profil
+#                                   request yang lambat ditulis ke log
+#   METRIK_PROFIL_FOLDER=profil  -> profil lambat juga disimpan sebagai file .prof
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+import cache
+import db
+
+METRIK_AKTIF = os.getenv("METRIK_AKTIF", "1") != "0"
+METRIK_TOKEN = os.getenv("METRIK_TOKEN")
+METRIK_LAMBAT_MS = int(os.getenv("METRIK_LAMBAT_MS", "1000"))
+METRIK_PROFIL_SAMPEL = float(os.getenv("METRIK_PROFIL_SAMPEL", "0"))
+METRIK_PROFIL_FOLDER = os.getenv("METRIK_PROFIL_FOLDER")
+# Jumlah baris fungsi teratas (urut waktu kumulatif) dari profil yang ditulis ke log
+METRIK_PROFIL_BARIS = 25
+
+BUCKET_DURASI = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKET_DURASI_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BUCKET_UKURAN = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+BUCKET_JUMLAH_SQL = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_WAKTU_MULAI = time.time()
+
+
+# --- Registry ---
+def _label(nama_label, nilai_label, tambahan=""):
+    isi = ",".join(
+        '%s="%s"' % (nama, str(nilai).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for nama, nilai in zip(nama_label, nilai_label)
+    )
+    if tambahan:
+        isi = f"{isi},{tambahan}" if isi else tambahan
+    return "{%s}" % isi if isi else ""
+
+
+def _angka(nilai):
+    return repr(float(nilai)) if isinstance(nilai, float) else str(nilai)
+
+
+class Counter:
+    def __init__(self, nama, keterangan, label=()):
+        self.nama, self.keterangan, self.label = nama, keterangan, tuple(label)
+        self._nilai = {}
+
+    def tambah(self, *nilai_label, jumlah=1):
+        self._nilai[nilai_label] = self._nilai.get(nilai_label, 0) + jumlah
+
+    def teks(self):
+        baris = [f"# HELP {self.nama} {self.keterangan}", f"# TYPE {self.nama} counter"]
+        for nilai_label, nilai in sorted(self._nilai.items()):
+            baris.append(f"{self.nama}{_label(self.label, nilai_label)} {_angka(nilai)}")
+        return baris
+
+
+class Histogram:
+    def __init__(self, nama, keterangan, bucket, label=()):
+        self.nama, self.keterangan, self.label = nama, keterangan, tuple(label)
+        self.bucket = tuple(bucket)
+        self._nilai = {}  # label -> [jumlah per bucket (+Inf terakhir), total nilai]
+
+    def amati(self, nilai, *nilai_label):
+        data = self._nilai.get(nilai_label)
+        if data is None:
+            data = self._nilai[nilai_label] = [[0] * (len(self.bucket) + 1), 0]
+        data[0][bisect_left(self.bucket, nilai)] += 1
+        data[1] += nilai
+
+    def teks(self):
+        baris = [f"# HELP {self.nama} {self.keterangan}", f"# TYPE {self.nama} histogram"]
+        for nilai_label, (per_bucket, total) in sorted(self._nilai.items()):
+            kumulatif = 0
+            for batas, jumlah in zip(self.bucket + ("+Inf",), per_bucket):
+                kumulatif += jumlah
+                le = 'le="%s"' % (batas if batas == "+Inf" else _angka(batas))
+                baris.append(f"{self.nama}_bucket{_label(self.label, nilai_label, le)} {kumulatif}")
+            baris.append(f"{self.nama}_sum{_label(self.label, nilai_label)} {_angka(total)}")
+            baris.append(f"{self.nama}_count{_label(self.label, nilai_label)} {kumulatif}")
+        return baris
+
+
+_lock = threading.Lock()
+permintaan = Counter("http_requests_total", "Jumlah request per endpoint, metode dan status.",
+                     ("endpoint", "method", "status"))
+durasi = Histogram("http_request_duration_seconds", "Latensi request sampai respons siap dikirim (detik).",
+                   BUCKET_DURASI, ("endpoint", "method"))
+ukuran = Histogram("http_response_size_bytes", "Ukuran body respons (byte), jika diketahui.",
+                   BUCKET_UKURAN, ("endpoint",))
+jumlah_sql = Histogram("http_request_sql_queries", "Jumlah statement SQL per request.",
+                       BUCKET_JUMLAH_SQL, ("endpoint",))
+durasi_sql = Histogram("http_request_sql_duration_seconds", "Total waktu SQL per request (detik).",
+                       BUCKET_DURASI_SQL, ("endpoint",))
+lambat = Counter("http_slow_requests_total", f"Request yang melewati batas lambat ({METRIK_LAMBAT_MS} ms).",
+                 ("endpoint",))
+METRIK = (permintaan, durasi, ukuran, jumlah_sql, durasi_sql, lambat)
+
+
+def catat(endpoint, method, status, detik, byte, pencatat):
+    with _lock:
+        permintaan.tambah(endpoint, method, str(status))
+        durasi.amati(detik, endpoint, method)
+        if byte is not None:
+            ukuran.amati(byte, endpoint)
+        if pencatat is not None:
+            jumlah_sql.amati(pencatat.jumlah, endpoint)
+            durasi_sql.amati(pencatat.durasi, endpoint)
+
+
+def _teks_cache():
+    # Hit/miss cache aplikasi (cache.py) di proses ini
+    baris = ["# HELP app_cache_requests_total Lookup cache aplikasi per nama cache dan hasil.",
+             "# TYPE app_cache_requests_total counter"]
+    for nama, angka in sorted(cache.statistik()['cache'].items()):
+        for hasil in ('hit', 'miss'):
+            baris.append(f'app_cache_requests_total{_label(("cache", "hasil"), (nama, hasil))} {angka[hasil]}')
+    return baris
+
+
+def render():
+    """Semua metrik proses ini dalam format teks Prometheus (versi 0.0.4)."""
+    baris = [
+        "# HELP app_info Proses aplikasi yang menjawab scrape ini.",
+        "# TYPE app_info gauge",
+        f'app_info{{pid="{os.getpid()}"}} 1',
+        "# HELP process_start_time_seconds Waktu mulai proses (unix epoch).",
+        "# TYPE process_start_time_seconds gauge",
+        f"process_start_time_seconds {_angka(_WAKTU_MULAI)}",
+    ]
+    with _lock:
+        for metrik in METRIK:
+            baris.extend(metrik.teks())
+    baris.extend(_teks_cache())
+    return "\n".join(baris) + "\n"
+
+
+def boleh_scrape(session):
+    """Admin yang login, atau header `Authorization: Bearer <METRIK_TOKEN>` jika token diset."""
+    if session.get('user_role') == 'Admin':
+        return True
+    return bool(METRIK_TOKEN) and request.headers.get("Authorization") == f"Bearer {METRIK_TOKEN}"
+
+
+# --- Middleware ---
+def _tulis_profil(profiler, endpoint):
+    keluaran = io.StringIO()
+    pstats.Stats(profiler, stream=keluaran).sort_stats("cumulative").print_stats(METRIK_PROFIL_BARIS)
+    if METRIK_PROFIL_FOLDER:
+        os.makedirs(METRIK_PROFIL_FOLDER, exist_ok=True)
+        nama = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}.prof"
+        profiler.dump_stats(os.path.join(METRIK_PROFIL_FOLDER, nama))
+    return keluaran.getvalue()
+
+
+def _mulai():
+    g._metrik_mulai = time.perf_counter()
+    g._metrik_sql = db.mulai_pencatatan()
+    g._metrik_profil = None
+    if METRIK_PROFIL_SAMPEL > 0 and random.random() < METRIK_PROFIL_SAMPEL:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g._metrik_profil = profiler
+        except ValueError:
+            # Profiler lain sedang aktif di thread ini (mis. debugger)
+            pass
+
+
+def _selesai(app):
+    def selesai(response):
+        mulai = g.pop('_metrik_mulai', None)
+        if mulai is None:
+            return response
+        detik = time.perf_counter() - mulai
+        profiler = g.pop('_metrik_profil', None)
+        if profiler is not None:
+            profiler.disable()
+        pencatat = g.pop('_metrik_sql', None)
+        endpoint = request.endpoint or 'none'
+        # send_file dan respons biasa mengisi Content-Length; stream tanpa panjang tidak diukur
+        catat(endpoint, request.method, response.status_code, detik, response.content_length, pencatat)
+
+        if METRIK_LAMBAT_MS and detik * 1000 >= METRIK_LAMBAT_MS:
+            with _lock:
+                lambat.tambah(endpoint)
+            sql = f"sql={pencatat.jumlah} ({pencatat.durasi * 1000:.0f}ms)" if pencatat else ""
+            app.logger.warning(f"Request lambat: {request.method} {request.path} endpoint={endpoint} "
+                               f"status={response.status_code} {detik * 1000:.0f}ms {sql}")
+            if profiler is not None:
+                app.logger.warning(f"Profil {endpoint}:\n{_tulis_profil(profiler, endpoint)}")
+        return response
+    return selesai
+
+
+def _bersihkan(exc=None):
+    # Pencatat tidak boleh terbawa ke request berikutnya di thread yang sama
+    db.selesai_pencatatan()
+
+
+def init_app(app):
+    """Dipasang sebelum ekstensi lain agar before_request-nya berjalan paling awal."""
+    if not METRIK_AKTIF:
+        return
+    app.before_request(_mulai)
+    app.after_request(_selesai(app))
+    app.teardown_request(_bersihkan)
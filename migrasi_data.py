@@ -1,114 +1,312 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
 import pandas as pd
 import sqlite3
+from openpyxl import load_workbook
 from werkzeug.security import generate_password_hash
+from migrations import apply_migrations
+import rekap
+import cuti
+import cache
 
 # --- KONFIGURASI ---
 # Ubah nama file ini setiap kali Anda ingin migrasi data dari bulan baru
-EXCEL_FILE = "db_agustus.xlsx" 
+# (atau berikan nama file sebagai argumen: python migrasi_data.py db_agustus.xlsx)
+EXCEL_FILE = "db_agustus.xlsx"
 DB_FILE = "database.db"
 ATTENDANCE_SHEETS = ['BP', 'BT', 'PKH', 'RPK', 'THP']
 USERS_SHEET = 'data_akses'
 
-def run_migration():
-    conn = None
+# Jumlah user baru minimal sebelum hashing password dijalankan paralel
+HASH_PARALLEL_THRESHOLD = 16
+# Jumlah baris absensi per potongan (chunk) saat membaca Excel secara streaming
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+# Jumlah proses pembaca sheet paralel (0 = sesuai jumlah CPU)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "0"))
+
+ATTENDANCE_COLUMNS = ['nip', 'nama_lengkap', 'jurusan', 'detail jurusan', 'tanggal', 'jam masuk', 'jam pulang']
+
+
+# --- Normalisasi (vektorisasi pandas, tanpa iterrows) ---
+def _format_jam(series):
+    """
+    Mengubah kolom jam dari Excel (datetime.time / datetime / teks 'HH:MM[:SS]')
+    menjadi teks 'HH:MM:SS.ffffff' seperti yang dipakai aplikasi. Kosong -> None.
+    """
+    terisi = series.notna()
+    teks = series.astype(str).str.strip()
+    durasi = pd.to_timedelta(teks.where(terisi, ''), errors='coerce')
+    # Sel berisi tanggal+jam (mis. '2025-07-01 07:44:00') -> ambil bagian jamnya
+    sisa = durasi.isna() & terisi & (teks != '')
+    if sisa.any():
+        waktu = pd.to_datetime(teks[sisa], errors='coerce', format='mixed')
+        durasi[sisa] = waktu - waktu.dt.normalize()
+
+    mikro = (durasi.dt.total_seconds() * 1_000_000).round()
+    valid = mikro.notna()
+    mikro = mikro.fillna(0).astype(np.int64) % (24 * 3600 * 1_000_000)
+    detik, us = np.divmod(mikro, 1_000_000)
+    jam, detik = np.divmod(detik, 3600)
+    menit, detik = np.divmod(detik, 60)
+    hasil = (
+        jam.astype(str).str.zfill(2) + ':' + menit.astype(str).str.zfill(2) + ':'
+        + detik.astype(str).str.zfill(2) + '.' + us.astype(str).str.zfill(6)
+    )
+    return hasil.where(valid, None).astype(object)
+
+
+def normalisasi_absensi(df):
+    """DataFrame mentah dari sheet absensi -> baris siap tulis (unik per nip & tanggal)."""
+    df = df.copy()
+    for kolom in ATTENDANCE_COLUMNS:
+        if kolom not in df.columns:
+            df[kolom] = None
+
+    df['nip'] = df['nip'].astype('string').str.strip()
+    tanggal = pd.to_datetime(df['tanggal'], errors='coerce')
+    df['tanggal'] = tanggal.dt.strftime('%Y-%m-%d') + ' 00:00:00'  # Tambahkan jam default
+    df['jam masuk'] = _format_jam(df['jam masuk'])
+    df['jam pulang'] = _format_jam(df['jam pulang'])
+
+    df = df[df['nip'].notna() & (df['nip'] != '') & tanggal.notna()]
+    df = df.drop_duplicates(subset=['nip', 'tanggal'], keep='first')
+    df = df[ATTENDANCE_COLUMNS].astype(object)
+    return df.where(df.notna(), None)
+
+
+def baca_users(excel_file):
+    df_users = pd.read_excel(excel_file, sheet_name=USERS_SHEET, dtype={'nip': str})
+    df_users['nip'] = df_users['nip'].str.strip()
+    df_users = df_users[df_users['nip'].notna() & (df_users['nip'] != '')]
+    return df_users.drop_duplicates(subset=['nip'], keep='first')
+
+
+# --- Pembacaan Absensi Secara Streaming ---
+# Sheet dibaca baris demi baris dengan openpyxl read_only, sehingga memori yang
+# dipakai sebanding dengan CHUNK_SIZE, bukan dengan ukuran workbook.
+def iter_chunks_sheets(excel_file, sheets, chunk_size=CHUNK_SIZE):
+    """
+    Menghasilkan list tuple (urutan ATTENDANCE_COLUMNS) per potongan dari beberapa sheet.
+    Workbook hanya dibuka sekali: load_workbook memindai ukuran semua sheet saat dibuka.
+    """
+    wb = load_workbook(excel_file, read_only=True, data_only=True)
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        print(f"Berhasil terhubung ke database {DB_FILE}")
-
-        # --- 1. Migrasi Tabel Users (Mode Cerdas: Tambah/Update) ---
-        print("\nMemulai migrasi data user...")
-        df_users = pd.read_excel(EXCEL_FILE, sheet_name=USERS_SHEET, dtype={'nip': str})
-        
-        for index, row in df_users.iterrows():
-            nip = row['nip']
-            cursor.execute("SELECT nip FROM users WHERE nip = ?", (nip,))
-            data_exists = cursor.fetchone()
-
-            if not data_exists:
-                # Jika user belum ada, tambahkan user baru
-                print(f"  -> Menambahkan user baru: {row['nama_lengkap']}")
-                # Password default sama dengan NIP saat user baru dibuat
-                hashed_password = generate_password_hash(nip) 
-                # Menambahkan 'jatah_cuti_tahunan' dengan nilai default 12
-                cursor.execute("""
-                    INSERT INTO users (nip, password, nama_lengkap, jurusan, "detail jurusan", role, jatah_cuti_tahunan)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (nip, hashed_password, row['nama_lengkap'], row['jurusan'], row['detail jurusan'], row['role'], 12))
-            # Jika user sudah ada, kita tidak melakukan apa-apa untuk menjaga data yang ada (password, jatah_cuti, dll)
-
-        print("-> Migrasi data user selesai.")
-
-
-        # --- 2. Migrasi Tabel Attendance (Mode Aditif: Hanya Menambah Data Baru) ---
-        print("\nMemulai migrasi data absensi...")
-        all_dfs = [pd.read_excel(EXCEL_FILE, sheet_name=sheet, dtype={'nip': str}) for sheet in ATTENDANCE_SHEETS]
-        df_combined = pd.concat(all_dfs, ignore_index=True)
-        
-        added_count = 0
-        skipped_count = 0
-        for index, row in df_combined.iterrows():
-            nip_absen = row['nip']
-            # Konversi tanggal dari Excel ke format yang konsisten (YYYY-MM-DD)
-            tanggal_absen_obj = pd.to_datetime(row['tanggal']).date()
-            tanggal_absen_str = tanggal_absen_obj.strftime('%Y-%m-%d')
-
-            # Cek apakah data absensi untuk NIP dan tanggal tersebut sudah ada
-            cursor.execute("SELECT rowid FROM attendance WHERE nip = ? AND date(tanggal) = ?", (nip_absen, tanggal_absen_str))
-            record_exists = cursor.fetchone()
-
-            if not record_exists:
-                # Jika belum ada, masukkan sebagai data baru
-                full_tanggal_str = f"{tanggal_absen_str} 00:00:00" # Tambahkan jam default
-                cursor.execute("""
-                    INSERT INTO attendance (nip, nama_lengkap, jurusan, "detail jurusan", tanggal, "jam masuk", "jam pulang", status, keterangan)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, 'Hadir', '')
-                """, (nip_absen, row['nama_lengkap'], row['jurusan'], row['detail jurusan'], full_tanggal_str, row['jam masuk'], row['jam pulang']))
-                added_count += 1
+        for sheet in sheets:
+            rows = wb[sheet].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            header = [str(h).strip() if h is not None else None for h in header]
+            buffer = []
+            for row in rows:
+                if not any(v is not None for v in row):
+                    continue
+                buffer.append(row)
+                if len(buffer) >= chunk_size:
+                    yield _normalisasi_chunk(buffer, header)
+                    buffer = []
+            if buffer:
+                yield _normalisasi_chunk(buffer, header)
+    finally:
+        wb.close()
+
+
+def _normalisasi_chunk(rows, header):
+    df = pd.DataFrame.from_records(rows, columns=header)
+    df = df.loc[:, [kolom for kolom in df.columns if kolom in ATTENDANCE_COLUMNS]]
+    return list(normalisasi_absensi(df).itertuples(index=False, name=None))
+
+
+def _produsen_sheets(excel_file, sheets, chunk_size, antrian):
+    # Dijalankan di proses pembaca: kirim setiap potongan ke proses penulis
+    try:
+        for chunk in iter_chunks_sheets(excel_file, sheets, chunk_size):
+            antrian.put(('chunk', chunk))
+        antrian.put(('selesai', None))
+    except Exception as e:
+        antrian.put(('error', f"Sheet {', '.join(sheets)}: {e}"))
+
+
+def stream_absensi(excel_file, sheets=ATTENDANCE_SHEETS, chunk_size=CHUNK_SIZE, workers=IMPORT_WORKERS):
+    """
+    Menghasilkan potongan baris absensi dari semua sheet. Dengan workers > 1 sheet
+    dibagi ke beberapa proses pembaca; antrian dibatasi agar pembaca tidak bisa
+    jauh mendahului penulis (memori tetap datar).
+    """
+    sheets = list(sheets)
+    workers = min(workers or os.cpu_count() or 1, len(sheets))
+    if workers <= 1:
+        yield from iter_chunks_sheets(excel_file, sheets, chunk_size)
+        return
+
+    kelompok = [sheets[i::workers] for i in range(workers)]
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, ProcessPoolExecutor(workers, mp_context=context) as executor:
+        antrian = manager.Queue(maxsize=workers * 2)
+        for bagian in kelompok:
+            executor.submit(_produsen_sheets, excel_file, bagian, chunk_size, antrian)
+        sisa = len(kelompok)
+        while sisa:
+            jenis, isi = antrian.get()
+            if jenis == 'chunk':
+                yield isi
+            elif jenis == 'selesai':
+                sisa -= 1
             else:
-                skipped_count += 1
-        
-        print(f"-> Migrasi absensi selesai. Data baru ditambahkan: {added_count}, Data duplikat dilewati: {skipped_count}.")
-
-
-        # --- 3. Pembuatan Tabel Lainnya (Mode Aman: Hanya Jika Belum Ada) ---
-        # Menggunakan "CREATE TABLE IF NOT EXISTS" agar tidak menghapus tabel yang sudah ada
-        
-        print("\nMemeriksa tabel 'clarifications'...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS clarifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, nip TEXT NOT NULL, nama_lengkap TEXT NOT NULL,
-            jurusan TEXT NOT NULL, tanggal_klarifikasi TEXT NOT NULL, kategori_surat TEXT NOT NULL,
-            jenis_surat TEXT NOT NULL, file_bukti TEXT, status TEXT DEFAULT 'Menunggu Persetujuan Kajur',
-            alasan_penolakan TEXT, tanggal_pengajuan TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            tanggal_proses TIMESTAMP
-        );
-        """)
-        print("-> Tabel 'clarifications' sudah siap.")
-
-        print("\nMemeriksa tabel 'cuti_dosen'...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cuti_dosen (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, nip TEXT NOT NULL, nama_lengkap TEXT NOT NULL,
-            tanggal_surat TEXT NOT NULL, tanggal_mulai TEXT NOT NULL, tanggal_selesai TEXT NOT NULL,
-            jenis_cuti TEXT NOT NULL, alasan_cuti TEXT, file_surat_cuti TEXT, diinput_oleh TEXT,
-            tanggal_input TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        print("-> Tabel 'cuti_dosen' sudah siap.")
-        
-        # Simpan semua perubahan ke database
+                raise RuntimeError(isi)
+
+
+# --- Penulisan ke Database (set-based, satu transaksi) ---
+def impor_users(conn, df_users, paralel=True):
+    """
+    Mode Cerdas: hanya menambah user baru, user lama tidak disentuh. Return (ditambah, dilewati).
+    paralel=False menghitung hash di proses ini saja (dipakai oleh request web).
+    """
+    existing = {row[0] for row in conn.execute("SELECT nip FROM users")}
+    baru = df_users[~df_users['nip'].isin(existing)]
+    # Password default sama dengan NIP saat user baru dibuat. Hash (scrypt) sengaja
+    # lambat, jadi untuk impor awal yang besar dihitung paralel di beberapa proses.
+    if paralel and len(baru) > HASH_PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor() as executor:
+            hashes = list(executor.map(generate_password_hash, baru['nip'], chunksize=16))
+    else:
+        hashes = [generate_password_hash(nip) for nip in baru['nip']]
+    rows = [
+        # Menambahkan 'jatah_cuti_tahunan' dengan nilai default 12
+        (r.nip, hashed_password, r.nama_lengkap, r.jurusan, r.detail_jurusan, r.role, 12)
+        for r, hashed_password in zip(baru.rename(columns={'detail jurusan': 'detail_jurusan'}).itertuples(index=False), hashes)
+    ]
+    conn.executemany("""
+        INSERT INTO users (nip, password, nama_lengkap, jurusan, "detail jurusan", role, jatah_cuti_tahunan)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    if rows:
+        cache.naikkan_versi(conn, 'pengguna')
+    return len(rows), len(df_users) - len(rows)
+
+
+def impor_absensi_chunks(conn, chunks):
+    """
+    Mode Aditif: hanya menambah (nip, tanggal) yang belum ada.
+    Setiap potongan ditulis ke tabel staging lalu dipindahkan dengan satu
+    INSERT ... SELECT yang memakai indeks (nip, tanggal_hari). Rekap absensi untuk
+    rentang tanggal yang diimpor ikut dihitung ulang. Tidak melakukan commit;
+    seluruh impor tetap satu transaksi. Return (ditambah, dilewati).
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.staging_absensi")
+    conn.execute("""
+        CREATE TEMP TABLE staging_absensi (
+            nip TEXT, nama_lengkap TEXT, jurusan TEXT, "detail jurusan" TEXT,
+            tanggal TEXT, "jam masuk" TEXT, "jam pulang" TEXT
+        )
+    """)
+    added = total = 0
+    awal = akhir = None
+    nips = set()
+    for chunk in chunks:
+        nips.update(row[0] for row in chunk)
+        if chunk:
+            tanggal_chunk = [row[4][:10] for row in chunk]
+            awal = min(tanggal_chunk) if awal is None else min(awal, *tanggal_chunk)
+            akhir = max(tanggal_chunk) if akhir is None else max(akhir, *tanggal_chunk)
+        conn.executemany("INSERT INTO staging_absensi VALUES (?, ?, ?, ?, ?, ?, ?)", chunk)
+        added += conn.execute("""
+            INSERT INTO attendance (nip, nama_lengkap, jurusan, "detail jurusan", tanggal, "jam masuk", "jam pulang", status, keterangan)
+            SELECT s.nip, s.nama_lengkap, s.jurusan, s."detail jurusan", s.tanggal, s."jam masuk", s."jam pulang", 'Hadir', ''
+            FROM staging_absensi s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM attendance a WHERE a.nip = s.nip AND a.tanggal_hari = date(s.tanggal)
+            )
+        """).rowcount
+        conn.execute("DELETE FROM staging_absensi")
+        total += len(chunk)
+    conn.execute("DROP TABLE temp.staging_absensi")
+    if added:
+        rekap.refresh_rekap(conn, awal=awal, akhir=akhir)
+        cuti.refresh_ledger(conn, awal=awal, akhir=akhir)
+        # Cache data absensi (global, per pegawai dan per bulan yang diimpor) kedaluwarsa saat commit
+        cache.naikkan_versi(conn, 'absensi', *(f"nip:{nip}" for nip in nips), *rekap.kunci_bulan(awal, akhir))
+    return added, total - added
+
+
+def impor_absensi(conn, df_absensi):
+    """Versi DataFrame dari impor_absensi_chunks (data yang sudah dinormalisasi)."""
+    return impor_absensi_chunks(conn, [list(df_absensi.itertuples(index=False, name=None))])
+
+
+def impor_excel(conn, excel_file, chunk_size=CHUNK_SIZE, workers=IMPORT_WORKERS):
+    """
+    Mengimpor users + absensi dari satu workbook dalam satu transaksi.
+    Dipakai oleh CLI dan oleh rute upload Admin. Mengembalikan ringkasan hitungan.
+    workers=1 berjalan serial sepenuhnya (tanpa ProcessPool untuk sheet maupun hash).
+    """
+    apply_migrations(conn)
+    df_users = baca_users(excel_file)
+
+    try:
+        users_added, users_skipped = impor_users(conn, df_users, paralel=workers != 1)
+        attendance_added, attendance_skipped = impor_absensi_chunks(
+            conn, stream_absensi(excel_file, chunk_size=chunk_size, workers=workers)
+        )
         conn.commit()
-        print("\nProses migrasi selesai! Database telah diperbarui dengan aman.")
+    except Exception:
+        conn.rollback()  # Batalkan semua perubahan jika terjadi error
+        raise
+
+    return {
+        'users_added': users_added, 'users_skipped': users_skipped,
+        'attendance_added': attendance_added, 'attendance_skipped': attendance_skipped,
+    }
+
+
+def run_migration(excel_file=EXCEL_FILE, db_file=DB_FILE, chunk_size=CHUNK_SIZE, workers=IMPORT_WORKERS,
+                  lacak_sql=False):
+    # Diimpor di sini: proses pembaca sheet (spawn) mengimpor ulang modul ini dan tidak butuh Flask
+    import db
+    import jejak_sql
+
+    conn = None
+    try:
+        # KoneksiTerukur agar statement bisa dijejak (--lacak-sql, lihat jejak_sql.py)
+        conn = sqlite3.connect(db_file, factory=db.KoneksiTerukur)
+        print(f"Berhasil terhubung ke database {db_file}")
+        mulai = time.perf_counter()
+        with jejak_sql.lacak(f"impor {excel_file}") if lacak_sql else nullcontext() as jejak:
+            hasil = impor_excel(conn, excel_file, chunk_size=chunk_size, workers=workers)
+        if jejak is not None:
+            cetak_jejak(jejak.ringkasan())
+        print(f"-> User baru ditambahkan: {hasil['users_added']}, sudah ada: {hasil['users_skipped']}.")
+        print(f"-> Migrasi absensi selesai. Data baru ditambahkan: {hasil['attendance_added']}, Data duplikat dilewati: {hasil['attendance_skipped']}.")
+        print(f"\nProses migrasi selesai dalam {time.perf_counter() - mulai:.2f} detik! Database telah diperbarui dengan aman.")
+        return hasil
 
     except Exception as e:
         print(f"\n[ERROR] Terjadi kesalahan: {e}")
-        if conn:
-            conn.rollback() # Batalkan semua perubahan jika terjadi error
 
     finally:
         if conn:
             conn.close() # Pastikan koneksi selalu ditutup
 
+
+def cetak_jejak(ringkasan):
+    print(f"\nJejak SQL: {ringkasan['jumlah']} statement, {ringkasan['durasi_ms']:.0f} ms")
+    for data in ringkasan['bentuk'][:10]:
+        tanda = "  <-- dugaan N+1" if data['n_plus_1'] else ""
+        print(f"  {data['jumlah']:>6}x {data['durasi_ms']:>9.1f} ms  {data['bentuk'][:90]}{tanda}")
+
+
 if __name__ == '__main__':
-    run_migration()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Impor data user & absensi dari file Excel bulanan.")
+    parser.add_argument('excel_file', nargs='?', default=EXCEL_FILE)
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=IMPORT_WORKERS, help="proses pembaca sheet paralel (0 = jumlah CPU)")
+    parser.add_argument('--lacak-sql', action='store_true', help="cetak ringkasan statement SQL dan dugaan N+1")
+    args = parser.parse_args()
+    run_migration(args.excel_file, args.db, args.chunk_size, args.workers, args.lacak_sql)
@@ -0,0 +1,329 @@
+# migrations.py
+# Migrasi skema database berversi. Versi yang sudah terpasang disimpan di
+# PRAGMA user_version, sehingga setiap migrasi hanya dijalankan satu kali.
+#
+# Pemakaian:
+#   python migrations.py            -> jalankan semua migrasi yang belum terpasang
+#   python migrations.py --status   -> tampilkan versi skema saat ini
+import os
+import sqlite3
+import sys
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+
+
+# --- Daftar Migrasi ---
+# Setiap migrasi berupa fungsi yang menerima koneksi. Jangan pernah mengubah
+# migrasi yang sudah dirilis; tambahkan migrasi baru di bagian bawah.
+
+def _m001_skema_dasar(conn):
+    # Skema awal (sama dengan database.db yang sudah berjalan di produksi),
+    # supaya database kosong juga bisa dipakai.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            nip TEXT PRIMARY KEY, password TEXT NOT NULL, nama_lengkap TEXT,
+            jurusan TEXT, "detail jurusan" TEXT, role TEXT,
+            id_atasan TEXT, jatah_cuti_tahunan INTEGER DEFAULT 12, push_subscription_info TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance (
+            nip TEXT NOT NULL, nama_lengkap TEXT, jurusan TEXT, "detail jurusan" TEXT,
+            tanggal TEXT NOT NULL, "jam masuk" TEXT, "jam pulang" TEXT,
+            status TEXT, keterangan TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clarifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nip_pengaju TEXT, nama_lengkap TEXT, jurusan TEXT,
+            tanggal_klarifikasi TEXT, kategori_surat TEXT, jenis_surat TEXT, file_bukti TEXT,
+            status_final TEXT, catatan_revisi TEXT, nip_approver_sekarang TEXT,
+            tanggal_pengajuan TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cuti_dosen (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nip TEXT NOT NULL, nama_lengkap TEXT,
+            tanggal_surat TEXT, tanggal_mulai TEXT, tanggal_selesai TEXT,
+            jenis_cuti TEXT, alasan_cuti TEXT, file_surat_cuti TEXT, diinput_oleh TEXT,
+            tanggal_input TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _m002_indeks_absensi(conn):
+    # Kolom tanggal ternormalisasi (YYYY-MM-DD). Kolom ini "generated" sehingga
+    # selalu sinkron dengan kolom tanggal tanpa perlu trigger.
+    kolom = [row[1] for row in conn.execute("PRAGMA table_xinfo(attendance)")]
+    if 'tanggal_hari' not in kolom:
+        conn.execute(
+            "ALTER TABLE attendance ADD COLUMN tanggal_hari TEXT "
+            "GENERATED ALWAYS AS (date(tanggal)) VIRTUAL"
+        )
+
+    # attendance: filter per pegawai per tanggal / rentang tanggal
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_nip_tanggal ON attendance (nip, tanggal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_nip_hari ON attendance (nip, tanggal_hari)")
+    # attendance: rekap bulanan seluruh pegawai
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_tanggal ON attendance (tanggal)")
+
+    # clarifications: daftar tugas approver, riwayat pengaju, rekap bulanan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clarifications_approver ON clarifications (nip_approver_sekarang)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clarifications_pengaju ON clarifications (nip_pengaju, tanggal_pengajuan)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clarifications_tanggal ON clarifications (tanggal_klarifikasi)")
+
+    # users: daftar bawahan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_atasan ON users (id_atasan)")
+
+
+def _m003_outbox_notifikasi(conn):
+    # Antrian notifikasi push yang dikirim oleh worker di latar belakang
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target_nip TEXT NOT NULL, title TEXT NOT NULL, body TEXT, url TEXT DEFAULT '/',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TIMESTAMP, last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, sent_at TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON notification_outbox (status, next_attempt_at)")
+
+
+def _m004_push_subscriptions(conn):
+    # Satu baris per perangkat (endpoint), banyak perangkat per NIP,
+    # sekaligus menyimpan metrik pengiriman per endpoint.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS push_subscriptions (
+            endpoint TEXT PRIMARY KEY, nip TEXT NOT NULL, subscription_info TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_success_at TIMESTAMP,
+            success_count INTEGER NOT NULL DEFAULT 0, failure_count INTEGER NOT NULL DEFAULT 0,
+            consecutive_failures INTEGER NOT NULL DEFAULT 0,
+            total_latency_ms REAL NOT NULL DEFAULT 0, last_latency_ms REAL,
+            last_status INTEGER, last_error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_push_subscriptions_nip ON push_subscriptions (nip)")
+    # Pindahkan subscription lama (satu per user) dari kolom users.push_subscription_info
+    conn.execute("""
+        INSERT OR IGNORE INTO push_subscriptions (endpoint, nip, subscription_info)
+        SELECT json_extract(push_subscription_info, '$.endpoint'), nip, push_subscription_info
+        FROM users
+        WHERE push_subscription_info IS NOT NULL
+          AND json_valid(push_subscription_info)
+          AND json_extract(push_subscription_info, '$.endpoint') IS NOT NULL
+    """)
+
+
+def _m005_rekap_absensi(conn):
+    # Rekap absensi yang dihitung sebelumnya (lihat rekap.py). Kunci diawali
+    # tanggal agar laporan satu bulan untuk semua pegawai cukup membaca satu rentang.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_daily_code (
+            tanggal_hari TEXT NOT NULL, nip TEXT NOT NULL, kode TEXT NOT NULL,
+            PRIMARY KEY (tanggal_hari, nip)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_monthly_summary (
+            bulan TEXT NOT NULL, nip TEXT NOT NULL,
+            KT INTEGER NOT NULL DEFAULT 0, PK INTEGER NOT NULL DEFAULT 0,
+            NF INTEGER NOT NULL DEFAULT 0, FL INTEGER NOT NULL DEFAULT 0,
+            CT INTEGER NOT NULL DEFAULT 0, IZ INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bulan, nip)
+        ) WITHOUT ROWID
+    """)
+    # Isi awal dari data yang sudah ada
+    import rekap
+    rekap.rebuild_rekap(conn)
+
+
+def _m006_ledger_cuti(conn):
+    # Ledger hari cuti dan saldo terpakai per tahun (lihat cuti.py), pengganti
+    # COUNT + LIKE '%Cuti Tahunan%' pada attendance di setiap request.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS leave_ledger (
+            nip TEXT NOT NULL, tanggal_hari TEXT NOT NULL, tahun INTEGER NOT NULL,
+            jenis TEXT NOT NULL, cuti_id INTEGER,
+            PRIMARY KEY (nip, tanggal_hari)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS leave_balance (
+            nip TEXT NOT NULL, tahun INTEGER NOT NULL, jenis TEXT NOT NULL,
+            terpakai INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (nip, tahun, jenis)
+        ) WITHOUT ROWID
+    """)
+    # Mencari surat cuti yang mencakup suatu hari (kolom cuti_id di ledger)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cuti_dosen_nip_mulai ON cuti_dosen(nip, tanggal_mulai)")
+    # Isi awal dari data yang sudah ada
+    import cuti
+    cuti.rebuild_ledger(conn)
+
+
+def _m007_hierarki_pengguna(conn):
+    # Closure table atasan-bawahan (lihat hierarki.py). Primary key diawali
+    # atasan_nip agar seluruh bawahan satu pimpinan cukup dibaca satu rentang.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users_hierarchy (
+            atasan_nip TEXT NOT NULL, bawahan_nip TEXT NOT NULL, kedalaman INTEGER NOT NULL,
+            PRIMARY KEY (atasan_nip, bawahan_nip)
+        ) WITHOUT ROWID
+    """)
+    # Isi awal dari data yang sudah ada
+    import hierarki
+    hierarki.rebuild_hierarki(conn)
+
+
+def _m008_hari_libur(conn):
+    # Kalender hari libur (lihat cuti.hari_kerja): tanggal YYYY-MM-DD yang dilewati
+    # saat menghitung hari kerja cuti, di luar Sabtu-Minggu.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS hari_libur (
+            tanggal TEXT PRIMARY KEY, keterangan TEXT
+        ) WITHOUT ROWID
+    """)
+
+
+def _m009_versi_data(conn):
+    # Kunci versi untuk invalidasi cache (lihat cache.py); dinaikkan oleh jalur tulis
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versi (
+            kunci TEXT PRIMARY KEY, versi INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def _m010_lampiran(conn):
+    # Blob store lampiran (lihat lampiran.py): satu baris per isi file unik, dan
+    # attachments yang menghubungkan klarifikasi/surat cuti ke blob. ref_count
+    # dijaga trigger sehingga selalu sama dengan jumlah attachments per blob.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY, ukuran INTEGER NOT NULL, mimetype TEXT,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            dibuat TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pemilik_tipe TEXT NOT NULL, pemilik_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL REFERENCES blobs(sha256), nama_asli TEXT,
+            dibuat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (pemilik_tipe, pemilik_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_attachments_tambah AFTER INSERT ON attachments
+        BEGIN UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.sha256; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_attachments_hapus AFTER DELETE ON attachments
+        BEGIN UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256; END
+    """)
+
+
+def _m011_arsip_laporan(conn):
+    # Arsip workbook laporan bulanan yang dibuat di latar belakang (lihat arsip_laporan.py):
+    # satu baris per bulan berisi status job terakhir dan versi data yang dipakai file-nya
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS arsip_laporan (
+            bulan TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'antri',
+            versi TEXT, berkas TEXT, ukuran INTEGER, durasi_ms INTEGER, error TEXT,
+            diminta_pada TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            mulai_pada TIMESTAMP, selesai_pada TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+
+
+def _m012_ekspor_periode(conn):
+    # Job ekspor rekap multi-bulan (lihat ekspor_periode.py): progres disimpan di DB
+    # agar endpoint polling bisa dilayani worker gunicorn mana pun
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ekspor_periode (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dari TEXT NOT NULL, sampai TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'antri',
+            tugas_selesai INTEGER NOT NULL DEFAULT 0, tugas_total INTEGER NOT NULL DEFAULT 0,
+            berkas TEXT, error TEXT, durasi_ms INTEGER, diminta_oleh TEXT,
+            dibuat_pada TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            diperbarui_pada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+MIGRATIONS = [
+    (1, "skema dasar", _m001_skema_dasar),
+    (2, "indeks absensi, klarifikasi dan atasan", _m002_indeks_absensi),
+    (3, "outbox notifikasi push", _m003_outbox_notifikasi),
+    (4, "push subscription multi-perangkat", _m004_push_subscriptions),
+    (5, "rekap absensi harian dan bulanan", _m005_rekap_absensi),
+    (6, "ledger dan saldo cuti", _m006_ledger_cuti),
+    (7, "indeks hierarki atasan-bawahan", _m007_hierarki_pengguna),
+    (8, "kalender hari libur", _m008_hari_libur),
+    (9, "kunci versi cache", _m009_versi_data),
+    (10, "blob store lampiran", _m010_lampiran),
+    (11, "arsip workbook laporan", _m011_arsip_laporan),
+    (12, "job ekspor periode", _m012_ekspor_periode),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# --- Fungsi Bantuan ---
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, sampai_versi=None, verbose=False):
+    """
+    Menjalankan semua migrasi yang belum terpasang, masing-masing dalam satu transaksi.
+    Aman dijalankan bersamaan oleh beberapa worker gunicorn (BEGIN IMMEDIATE).
+    """
+    target = LATEST_VERSION if sampai_versi is None else sampai_versi
+    if current_version(conn) >= target:
+        return current_version(conn)
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # transaksi diatur manual
+    try:
+        for nomor, keterangan, migrasi in MIGRATIONS:
+            if nomor > target:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Cek ulang di dalam transaksi: worker lain mungkin sudah menjalankannya
+                if current_version(conn) >= nomor:
+                    conn.execute("COMMIT")
+                    continue
+                migrasi(conn)
+                conn.execute(f"PRAGMA user_version = {int(nomor)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if verbose:
+                print(f"  -> Migrasi {nomor:03d} ({keterangan}) terpasang.")
+    finally:
+        conn.isolation_level = isolation_level
+
+    return current_version(conn)
+
+
+if __name__ == '__main__':
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        if '--status' in sys.argv:
+            print(f"Versi skema {DB_FILE}: {current_version(conn)} (terbaru: {LATEST_VERSION})")
+        else:
+            print(f"Menjalankan migrasi untuk {DB_FILE} (versi saat ini: {current_version(conn)})")
+            versi = apply_migrations(conn, verbose=True)
+            print(f"Selesai. Versi skema sekarang: {versi}")
+    finally:
+        conn.close()
@@ -0,0 +1,333 @@
+# notifications.py
+# Outbox notifikasi push. Request web hanya menulis baris ke tabel
+# notification_outbox (di transaksi yang sama dengan perubahan datanya);
+# pengiriman ke push service dilakukan dispatcher di latar belakang, baik
+# sebagai thread di dalam proses web maupun sebagai proses `worker` (worker.py).
+#
+# Satu baris outbox = satu notifikasi logis untuk satu NIP. Dispatcher
+# menyebarkannya ke semua perangkat NIP tersebut (tabel push_subscriptions).
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from pywebpush import webpush, WebPushException
+
+import db
+
+# --- VAPID keys (ambil dari environment) ---
+VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
+VAPID_MAILTO = os.getenv("VAPID_MAILTO", "admin@example.com")
+VAPID_CLAIMS = {"sub": f"mailto:{VAPID_MAILTO}"}
+
+MAX_WORKERS = int(os.getenv("NOTIFICATION_MAX_WORKERS", "8"))
+BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "50"))
+POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "2"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = int(os.getenv("NOTIFICATION_BACKOFF_BASE", "30"))    # detik
+BACKOFF_MAX = int(os.getenv("NOTIFICATION_BACKOFF_MAX", "3600"))    # detik
+PUSH_TIMEOUT = float(os.getenv("NOTIFICATION_PUSH_TIMEOUT", "10"))  # detik
+# Baris 'sending' yang lebih tua dari ini dianggap milik worker yang mati
+CLAIM_TIMEOUT = int(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", "300"))  # detik
+# Endpoint yang gagal berturut-turut sebanyak ini dianggap mati dan dihapus
+PRUNE_AFTER_FAILURES = int(os.getenv("NOTIFICATION_PRUNE_AFTER_FAILURES", "10"))
+
+# Kode HTTP dari push service yang berarti subscription sudah tidak berlaku
+GONE_STATUS_CODES = (404, 410)
+
+
+# --- Sisi Web: Subscription & Menulis ke Outbox ---
+def save_subscription(conn, nip, subscription_data):
+    """Menyimpan (atau memperbarui) satu perangkat milik NIP. Tidak melakukan commit."""
+    endpoint = subscription_data.get('endpoint') if isinstance(subscription_data, dict) else None
+    if not endpoint:
+        raise ValueError("Subscription tidak memiliki endpoint")
+    conn.execute(
+        """
+        INSERT INTO push_subscriptions (endpoint, nip, subscription_info) VALUES (?, ?, ?)
+        ON CONFLICT (endpoint) DO UPDATE SET
+            nip = excluded.nip, subscription_info = excluded.subscription_info,
+            consecutive_failures = 0
+        """,
+        (endpoint, nip, json.dumps(subscription_data))
+    )
+
+
+def enqueue_notification(conn, target_nip, title, body, url="/"):
+    """
+    Menambahkan notifikasi ke outbox. Tidak melakukan commit: panggil sebelum
+    conn.commit() supaya notifikasi ikut tersimpan bersama perubahan datanya.
+    """
+    conn.execute(
+        "INSERT INTO notification_outbox (target_nip, title, body, url) VALUES (?, ?, ?, ?)",
+        (target_nip, title, body, url)
+    )
+
+
+def enqueue_notification_batch(conn, rows):
+    """Banyak notifikasi berbeda sekaligus (satu executemany). rows: (target_nip, title, body, url)."""
+    conn.executemany(
+        "INSERT INTO notification_outbox (target_nip, title, body, url) VALUES (?, ?, ?, ?)",
+        rows
+    )
+
+
+# --- Sisi Worker: Pengiriman ---
+class DeliveryResult:
+    def __init__(self, ok, status_code=None, error=None, retry=True):
+        self.ok = ok
+        self.status_code = status_code
+        self.error = error
+        self.latency_ms = None
+        # Subscription yang sudah tidak berlaku tidak perlu dicoba ulang
+        self.retry = retry and not self.gone
+
+    @property
+    def gone(self):
+        return self.status_code in GONE_STATUS_CODES
+
+
+def _make_http_session(pool_size=MAX_WORKERS):
+    # Satu session bersama: koneksi HTTPS ke FCM/Mozilla dipakai ulang (keep-alive)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_http_session = _make_http_session()
+
+
+def webpush_sender(subscription_info, payload):
+    """Pengirim default: memanggil push service lewat pywebpush."""
+    try:
+        response = webpush(
+            subscription_info=subscription_info,
+            data=json.dumps(payload),
+            vapid_private_key=VAPID_PRIVATE_KEY,
+            vapid_claims=VAPID_CLAIMS.copy(),
+            timeout=PUSH_TIMEOUT,
+            requests_session=_http_session,
+        )
+        return DeliveryResult(True, getattr(response, 'status_code', None))
+    except WebPushException as ex:
+        status_code = ex.response.status_code if ex.response is not None else None
+        return DeliveryResult(False, status_code, str(ex).strip())
+    except Exception as e:
+        return DeliveryResult(False, None, str(e))
+
+
+def backoff_seconds(attempts):
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+
+
+class OutboxDispatcher:
+    """
+    Mengambil batch notifikasi dari outbox, mengirimnya ke semua perangkat
+    penerima secara paralel lewat thread pool, lalu mencatat hasilnya
+    (sent / retry dengan backoff / failed) beserta metrik per endpoint.
+    `sender` bisa diganti, mis. untuk pengujian dengan push endpoint lokal.
+    """
+
+    def __init__(self, database=None, sender=webpush_sender, max_workers=MAX_WORKERS,
+                 batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+        self.database = database
+        self.sender = sender
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="push")
+        self._stop = threading.Event()
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = db.connect(self.database)
+        return self._conn
+
+    def claim_batch(self):
+        # Klaim atomik: baris yang sudah diklaim tidak akan diambil worker lain
+        rows = self.conn.execute(
+            """
+            UPDATE notification_outbox
+            SET status = 'sending', claimed_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM notification_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP)
+                   OR (status = 'sending' AND claimed_at <= datetime('now', ?))
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, target_nip, title, body, url, attempts
+            """,
+            (f"-{CLAIM_TIMEOUT} seconds", self.batch_size)
+        ).fetchall()
+        self.conn.commit()
+        return rows
+
+    def load_subscriptions(self, nips):
+        """Semua perangkat untuk sekumpulan NIP, dalam satu query: {nip: [(endpoint, info), ...]}"""
+        if not nips:
+            return {}
+        placeholders = ', '.join('?' for _ in nips)
+        rows = self.conn.execute(
+            f"SELECT nip, endpoint, subscription_info FROM push_subscriptions WHERE nip IN ({placeholders})",
+            list(nips)
+        ).fetchall()
+        hasil = {}
+        for row in rows:
+            hasil.setdefault(row['nip'], []).append((row['endpoint'], row['subscription_info']))
+        return hasil
+
+    def _deliver(self, row, subscription_json):
+        try:
+            subscription_info = json.loads(subscription_json)
+        except ValueError as e:
+            return DeliveryResult(False, 410, f"Subscription rusak: {e}")
+        payload = {"title": row['title'], "body": row['body'], "url": row['url']}
+        mulai = time.perf_counter()
+        result = self.sender(subscription_info, payload)
+        result.latency_ms = (time.perf_counter() - mulai) * 1000
+        return result
+
+    def _record_endpoint(self, endpoint, result):
+        if result.ok:
+            self.conn.execute(
+                """
+                UPDATE push_subscriptions
+                SET success_count = success_count + 1, consecutive_failures = 0,
+                    total_latency_ms = total_latency_ms + ?, last_latency_ms = ?,
+                    last_status = ?, last_error = NULL, last_success_at = CURRENT_TIMESTAMP
+                WHERE endpoint = ?
+                """,
+                (result.latency_ms, result.latency_ms, result.status_code, endpoint)
+            )
+        elif result.gone:
+            self.conn.execute("DELETE FROM push_subscriptions WHERE endpoint = ?", (endpoint,))
+            print(f"Subscription {endpoint[:60]}... kadaluarsa ({result.status_code}), dihapus.")
+        else:
+            self.conn.execute(
+                """
+                UPDATE push_subscriptions
+                SET failure_count = failure_count + 1, consecutive_failures = consecutive_failures + 1,
+                    total_latency_ms = total_latency_ms + ?, last_latency_ms = ?,
+                    last_status = ?, last_error = ?
+                WHERE endpoint = ?
+                """,
+                (result.latency_ms or 0, result.latency_ms, result.status_code, result.error, endpoint)
+            )
+
+    def prune_dead_endpoints(self):
+        cursor = self.conn.execute(
+            "DELETE FROM push_subscriptions WHERE consecutive_failures >= ?", (PRUNE_AFTER_FAILURES,)
+        )
+        if cursor.rowcount:
+            print(f"{cursor.rowcount} endpoint push mati dihapus (gagal {PRUNE_AFTER_FAILURES}x berturut-turut).")
+        return cursor.rowcount
+
+    def run_once(self):
+        """Memproses satu batch. Mengembalikan jumlah notifikasi (baris outbox) yang diproses."""
+        rows = self.claim_batch()
+        if not rows:
+            return 0
+
+        subscriptions = self.load_subscriptions({row['target_nip'] for row in rows})
+        # Fan-out: satu task per (notifikasi, perangkat), semuanya berjalan paralel
+        tasks = {
+            row['id']: [
+                (endpoint, self.executor.submit(self._deliver, row, info))
+                for endpoint, info in subscriptions.get(row['target_nip'], [])
+            ]
+            for row in rows
+        }
+
+        for row in rows:
+            attempts = row['attempts'] + 1
+            results = []
+            for endpoint, future in tasks[row['id']]:
+                result = future.result()
+                self._record_endpoint(endpoint, result)
+                results.append(result)
+
+            if any(r.ok for r in results):
+                self.conn.execute(
+                    "UPDATE notification_outbox SET status = 'sent', attempts = ?, sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+                    (attempts, row['id'])
+                )
+                continue
+
+            error = results[-1].error if results else "Tidak ada perangkat terdaftar untuk NIP ini"
+            if not any(r.retry for r in results) or attempts >= MAX_ATTEMPTS:
+                self.conn.execute(
+                    "UPDATE notification_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, error, row['id'])
+                )
+                if results:
+                    print(f"GAGAL MENGIRIM NOTIFIKASI #{row['id']} ke NIP {row['target_nip']} setelah {attempts} percobaan: {error}")
+            else:
+                self.conn.execute(
+                    """
+                    UPDATE notification_outbox
+                    SET status = 'pending', attempts = ?, last_error = ?,
+                        next_attempt_at = datetime('now', ?)
+                    WHERE id = ?
+                    """,
+                    (attempts, error, f"+{backoff_seconds(attempts)} seconds", row['id'])
+                )
+        self.prune_dead_endpoints()
+        self.conn.commit()
+        return len(rows)
+
+    def run_forever(self):
+        print(f"Dispatcher notifikasi berjalan (batch {self.batch_size}, interval {self.poll_interval} detik)")
+        try:
+            while not self._stop.is_set():
+                try:
+                    processed = self.run_once()
+                except Exception as e:
+                    print(f"[ERROR] Dispatcher notifikasi: {e}")
+                    if self._conn is not None:
+                        self._conn.rollback()
+                    processed = 0
+                # Kalau batch penuh, langsung ambil batch berikutnya tanpa menunggu
+                if processed < self.batch_size:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self.close()
+
+    def stop(self):
+        """Meminta run_forever berhenti setelah batch yang sedang berjalan selesai."""
+        self._stop.set()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def endpoint_stats(conn):
+    """Metrik per endpoint untuk halaman admin."""
+    rows = conn.execute(
+        """
+        SELECT s.nip, u.nama_lengkap, s.endpoint, s.success_count, s.failure_count,
+               s.consecutive_failures, s.last_status, s.last_error, s.last_success_at, s.created_at,
+               CASE WHEN s.success_count + s.failure_count > 0
+                    THEN s.total_latency_ms / (s.success_count + s.failure_count) END AS avg_latency_ms,
+               s.last_latency_ms
+        FROM push_subscriptions s LEFT JOIN users u ON u.nip = s.nip
+        ORDER BY s.consecutive_failures DESC, s.nip
+        """
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def start_background_dispatcher():
+    """Menjalankan dispatcher sebagai daemon thread di dalam proses web."""
+    dispatcher = OutboxDispatcher()
+    thread = threading.Thread(target=dispatcher.run_forever, name="notification-dispatcher", daemon=True)
+    thread.start()
+    return dispatcher
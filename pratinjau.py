@@ -0,0 +1,176 @@
+# pratinjau.py
+# Turunan gambar lampiran: thumbnail kecil dan pratinjau web (JPEG terkompresi)
+# untuk setiap blob gambar di blob store (lihat lampiran.py). Scan halaman yang
+# ukurannya ratusan KB cukup dilihat sekilas oleh approver, jadi preview_bukti
+# mengirim pratinjau ini; file asli hanya dikirim oleh download_bukti.
+#
+# Turunan dibuat di thread pool latar belakang setelah upload ter-commit, disimpan
+# di uploads/turunan/ab/cd/<sha256>-<varian>.jpg dan tidak pernah berubah (isi blob
+# tetap). Pillow bersifat opsional: tanpa Pillow, atau untuk lampiran non-gambar
+# (PDF), pratinjau tidak dibuat dan file asli yang dikirim.
+#
+# Pemakaian:
+#   python pratinjau.py --semua   -> buat turunan untuk semua blob gambar yang belum punya
+#   python pratinjau.py --gc      -> hapus turunan yang blob-nya sudah tidak ada
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import lampiran
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow opsional
+    Image = None
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+TURUNAN_FOLDER = os.path.join(lampiran.UPLOAD_FOLDER, "turunan")
+
+PRATINJAU_WORKERS = int(os.getenv("PRATINJAU_WORKERS", "2"))
+# Varian turunan: sisi terpanjang (px) dan kualitas JPEG
+VARIAN = {
+    'thumb': (320, 70),
+    'preview': (1600, 80),
+}
+# Gambar lebih besar dari ini (piksel) tidak diproses (perlindungan decompression bomb)
+MAKS_PIKSEL = 60_000_000
+
+
+def tersedia():
+    return Image is not None
+
+
+def bisa_diproses(mimetype):
+    return tersedia() and bool(mimetype) and mimetype.startswith("image/") and mimetype != "image/svg+xml"
+
+
+def path_turunan(sha256, varian, folder=None):
+    """Lokasi file turunan: <folder>/ab/cd/<sha256>-<varian>.jpg."""
+    return os.path.join(folder or TURUNAN_FOLDER, sha256[:2], sha256[2:4], f"{sha256}-{varian}.jpg")
+
+
+# --- Pembuatan Turunan ---
+def _simpan_jpeg(gambar, tujuan, kualitas):
+    # Ditulis ke file sementara lalu dipindah atomik agar request tidak membaca file setengah jadi
+    os.makedirs(os.path.dirname(tujuan), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".turunan-", dir=os.path.dirname(tujuan))
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            gambar.save(tmp, "JPEG", quality=kualitas, optimize=True, progressive=True)
+        os.replace(tmp_path, tujuan)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def buat_turunan(sha256, folder_blob=None, folder=None):
+    """
+    Membuat semua varian untuk satu blob gambar dari yang terbesar ke terkecil
+    (thumbnail diperkecil dari hasil pratinjau, bukan dari file asli). Varian yang
+    sudah ada dilewati. Return daftar varian yang dibuat.
+    """
+    dibuat = []
+    belum = [v for v in sorted(VARIAN, key=lambda v: -VARIAN[v][0])
+             if not os.path.exists(path_turunan(sha256, v, folder))]
+    if not belum:
+        return dibuat
+    with Image.open(lampiran.path_blob(sha256, folder_blob)) as asli:
+        if asli.width * asli.height > MAKS_PIKSEL:
+            raise ValueError(f"gambar terlalu besar: {asli.width}x{asli.height}")
+        # JPEG didekode langsung pada skala kecil jika memungkinkan (jauh lebih cepat)
+        asli.draft("RGB", (VARIAN[belum[0]][0],) * 2)
+        gambar = ImageOps.exif_transpose(asli)
+        if gambar.mode in ("RGBA", "LA", "P"):
+            # Transparansi (screenshot PNG) diratakan ke latar putih
+            rgba = gambar.convert("RGBA")
+            gambar = Image.new("RGB", rgba.size, "white")
+            gambar.paste(rgba, mask=rgba.getchannel("A"))
+        elif gambar.mode != "RGB":
+            gambar = gambar.convert("RGB")
+        for varian in belum:
+            sisi, kualitas = VARIAN[varian]
+            gambar.thumbnail((sisi, sisi), Image.LANCZOS)
+            _simpan_jpeg(gambar, path_turunan(sha256, varian, folder), kualitas)
+            dibuat.append(varian)
+    return dibuat
+
+
+class PembuatTurunan:
+    """Thread pool pembuat turunan; satu blob tidak pernah diproses dua kali bersamaan."""
+
+    def __init__(self, max_workers=PRATINJAU_WORKERS, folder_blob=None, folder=None):
+        self.folder_blob = folder_blob
+        self.folder = folder
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pratinjau")
+        self._antri = set()
+        self._lock = threading.Lock()
+
+    def jadwalkan(self, sha256, mimetype):
+        """Menjadwalkan pembuatan turunan jika blob berupa gambar. Return True jika dijadwalkan."""
+        if not bisa_diproses(mimetype):
+            return False
+        with self._lock:
+            if sha256 in self._antri:
+                return True
+            self._antri.add(sha256)
+        self.executor.submit(self._proses, sha256)
+        return True
+
+    def _proses(self, sha256):
+        try:
+            buat_turunan(sha256, self.folder_blob, self.folder)
+        except Exception as e:
+            # File rusak/format tak dikenal: preview_bukti tetap mengirim file asli
+            print(f"Gagal membuat pratinjau {sha256[:12]}: {e}")
+        finally:
+            with self._lock:
+                self._antri.discard(sha256)
+
+    def tunggu(self):
+        self.executor.shutdown(wait=True)
+
+
+def hapus_turunan_yatim(conn, folder=None):
+    """Menghapus file turunan yang blob-nya sudah tidak ada di tabel blobs. Return jumlah file."""
+    folder = folder or TURUNAN_FOLDER
+    tercatat = {row[0] for row in conn.execute("SELECT sha256 FROM blobs")}
+    dihapus = 0
+    for akar, _, nama_file in os.walk(folder):
+        for nama in nama_file:
+            if nama.split("-")[0] not in tercatat:
+                os.remove(os.path.join(akar, nama))
+                dihapus += 1
+    return dihapus
+
+
+if __name__ == '__main__':
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Turunan gambar lampiran (thumbnail dan pratinjau)")
+    parser.add_argument('--semua', action='store_true', help="buat turunan untuk semua blob gambar")
+    parser.add_argument('--gc', action='store_true', help="hapus turunan tanpa blob")
+    parser.add_argument('--uploads', default=lampiran.UPLOAD_FOLDER, help="folder upload (default: ./uploads)")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+    folder_blob = os.path.join(args.uploads, "blobs")
+    folder_turunan = os.path.join(args.uploads, "turunan")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        apply_migrations(conn)
+        if args.semua:
+            if not tersedia():
+                raise SystemExit("Pillow belum terpasang (pip install Pillow).")
+            pembuat = PembuatTurunan(folder_blob=folder_blob, folder=folder_turunan)
+            jumlah = sum(pembuat.jadwalkan(sha256, mimetype)
+                         for sha256, mimetype in conn.execute("SELECT sha256, mimetype FROM blobs"))
+            pembuat.tunggu()
+            print(f"Turunan diperiksa/dibuat untuk {jumlah} blob gambar.")
+        if args.gc:
+            print(f"GC: {hapus_turunan_yatim(conn, folder_turunan)} file turunan dihapus.")
+    finally:
+        conn.close()
@@ -0,0 +1,378 @@
+# rekap.py
+# Rekap absensi yang sudah dihitung sebelumnya (materialized):
+#   attendance_daily_code  -> satu kode (KT/PK/NF/FL/CT/IZ) per (nip, tanggal)
+#   attendance_monthly_summary -> jumlah tiap kode per (nip, bulan)
+# Kedua tabel diperbarui secara inkremental oleh impor Excel, proses_klarifikasi,
+# submit_klarifikasi dan input_cuti, sehingga laporan bulanan cukup membaca hasilnya.
+#
+# Pemakaian:
+#   python rekap.py --rebuild              -> hitung ulang seluruh rekap
+#   python rekap.py --check [--bulan YYYY-MM] -> cek konsistensi rekap dengan data mentah
+import argparse
+import calendar
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from klasifikasi import KODE_REKAP, kode_rekap_batch
+
+DB_FILE = os.getenv("DATABASE", "database.db")
+
+# Rentang laporan terpanjang yang boleh diminta (hari)
+MAKS_HARI_LAPORAN = 366
+
+
+def _filter(nip, awal, akhir, kolom_nip, kolom_tanggal):
+    # Membuat klausa WHERE untuk cakupan (nip, rentang tanggal inklusif YYYY-MM-DD)
+    kondisi, params = [], []
+    if nip is not None:
+        kondisi.append(f"{kolom_nip} = ?")
+        params.append(nip)
+    if awal is not None:
+        kondisi.append(f"{kolom_tanggal} >= ?")
+        params.append(awal)
+    if akhir is not None:
+        kondisi.append(f"{kolom_tanggal} < ?")
+        params.append(_hari_berikutnya(akhir))
+    return (" WHERE " + " AND ".join(kondisi)) if kondisi else "", params
+
+
+def _hari_berikutnya(tanggal):
+    return (datetime.strptime(tanggal[:10], '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+
+
+def hitung_kode(conn, nip=None, awal=None, akhir=None):
+    """
+    Menghitung kode harian langsung dari attendance + clarifications untuk cakupan
+    tertentu, diklasifikasi sekaligus dengan klasifikasi.kode_rekap_batch().
+    Mengembalikan dict {(nip, tanggal_hari): kode}.
+    """
+    where, params = _filter(nip, awal, akhir, "nip_pengaju", "tanggal_klarifikasi")
+    where = where + (" AND " if where else " WHERE ") + "status_final LIKE 'Disetujui%'"
+    df_klarifikasi = pd.read_sql_query(
+        f"SELECT nip_pengaju AS nip, substr(tanggal_klarifikasi, 1, 10) AS tanggal_hari, kategori_surat AS kategori "
+        f"FROM clarifications{where} ORDER BY id",
+        conn, params=params
+    ).drop_duplicates(['nip', 'tanggal_hari'], keep='last')
+
+    where, params = _filter(nip, awal, akhir, "nip", "tanggal_hari")
+    df = pd.read_sql_query(
+        f'SELECT nip, tanggal_hari, status, keterangan, "jam masuk", "jam pulang" '
+        f'FROM attendance{where} ORDER BY rowid',
+        conn, params=params
+    )
+    df = df[df['tanggal_hari'].notna()]
+    if df.empty:
+        return {}
+    df = df.merge(df_klarifikasi, on=['nip', 'tanggal_hari'], how='left', sort=False)
+    df['kode'] = kode_rekap_batch(df)
+    # Jika ada baris ganda untuk hari yang sama, baris valid terakhir (rowid) yang dipakai
+    df = df[df['kode'].notna()].drop_duplicates(['nip', 'tanggal_hari'], keep='last')
+    return dict(zip(zip(df['nip'], df['tanggal_hari']), df['kode']))
+
+
+# --- Pemeliharaan Inkremental ---
+def refresh_rekap(conn, nip=None, awal=None, akhir=None):
+    """
+    Menghitung ulang rekap untuk satu NIP dan/atau rentang tanggal (inklusif).
+    Tidak melakukan commit: dipanggil di dalam transaksi yang mengubah data mentah,
+    sehingga rekap selalu ikut ter-commit atau ter-rollback bersama datanya.
+    """
+    kode_baru = hitung_kode(conn, nip, awal, akhir)
+
+    where, params = _filter(nip, awal, akhir, "nip", "tanggal_hari")
+    conn.execute(f"DELETE FROM attendance_daily_code{where}", params)
+    conn.executemany(
+        "INSERT INTO attendance_daily_code (tanggal_hari, nip, kode) VALUES (?, ?, ?)",
+        ((tanggal_hari, row_nip, kode) for (row_nip, tanggal_hari), kode in kode_baru.items())
+    )
+
+    # Ringkasan bulanan dihitung ulang untuk semua bulan yang tersentuh cakupan
+    where, params = _filter(nip, None, None, "nip", None)
+    if awal:
+        where += (" AND " if where else " WHERE ") + "bulan >= ?"
+        params.append(awal[:7])
+    if akhir:
+        where += (" AND " if where else " WHERE ") + "bulan <= ?"
+        params.append(akhir[:7])
+    conn.execute(f"DELETE FROM attendance_monthly_summary{where}", params)
+
+    where, params = _filter(nip, _awal_bulan(awal), _akhir_bulan(akhir), "nip", "tanggal_hari")
+    jumlah = ", ".join(f"SUM(kode = '{kode}')" for kode in KODE_REKAP)
+    conn.execute(f"""
+        INSERT INTO attendance_monthly_summary (bulan, nip, {", ".join(KODE_REKAP)})
+        SELECT substr(tanggal_hari, 1, 7), nip, {jumlah}
+        FROM attendance_daily_code{where}
+        GROUP BY substr(tanggal_hari, 1, 7), nip
+    """, params)
+    return len(kode_baru)
+
+
+def _awal_bulan(tanggal):
+    return tanggal[:7] + "-01" if tanggal else None
+
+
+def _akhir_bulan(tanggal):
+    if not tanggal:
+        return None
+    tahun, bulan = int(tanggal[:4]), int(tanggal[5:7])
+    return date(tahun, bulan, calendar.monthrange(tahun, bulan)[1]).isoformat()
+
+
+def kunci_bulan(awal, akhir):
+    """Kunci versi cache 'bulan:YYYY-MM' untuk setiap bulan dalam rentang (inklusif)."""
+    tahun, bulan = int(awal[:4]), int(awal[5:7])
+    kunci = []
+    while f"{tahun:04d}-{bulan:02d}" <= akhir[:7]:
+        kunci.append(f"bulan:{tahun:04d}-{bulan:02d}")
+        tahun, bulan = (tahun + 1, 1) if bulan == 12 else (tahun, bulan + 1)
+    return kunci
+
+
+def rebuild_rekap(conn):
+    """Menghitung ulang seluruh rekap dari nol (mis. setelah perubahan aturan klasifikasi)."""
+    conn.execute("DELETE FROM attendance_daily_code")
+    conn.execute("DELETE FROM attendance_monthly_summary")
+    return refresh_rekap(conn)
+
+
+def cek_konsistensi(conn, bulan=None):
+    """
+    Membandingkan rekap tersimpan dengan hasil hitung ulang dari data mentah.
+    Mengembalikan list selisih berupa tuple (tabel, kunci, tersimpan, seharusnya).
+    """
+    awal = _awal_bulan(bulan) if bulan else None
+    akhir = _akhir_bulan(bulan) if bulan else None
+    seharusnya = hitung_kode(conn, awal=awal, akhir=akhir)
+
+    where, params = _filter(None, awal, akhir, "nip", "tanggal_hari")
+    tersimpan = {
+        (row_nip, tanggal_hari): kode
+        for tanggal_hari, row_nip, kode in conn.execute(
+            f"SELECT tanggal_hari, nip, kode FROM attendance_daily_code{where}", params
+        )
+    }
+    selisih = [
+        ('attendance_daily_code', kunci, tersimpan.get(kunci), seharusnya.get(kunci))
+        for kunci in sorted(set(tersimpan) | set(seharusnya))
+        if tersimpan.get(kunci) != seharusnya.get(kunci)
+    ]
+
+    ringkasan = {}
+    for (row_nip, tanggal_hari), kode in seharusnya.items():
+        hitungan = ringkasan.setdefault((row_nip, tanggal_hari[:7]), dict.fromkeys(KODE_REKAP, 0))
+        hitungan[kode] += 1
+    where, params = (" WHERE bulan = ?", [bulan]) if bulan else ("", [])
+    summary_tersimpan = {
+        (row[1], row[0]): dict(zip(KODE_REKAP, row[2:]))
+        for row in conn.execute(
+            f"SELECT bulan, nip, {', '.join(KODE_REKAP)} FROM attendance_monthly_summary{where}", params
+        )
+    }
+    selisih += [
+        ('attendance_monthly_summary', kunci, summary_tersimpan.get(kunci), ringkasan.get(kunci))
+        for kunci in sorted(set(summary_tersimpan) | set(ringkasan))
+        if summary_tersimpan.get(kunci) != ringkasan.get(kunci)
+    ]
+    return selisih
+
+
+# --- Mesin Laporan ---
+def bulan_terakhir(conn):
+    """Bulan (YYYY-MM) terakhir yang memiliki data rekap, atau bulan ini jika kosong."""
+    row = conn.execute("SELECT max(tanggal_hari) FROM attendance_daily_code").fetchone()
+    return row[0][:7] if row and row[0] else datetime.now().strftime('%Y-%m')
+
+
+def kolom_laporan(awal, akhir):
+    """
+    Kolom tanggal laporan untuk rentang inklusif. Dalam satu bulan label berupa
+    nomor hari (seperti laporan bulanan lama), lintas bulan berupa 'dd/mm'.
+    """
+    mulai = date.fromisoformat(awal)
+    jumlah_hari = (date.fromisoformat(akhir) - mulai).days + 1
+    satu_bulan = awal[:7] == akhir[:7]
+    kolom = []
+    for i in range(jumlah_hari):
+        hari = mulai + timedelta(days=i)
+        kolom.append({'key': hari.isoformat(), 'label': hari.day if satu_bulan else hari.strftime('%d/%m')})
+    return kolom
+
+
+def laporan(conn, awal, akhir):
+    """
+    Menyusun data laporan untuk rentang tanggal inklusif (YYYY-MM-DD) hanya dari
+    tabel rekap. Pegawai diindeks datar per NIP sehingga setiap kode cukup satu
+    lookup dict (O(baris), tidak bergantung jumlah unit).
+    Struktur: [{'nama_jurusan', 'staff_data': [{'nama', 'absensi': {tanggal: kode}, 'summary'}]}]
+    """
+    all_staff = conn.execute(
+        "SELECT nip, nama_lengkap, jurusan, \"detail jurusan\" FROM users WHERE role != 'Admin' ORDER BY jurusan, nama_lengkap"
+    ).fetchall()
+
+    report_data = {}
+    staff_index = {}
+    for nip, nama_lengkap, jurusan, detail_jurusan in all_staff:
+        unit = report_data.setdefault(jurusan, {'nama_jurusan': detail_jurusan, 'staff_data': []})
+        staff = {'nama': nama_lengkap, 'absensi': {}, 'summary': ''}
+        unit['staff_data'].append(staff)
+        staff_index[nip] = staff
+
+    # Rentang yang tepat sebulan penuh (atau beberapa bulan penuh) memakai ringkasan
+    # bulanan yang tersimpan; rentang lain dihitung dari kode harian yang dibaca.
+    bulan_penuh = awal == _awal_bulan(awal) and akhir == _akhir_bulan(akhir)
+    hitungan = {}
+    for row_nip, tanggal_hari, kode in conn.execute(
+        "SELECT nip, tanggal_hari, kode FROM attendance_daily_code WHERE tanggal_hari >= ? AND tanggal_hari < ?",
+        (awal, _hari_berikutnya(akhir))
+    ):
+        staff = staff_index.get(row_nip)
+        if staff is None:
+            continue
+        staff['absensi'][tanggal_hari] = kode
+        if not bulan_penuh:
+            per_kode = hitungan.setdefault(row_nip, dict.fromkeys(KODE_REKAP, 0))
+            per_kode[kode] += 1
+
+    if bulan_penuh:
+        jumlah = ", ".join(f"SUM({kode})" for kode in KODE_REKAP)
+        for row in conn.execute(
+            f"SELECT nip, {jumlah} FROM attendance_monthly_summary WHERE bulan >= ? AND bulan <= ? GROUP BY nip",
+            (awal[:7], akhir[:7])
+        ):
+            hitungan[row[0]] = dict(zip(KODE_REKAP, row[1:]))
+
+    for row_nip, per_kode in hitungan.items():
+        staff = staff_index.get(row_nip)
+        if staff is not None:
+            staff['summary'] = ", ".join(f"{kode}:{n}" for kode, n in per_kode.items() if n)
+    return list(report_data.values())
+
+
+# Urutan pegawai di laporan; dipakai bersama oleh kedua cursor baris_laporan()
+_URUTAN_PEGAWAI = "u.jurusan, u.nama_lengkap, u.nip"
+
+
+def baris_laporan(conn, awal, akhir):
+    """
+    Versi streaming laporan(): generator satu pegawai per langkah, berurutan per unit,
+    berupa (jurusan, nama_jurusan, {'nama', 'absensi', 'summary'}). Daftar pegawai dan
+    kode harian dibaca dari dua cursor dengan urutan yang sama lalu digabung, sehingga
+    memori Python hanya memuat satu pegawai; pengurutan dilakukan SQLite. Ringkasan
+    dihitung dari kode yang sudah dibaca (sama dengan attendance_monthly_summary).
+    """
+    pegawai = conn.execute(f"""
+        SELECT u.nip, u.nama_lengkap, u.jurusan, u."detail jurusan" FROM users u
+        WHERE u.role != 'Admin' ORDER BY {_URUTAN_PEGAWAI}
+    """)
+    kode_harian = conn.execute(f"""
+        SELECT d.nip, d.tanggal_hari, d.kode FROM attendance_daily_code d
+        JOIN users u ON u.nip = d.nip
+        WHERE d.tanggal_hari >= ? AND d.tanggal_hari < ? AND u.role != 'Admin'
+        ORDER BY {_URUTAN_PEGAWAI}
+    """, (awal, _hari_berikutnya(akhir)))
+
+    berikut = kode_harian.fetchone()
+    for nip, nama_lengkap, jurusan, detail_jurusan in pegawai:
+        absensi = {}
+        per_kode = dict.fromkeys(KODE_REKAP, 0)
+        while berikut is not None and berikut[0] == nip:
+            absensi[berikut[1]] = berikut[2]
+            per_kode[berikut[2]] += 1
+            berikut = kode_harian.fetchone()
+        summary = ", ".join(f"{kode}:{n}" for kode, n in per_kode.items() if n)
+        yield jurusan, detail_jurusan, {'nama': nama_lengkap, 'absensi': absensi, 'summary': summary}
+
+
+def nama_sheet(nama_jurusan):
+    """Nama sheet Excel dari nama unit (alfanumerik, maks. 31 karakter)."""
+    return ''.join(filter(str.isalnum, nama_jurusan or ''))[:31] or 'TanpaUnit'
+
+
+def tulis_excel(conn, awal, akhir, berkas):
+    """
+    Menulis laporan rentang [awal, akhir] sebagai workbook Excel (satu sheet per unit)
+    ke berkas (path atau file object yang bisa ditulis). openpyxl dipakai dalam mode
+    write-only: baris langsung ditulis ke XML sheet sementara, tidak disimpan sebagai
+    objek sel, jadi memori tetap kecil berapa pun jumlah pegawainya.
+    Return jumlah pegawai yang ditulis.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    kolom = kolom_laporan(awal, akhir)
+    kolom_tanggal = [k['key'] for k in kolom]
+    label = ['Nama Staf'] + [k['label'] for k in kolom] + ['Jumlah']
+
+    workbook = Workbook(write_only=True)
+    sheet, unit_sekarang, jumlah = None, object(), 0
+    for jurusan, nama_jurusan, staff in baris_laporan(conn, awal, akhir):
+        if jurusan != unit_sekarang:
+            unit_sekarang = jurusan
+            sheet = workbook.create_sheet(nama_sheet(nama_jurusan))
+            header = []
+            for teks in label:
+                sel = WriteOnlyCell(sheet, value=teks)
+                sel.font = Font(bold=True)
+                header.append(sel)
+            sheet.append(header)
+        sheet.append([staff['nama']] + [staff['absensi'].get(tanggal) for tanggal in kolom_tanggal] + [staff['summary']])
+        jumlah += 1
+    if sheet is None:
+        workbook.create_sheet('Laporan').append(label)
+    workbook.save(berkas)
+    return jumlah
+
+
+def ada_perlu_klarifikasi(conn, nip):
+    """
+    True jika ada hari di seluruh riwayat NIP yang berstatus merah di dashboard
+    (Ditolak, Kurang Dari 4 Jam, Perlu Klarifikasi). Memakai kode harian: untuk
+    baris yang belum Menunggu/Disetujui, kode KT berarti kehadiran terpenuhi.
+    """
+    row = conn.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM attendance a
+            LEFT JOIN attendance_daily_code d ON d.tanggal_hari = a.tanggal_hari AND d.nip = a.nip
+            WHERE a.nip = ?
+              AND instr(COALESCE(a.status, ''), 'Menunggu') = 0
+              AND instr(COALESCE(a.status, ''), 'Disetujui') = 0
+              AND (instr(COALESCE(a.status, ''), 'Ditolak') > 0 OR COALESCE(d.kode, '') != 'KT')
+        )
+    """, (nip,)).fetchone()
+    return bool(row[0])
+
+
+if __name__ == '__main__':
+    import cache
+    from migrations import apply_migrations
+
+    parser = argparse.ArgumentParser(description="Pemeliharaan tabel rekap absensi")
+    parser.add_argument('--rebuild', action='store_true', help="hitung ulang seluruh rekap")
+    parser.add_argument('--check', action='store_true', help="cek konsistensi rekap dengan data mentah")
+    parser.add_argument('--bulan', help="batasi --check ke satu bulan (YYYY-MM)")
+    parser.add_argument('--db', default=DB_FILE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        apply_migrations(conn)
+        if args.rebuild:
+            jumlah = rebuild_rekap(conn)
+            cache.naikkan_versi(conn, cache.KUNCI_SEMUA)
+            conn.commit()
+            print(f"Rekap dihitung ulang: {jumlah} kode harian.")
+        if args.check or not args.rebuild:
+            selisih = cek_konsistensi(conn, args.bulan)
+            for tabel, kunci, tersimpan, seharusnya in selisih[:50]:
+                print(f"  {tabel} {kunci}: tersimpan={tersimpan} seharusnya={seharusnya}")
+            if selisih:
+                print(f"TIDAK KONSISTEN: {len(selisih)} selisih ditemukan. Jalankan --rebuild untuk memperbaiki.")
+                sys.exit(1)
+            print("Rekap konsisten dengan data absensi.")
+    finally:
+        conn.close()
@@ -0,0 +1,109 @@
+# scripts/bench_dashboard.py
+# Benchmark dashboard pimpinan per role (Kajur, Sekjur, Wadir1-3, Direktur) lewat
+# Flask test client pada salinan database.db: waktu render per request (median),
+# ukuran response, jumlah query SQL per request dan jumlah baris tabel.
+# Supaya render tabel ikut terukur, setiap pimpinan diberi N klarifikasi sintetis
+# yang menunggu persetujuannya.
+#
+# Pemakaian: python scripts/bench_dashboard.py [klarifikasi_per_pimpinan] [ulang]
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PER_PIMPINAN = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+ULANG = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+ROLES = ['Kajur', 'Sekjur', 'Wadir1', 'Wadir2', 'Wadir3', 'Direktur']
+
+
+def isi_klarifikasi(db_path):
+    # Klarifikasi sintetis dari bawahan langsung, menunggu di masing-masing pimpinan
+    conn = sqlite3.connect(db_path)
+    pimpinan = {}
+    for role in ROLES:
+        row = conn.execute("SELECT nip, jurusan FROM users WHERE role = ? ORDER BY nip LIMIT 1", (role,)).fetchone()
+        if row:
+            pimpinan[role] = row
+    rows = []
+    for role, (nip, jurusan) in pimpinan.items():
+        approver = nip
+        if role == 'Sekjur':
+            approver = conn.execute("SELECT id_atasan FROM users WHERE nip = ?", (nip,)).fetchone()[0]
+        bawahan = conn.execute("SELECT nip, nama_lengkap FROM users WHERE id_atasan = ? LIMIT 1", (approver,)).fetchone()
+        if not bawahan:
+            continue
+        for i in range(PER_PIMPINAN):
+            rows.append((bawahan[0], bawahan[1], jurusan, f"2025-07-{i % 28 + 1:02d} 00:00:00", 'Non Fleksibel',
+                         'Lupa Absen Masuk', 'uploads/bukti.pdf' if i % 2 else None, 'Diajukan', approver,
+                         f"2025-08-01 08:{i % 60:02d}:00"))
+    conn.executemany("""
+        INSERT INTO clarifications (nip_pengaju, nama_lengkap, jurusan, tanggal_klarifikasi, kategori_surat,
+                                    jenis_surat, file_bukti, status_final, nip_approver_sekarang, tanggal_pengajuan)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+    return pimpinan
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench.db")
+    shutil.copy(os.path.join(ROOT, "database.db"), db_path)
+    pimpinan = isi_klarifikasi(db_path)
+
+    os.environ['DATABASE'] = db_path
+    os.chdir(tmp)  # folder flask_session ikut dibuat di direktori sementara
+    sys.path.insert(0, ROOT)
+    import db
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+
+    jumlah_query = [0]
+
+    def hitung_query(_):
+        jumlah_query[0] += 1
+
+    asli_connect = db.connect
+
+    def connect_terhitung(*args, **kwargs):
+        conn = asli_connect(*args, **kwargs)
+        conn.set_trace_callback(hitung_query)
+        return conn
+
+    db.connect = connect_terhitung
+    db.pool.close_all()
+
+    print(f"{PER_PIMPINAN} klarifikasi menunggu per pimpinan, {ULANG} request per role")
+    print(f"{'role':<9} {'median':>9} {'p90':>9} {'bytes':>8} {'query':>6} {'baris':>6}")
+    try:
+        for role in ROLES:
+            if role not in pimpinan:
+                continue
+            nip, jurusan = pimpinan[role]
+            with client.session_transaction() as s:
+                s.update({'user_id': nip, 'user_role': role, 'user_jurusan': jurusan, 'user_name': role})
+            url = f"/dashboard_{role.lower()}"
+            client.get(url)  # pemanasan: kompilasi template dan cache statement
+            waktu = []
+            for _ in range(ULANG):
+                jumlah_query[0] = 0
+                mulai = time.perf_counter()
+                response = client.get(url)
+                waktu.append(time.perf_counter() - mulai)
+                assert response.status_code == 200, (role, response.status_code)
+            body = response.get_data(as_text=True)
+            waktu.sort()
+            print(f"{role:<9} {statistics.median(waktu) * 1000:>7.2f}ms {waktu[int(len(waktu) * 0.9)] * 1000:>7.2f}ms "
+                  f"{len(body):>8} {jumlah_query[0]:>6} {body.count('<tr'):>6}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
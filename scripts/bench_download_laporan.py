@@ -0,0 +1,133 @@
+# scripts/bench_download_laporan.py
+# Benchmark /download_laporan pada salinan database.db yang ditambah pegawai sintetis
+# (default 1.000) lengkap dengan kode harian sebulan: alur lama (dict laporan ->
+# DataFrame per unit -> pd.ExcelWriter ke BytesIO) dibanding alur streaming
+# (rekap.tulis_excel write-only ke SpooledTemporaryFile).
+# Setiap cara dijalankan di proses anak tersendiri agar puncak RSS (ru_maxrss)
+# tidak tercampur; dicetak juga RSS setelah aplikasi diimpor sebagai pembanding,
+# waktu sampai byte pertama (TTFB) dan total waktu sampai byte terakhir.
+#
+# Pemakaian: python scripts/bench_download_laporan.py [jumlah_pegawai]
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JUMLAH_PEGAWAI = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 1000
+BULAN = "2030-01"
+UNIT = ['BT', 'BP', 'PKH', 'TIK', 'UMUM']
+
+
+def download_lama():
+    # Salinan alur lama download_laporan (laporan utuh di memori lalu ExcelWriter)
+    import io
+    import pandas as pd
+    from flask import send_file
+    from app import get_db, laporan_cache
+    import rekap
+    conn = get_db()
+    awal, akhir = f"{BULAN}-01", f"{BULAN}-31"
+    report_data_per_jurusan = laporan_cache(conn, awal, akhir)
+    kolom_tanggal = rekap.kolom_laporan(awal, akhir)
+    output = io.BytesIO()
+    writer = pd.ExcelWriter(output, engine='openpyxl')
+    for unit_data in report_data_per_jurusan:
+        staff_list = unit_data['staff_data']
+        data_for_df = [
+            [staff['nama']] + [staff['absensi'].get(kolom['key']) for kolom in kolom_tanggal] + [staff['summary']]
+            for staff in staff_list
+        ]
+        column_order = ['Nama Staf'] + [kolom['label'] for kolom in kolom_tanggal] + ['Jumlah']
+        df = pd.DataFrame(data_for_df, columns=column_order)
+        df.to_excel(writer, sheet_name=rekap.nama_sheet(unit_data['nama_jurusan']), index=False)
+    writer.close()
+    output.seek(0)
+    return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     as_attachment=True, download_name="Laporan_lama.xlsx")
+
+
+def siapkan_db(tmp):
+    db_path = os.path.join(tmp, "bench.db")
+    shutil.copy(os.path.join(ROOT, "database.db"), db_path)
+    sys.path.insert(0, ROOT)
+    from migrations import apply_migrations
+    from klasifikasi import KODE_REKAP
+
+    acak = random.Random(1)
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn)
+    pegawai = [(f"BENCH{i:06d}", f"Pegawai Sintetis {i:04d}", UNIT[i % len(UNIT)], f"Unit {UNIT[i % len(UNIT)]}")
+               for i in range(JUMLAH_PEGAWAI)]
+    conn.executemany("INSERT INTO users (nip, password, nama_lengkap, jurusan, \"detail jurusan\", role) "
+                     "VALUES (?, 'x', ?, ?, ?, 'Dosen')", pegawai)
+    kode_harian = [(f"{BULAN}-{hari:02d}", nip, acak.choice(KODE_REKAP))
+                   for nip, *_ in pegawai for hari in range(1, 32)]
+    conn.executemany("INSERT INTO attendance_daily_code (tanggal_hari, nip, kode) VALUES (?, ?, ?)", kode_harian)
+    conn.execute(f"""
+        INSERT INTO attendance_monthly_summary (bulan, nip, {', '.join(KODE_REKAP)})
+        SELECT ?, nip, {', '.join(f"SUM(kode = '{kode}')" for kode in KODE_REKAP)}
+        FROM attendance_daily_code WHERE tanggal_hari LIKE ? GROUP BY nip
+    """, (BULAN, f"{BULAN}-%"))
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def ukur(cara, db_path):
+    # Dijalankan di proses anak: satu download, lalu cetak hasil sebagai JSON
+    os.environ['DATABASE'] = db_path
+    os.environ['CACHE_BACKEND'] = 'none'
+    os.chdir(os.path.dirname(db_path))
+    sys.path.insert(0, ROOT)
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.add_url_rule('/download_laporan_lama', 'download_laporan_lama', download_lama)
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s.update({'user_id': 'admin', 'user_role': 'Admin', 'user_name': 'Admin'})
+    rss_awal = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    url = '/download_laporan_lama' if cara == 'lama' else f'/download_laporan?bulan={BULAN}'
+    mulai = time.perf_counter()
+    response = client.get(url, buffered=False)
+    potongan = iter(response.response)
+    ukuran = len(next(potongan))
+    ttfb = time.perf_counter() - mulai
+    for data in potongan:
+        ukuran += len(data)
+    total = time.perf_counter() - mulai
+    response.close()
+    assert response.status_code == 200, response.status_code
+    print(json.dumps({'ttfb': ttfb, 'total': total, 'byte': ukuran, 'rss_awal': rss_awal,
+                      'rss_puncak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        db_path = siapkan_db(tmp)
+        print(f"{JUMLAH_PEGAWAI} pegawai sintetis, {BULAN} (31 kolom tanggal)")
+        print(f"{'cara':<6} {'TTFB':>9} {'total':>9} {'ukuran':>9} {'RSS awal':>10} {'RSS puncak':>11} {'selisih':>9}")
+        for cara in ('lama', 'baru'):
+            keluaran = subprocess.run([sys.executable, os.path.abspath(__file__), '--ukur', cara, db_path],
+                                      check=True, capture_output=True, text=True).stdout
+            hasil = json.loads(keluaran.strip().splitlines()[-1])
+            print(f"{cara:<6} {hasil['ttfb'] * 1000:>7.0f}ms {hasil['total'] * 1000:>7.0f}ms "
+                  f"{hasil['byte'] / 1024:>7.0f}KB {hasil['rss_awal'] / 1024:>8.1f}MB "
+                  f"{hasil['rss_puncak'] / 1024:>9.1f}MB {(hasil['rss_puncak'] - hasil['rss_awal']) / 1024:>7.1f}MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--ukur':
+        ukur(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,90 @@
+# scripts/bench_import.py
+# Benchmark impor absensi satu tahun sintetis: cara lama (iterrows + SELECT/INSERT
+# per baris) dibandingkan dengan impor set-based di migrasi_data.py.
+# Kedua cara membaca DataFrame yang sama, jadi yang diukur adalah tahap tulis ke DB.
+#
+# Pemakaian: python scripts/bench_import.py [jumlah_pegawai]
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, time as jam, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import apply_migrations  # noqa: E402
+import migrasi_data  # noqa: E402
+
+JUMLAH_PEGAWAI = int(sys.argv[1]) if len(sys.argv) > 1 else 225
+TAHUN = 2025
+
+
+def data_sintetis():
+    rows = []
+    hari = date(TAHUN, 1, 1)
+    while hari.year == TAHUN:
+        if hari.weekday() < 5:
+            for i in range(JUMLAH_PEGAWAI):
+                rows.append({
+                    'nip': f"1990{i:014d}", 'nama_lengkap': f"Pegawai {i}",
+                    'tanggal': pd.Timestamp(hari),
+                    'jam masuk': jam(7, i % 60) if i % 7 else None,
+                    'jam pulang': jam(16, i % 60) if i % 11 else None,
+                })
+        hari += timedelta(days=1)
+    return pd.DataFrame(rows)
+
+
+def impor_baris_per_baris(conn, df_combined):
+    # Salinan logika lama run_migration() untuk absensi
+    cursor = conn.cursor()
+    added_count = skipped_count = 0
+    for index, row in df_combined.iterrows():
+        tanggal_absen_str = pd.to_datetime(row['tanggal']).date().strftime('%Y-%m-%d')
+        cursor.execute("SELECT rowid FROM attendance WHERE nip = ? AND tanggal_hari = ?", (row['nip'], tanggal_absen_str))
+        if not cursor.fetchone():
+            cursor.execute("""
+                INSERT INTO attendance (nip, nama_lengkap, jurusan, "detail jurusan", tanggal, "jam masuk", "jam pulang", status, keterangan)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'Hadir', '')
+            """, (row['nip'], row['nama_lengkap'], None, None, f"{tanggal_absen_str} 00:00:00",
+                  str(row['jam masuk']) if row['jam masuk'] else None, str(row['jam pulang']) if row['jam pulang'] else None))
+            added_count += 1
+        else:
+            skipped_count += 1
+    conn.commit()
+    return added_count, skipped_count
+
+
+def impor_bulk(conn, df_combined):
+    hasil = migrasi_data.impor_absensi(conn, migrasi_data.normalisasi_absensi(df_combined))
+    conn.commit()
+    return hasil
+
+
+def ukur(label, fungsi, df, separuh_sudah_ada):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        apply_migrations(conn)
+        if separuh_sudah_ada:
+            # Simulasi impor ulang: separuh data sudah ada di database
+            impor_bulk(conn, df.iloc[: len(df) // 2])
+        mulai = time.perf_counter()
+        added, skipped = fungsi(conn, df)
+        durasi = time.perf_counter() - mulai
+        conn.close()
+    print(f"  {label:<26} {durasi:>8.2f} detik  {len(df) / durasi:>10.0f} baris/detik  (ditambah {added}, dilewati {skipped})")
+
+
+def main():
+    df = data_sintetis()
+    print(f"Data sintetis: {len(df)} baris absensi ({JUMLAH_PEGAWAI} pegawai x hari kerja {TAHUN})")
+    for separuh in (False, True):
+        print("Database kosong:" if not separuh else "Separuh data sudah ada (impor ulang):")
+        ukur("lama (baris per baris)", impor_baris_per_baris, df, separuh)
+        ukur("baru (set-based)", impor_bulk, df, separuh)
+
+
+if __name__ == '__main__':
+    main()
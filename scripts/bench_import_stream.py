@@ -0,0 +1,106 @@
+# scripts/bench_import_stream.py
+# Benchmark memori puncak (RSS) dan kecepatan impor absensi dari workbook besar:
+# cara lama (pandas membaca semua sheet sekaligus) dibandingkan dengan pembacaan
+# streaming openpyxl per potongan, sekuensial maupun paralel per sheet.
+# Setiap mode dijalankan di proses terpisah supaya RSS puncaknya tidak tercampur.
+#
+# Pemakaian: python scripts/bench_import_stream.py [jumlah_pegawai] [jumlah_bulan]
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as jam, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHEETS = ['BP', 'BT', 'PKH', 'RPK', 'THP', 'data_akses']
+MODES = [
+    ("lama (pandas, semua sheet)", ['pandas']),
+    ("streaming, 1 proses", ['stream', '1']),
+    ("streaming, paralel per sheet", ['stream', '0']),
+]
+
+
+def buat_workbook(path, jumlah_pegawai, jumlah_bulan):
+    # write_only agar pembuatan data uji sendiri tidak memakan memori besar
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    wb.create_sheet('users').append(['nip', 'nama_lengkap', 'jurusan', 'detail jurusan', 'role', 'id_atasan'])
+    per_sheet = -(-jumlah_pegawai // len(SHEETS))
+    total = 0
+    for s, nama_sheet in enumerate(SHEETS):
+        ws = wb.create_sheet(nama_sheet)
+        ws.append(['nip', 'nama_lengkap', 'tanggal', 'jam masuk', 'jam pulang'])
+        hari = date(2025, 1, 1)
+        akhir = date(2025 + (jumlah_bulan - 1) // 12, (jumlah_bulan - 1) % 12 + 1, 28)
+        while hari <= akhir:
+            if hari.weekday() < 5:
+                for i in range(s * per_sheet, min((s + 1) * per_sheet, jumlah_pegawai)):
+                    ws.append([f"1990{i:014d}", f"Pegawai {i}", datetime.combine(hari, jam()),
+                               jam(7, i % 60) if i % 7 else None, jam(16, i % 60) if i % 11 else None])
+                    total += 1
+            hari += timedelta(days=1)
+    wb.save(path)
+    return total
+
+
+def anak(excel_file, mode, workers=None):
+    # Dijalankan di subproses: impor ke database kosong, laporkan durasi + RSS puncak
+    import pandas as pd
+    import migrasi_data
+    from migrations import apply_migrations
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        apply_migrations(conn)
+        mulai = time.perf_counter()
+        if mode == 'pandas':
+            all_dfs = pd.read_excel(excel_file, sheet_name=SHEETS, dtype={'nip': str})
+            df = migrasi_data.normalisasi_absensi(pd.concat(all_dfs.values(), ignore_index=True))
+            added, _ = migrasi_data.impor_absensi(conn, df)
+        else:
+            added, _ = migrasi_data.impor_absensi_chunks(
+                conn, migrasi_data.stream_absensi(excel_file, SHEETS, workers=int(workers))
+            )
+        conn.commit()
+        durasi = time.perf_counter() - mulai
+        conn.close()
+    # ru_maxrss dalam KB di Linux; proses anak = pembaca sheet paralel (maksimum per proses)
+    rss_induk = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rss_anak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{durasi} {added} {rss_induk} {rss_anak}")
+
+
+def main():
+    jumlah_pegawai = int(sys.argv[1]) if len(sys.argv) > 1 else 225
+    jumlah_bulan = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_file = os.path.join(tmp, "absensi.xlsx")
+        mulai = time.perf_counter()
+        total = buat_workbook(excel_file, jumlah_pegawai, jumlah_bulan)
+        print(f"Workbook sintetis: {total} baris, {len(SHEETS)} sheet, "
+              f"{os.path.getsize(excel_file) / 1e6:.1f} MB (dibuat dalam {time.perf_counter() - mulai:.1f} detik)")
+        print(f"CPU tersedia: {os.cpu_count()}")
+        for label, argumen in MODES:
+            hasil = subprocess.run([sys.executable, __file__, '--child', excel_file, *argumen],
+                                   capture_output=True, text=True, cwd=ROOT)
+            if hasil.returncode != 0:
+                print(f"  {label:<30} GAGAL\n{hasil.stderr}")
+                continue
+            durasi, added, rss_induk, rss_anak = hasil.stdout.split()[-4:]
+            durasi = float(durasi)
+            print(f"  {label:<30} {durasi:>7.2f} detik  {int(added) / durasi:>8.0f} baris/detik  "
+                  f"RSS puncak {float(rss_induk):>6.0f} MB (proses pembaca {float(rss_anak):>4.0f} MB)")
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        argumen = sys.argv[sys.argv.index('--child') + 1:]
+        anak(*argumen)
+    else:
+        main()
@@ -0,0 +1,131 @@
+# scripts/bench_klasifikasi.py
+# Micro-benchmark klasifikasi absensi per baris pada data sintetis:
+#   parse jam      -> strptime('%H:%M:%S.%f') vs klasifikasi.detik_jam_batch
+#   status tampilan-> blok lama dashboard_dosen vs klasifikasi.status_absensi_batch
+#   kode rekap     -> klasifikasi per baris lama (strptime) vs klasifikasi.kode_rekap_batch
+# Hasil lama dan baru juga dibandingkan supaya perubahan perilaku langsung terlihat.
+#
+# Pemakaian: python scripts/bench_klasifikasi.py [jumlah_baris]
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import klasifikasi  # noqa: E402
+
+JUMLAH_BARIS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+TIME_FMT = '%H:%M:%S.%f'
+
+
+def data_sintetis(n):
+    rnd = random.Random(7)
+    status_pilihan = [None, None, None, None, 'Menunggu Persetujuan', 'Disetujui - Surat NF',
+                      'Disetujui (Input Admin)', 'Ditolak']
+    rows = []
+    for i in range(n):
+        status = rnd.choice(status_pilihan)
+        keterangan = rnd.choice(['', 'Cuti Tahunan - liburan', 'Lupa Absen Masuk', None])
+        masuk = f"{rnd.randint(6, 9):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}.{rnd.randint(0, 999999):06d}" if rnd.random() < 0.9 else None
+        pulang = f"{rnd.randint(10, 17):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}.000000" if rnd.random() < 0.85 else None
+        rows.append({
+            'nip': f"1990{i % 500:014d}", 'tanggal': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d} 00:00:00",
+            'jam masuk': masuk, 'jam pulang': pulang, 'status': status, 'keterangan': keterangan,
+            'kategori': rnd.choice([None, 'Fleksibel', 'Non Fleksibel']),
+        })
+    return rows
+
+
+def status_lama(records_raw):
+    # Salinan blok lama dashboard_dosen
+    processed_records = []
+    for record in records_raw:
+        rec = dict(record)
+        rec['tanggal_formatted'] = datetime.strptime(rec['tanggal'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+        jam_masuk, jam_pulang = rec.get('jam masuk'), rec.get('jam pulang')
+        status, keterangan = rec.get('status'), rec.get('keterangan')
+        rec['jam_masuk_formatted'] = datetime.strptime(jam_masuk, TIME_FMT).strftime('%H:%M') if jam_masuk else " - "
+        rec['jam_pulang_formatted'] = datetime.strptime(jam_pulang, TIME_FMT).strftime('%H:%M') if jam_pulang else " - "
+        if status and "Menunggu" in status:
+            rec.update({'status_text': 'Menunggu Persetujuan', 'status_color': 'yellow', 'checkbox_enabled': False})
+        elif status and "Disetujui" in status:
+            if keterangan:
+                rec.update({'status_text': f"Disetujui - {keterangan}", 'status_color': 'green', 'checkbox_enabled': False})
+            else:
+                rec.update({'status_text': status, 'status_color': 'green', 'checkbox_enabled': False})
+        elif status and "Ditolak" in status:
+            rec.update({'status_text': keterangan, 'status_color': 'red', 'checkbox_enabled': True})
+        elif jam_masuk and jam_pulang:
+            dur = datetime.strptime(jam_pulang, TIME_FMT) - datetime.strptime(jam_masuk, TIME_FMT)
+            if dur.total_seconds() >= 4 * 3600:
+                rec.update({'status_text': 'Kehadiran Terpenuhi', 'status_color': 'green', 'checkbox_enabled': False})
+            else:
+                rec.update({'status_text': 'Kurang Dari 4 Jam', 'status_color': 'red', 'checkbox_enabled': False})
+        else:
+            rec.update({'status_text': 'Perlu Klarifikasi', 'status_color': 'red', 'checkbox_enabled': True})
+        processed_records.append(rec)
+    return processed_records
+
+
+def kode_lama(rows):
+    # Salinan klasifikasi lama rekap_laporan_view (strptime per baris)
+    hasil = []
+    for row in rows:
+        status, keterangan = row['status'], row['keterangan']
+        jam_masuk, jam_pulang, kategori = row['jam masuk'], row['jam pulang'], row['kategori']
+        kode = 'PK'
+        if status and "Disetujui" in status:
+            if 'Cuti' in (keterangan or ''):
+                kode = 'CT'
+            elif kategori and 'Non Fleksibel' in kategori:
+                kode = 'NF'
+            elif kategori and 'Fleksibel' in kategori:
+                kode = 'FL'
+            else:
+                kode = 'IZ'
+        elif jam_masuk and jam_pulang:
+            dur = datetime.strptime(jam_pulang, TIME_FMT) - datetime.strptime(jam_masuk, TIME_FMT)
+            if dur.total_seconds() >= 4 * 3600:
+                kode = 'KT'
+        hasil.append(kode)
+    return hasil
+
+
+def ukur(label, lama, baru, n):
+    mulai = time.perf_counter()
+    hasil_lama = lama()
+    t_lama = time.perf_counter() - mulai
+    mulai = time.perf_counter()
+    hasil_baru = baru()
+    t_baru = time.perf_counter() - mulai
+    print(f"  {label:<16} lama {t_lama / n * 1e6:>6.2f} us/baris   baru {t_baru / n * 1e6:>6.2f} us/baris   "
+          f"({t_lama / t_baru:>4.1f}x)")
+    return hasil_lama, hasil_baru
+
+
+def main():
+    rows = data_sintetis(JUMLAH_BARIS)
+    jam = [row['jam masuk'] for row in rows]
+    df = pd.DataFrame(rows)
+    n = len(rows)
+    print(f"Data sintetis: {n} baris")
+
+    lama, baru = ukur("parse jam", lambda: [
+        (lambda t: t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6)(datetime.strptime(v, TIME_FMT)) if v else None
+        for v in jam
+    ], lambda: klasifikasi.detik_jam_batch(jam), n)
+    assert all((a is None and b != b) or abs(a - b) < 1e-6 for a, b in zip(lama, baru))
+
+    lama, baru = ukur("status tampilan", lambda: status_lama(rows), lambda: klasifikasi.status_absensi_batch(rows), n)
+    assert lama == baru, "hasil status tampilan berbeda"
+
+    lama, baru = ukur("kode rekap", lambda: kode_lama(rows), lambda: klasifikasi.kode_rekap_batch(df), n)
+    assert lama == list(baru), "hasil kode rekap berbeda"
+    print("Hasil lama dan baru identik.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# scripts/bench_laporan.py
+# Benchmark laporan rekap bulanan pada data sintetis (N pegawai x 31 hari):
+#   lama      -> logika lama rekap_laporan_view (strptime per baris + cari unit per baris)
+#   hitung    -> klasifikasi vektor satu bulan penuh (refresh_rekap untuk sebulan)
+#   laporan   -> rekap.laporan(), yang dipakai rute view dan download
+# Waktu per sel (pegawai-hari) yang konstan menunjukkan skala linear.
+#
+# Pemakaian: python scripts/bench_laporan.py [jumlah_pegawai ...]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import apply_migrations  # noqa: E402
+import rekap  # noqa: E402
+from klasifikasi import KODE_REKAP, kode_rekap  # noqa: E402
+
+BULAN = '2025-07'
+AWAL, AKHIR = '2025-07-01', '2025-07-31'
+PEGAWAI_PER_UNIT = 10
+
+
+def isi_data(conn, jumlah_pegawai):
+    rnd = random.Random(42)
+    users, absensi, klarifikasi = [], [], []
+    for i in range(jumlah_pegawai):
+        nip = f"1990{i:014d}"
+        users.append((nip, 'x', f"Pegawai {i}", f"J{i // PEGAWAI_PER_UNIT:03d}", f"Jurusan {i // PEGAWAI_PER_UNIT}", 'Dosen'))
+        for hari in range(1, 32):
+            tanggal = f"2025-07-{hari:02d}"
+            pilihan = rnd.random()
+            status, keterangan, masuk, pulang = None, '', None, None
+            if pilihan < 0.7:
+                masuk, pulang = f"07:{rnd.randint(0, 59):02d}:00.000000", f"{rnd.choice([10, 15, 16])}:00:00.000000"
+            elif pilihan < 0.8:
+                status, keterangan = 'Disetujui (Input Admin)', 'Cuti Tahunan'
+            elif pilihan < 0.9:
+                status = 'Disetujui - Surat NF'
+                klarifikasi.append((nip, f"{tanggal} 00:00:00", 'Non Fleksibel', 'Disetujui oleh Kajur'))
+            absensi.append((nip, f"Pegawai {i}", f"{tanggal} 00:00:00", masuk, pulang, status, keterangan))
+    conn.executemany("INSERT INTO users (nip, password, nama_lengkap, jurusan, \"detail jurusan\", role) VALUES (?, ?, ?, ?, ?, ?)", users)
+    conn.executemany("INSERT INTO attendance (nip, nama_lengkap, tanggal, \"jam masuk\", \"jam pulang\", status, keterangan) VALUES (?, ?, ?, ?, ?, ?, ?)", absensi)
+    conn.executemany("INSERT INTO clarifications (nip_pengaju, tanggal_klarifikasi, kategori_surat, status_final) VALUES (?, ?, ?, ?)", klarifikasi)
+    conn.commit()
+    return len(absensi)
+
+
+def laporan_lama(conn):
+    # Salinan logika lama rekap_laporan_view (tanpa render template)
+    awal_bulan, akhir_bulan = '2025-07-01', '2025-08-01'
+    all_staff = conn.execute("SELECT nip, nama_lengkap, jurusan, \"detail jurusan\" FROM users WHERE role != 'Admin' ORDER BY jurusan, nama_lengkap").fetchall()
+    attendance_data = conn.execute("SELECT * FROM attendance WHERE tanggal >= ? AND tanggal < ?", (awal_bulan, akhir_bulan)).fetchall()
+    approved_clarifications = conn.execute(
+        "SELECT nip_pengaju, tanggal_klarifikasi, kategori_surat FROM clarifications WHERE tanggal_klarifikasi >= ? AND tanggal_klarifikasi < ? AND status_final LIKE 'Disetujui%'",
+        (awal_bulan, akhir_bulan)
+    ).fetchall()
+    report_data = {}
+    for staff in all_staff:
+        unit = report_data.setdefault(staff['jurusan'], {'nama_jurusan': staff['detail jurusan'], 'staff_data': {}})
+        unit['staff_data'][staff['nip']] = {'nama': staff['nama_lengkap'], 'absensi': {}, 'summary_counts': dict.fromkeys(KODE_REKAP, 0)}
+    clarif_dict = {(item['nip_pengaju'], item['tanggal_klarifikasi'].split(' ')[0]): item['kategori_surat'] for item in approved_clarifications}
+    for record in attendance_data:
+        nip = record['nip']
+        current_unit_data = next((unit['staff_data'][nip] for unit in report_data.values() if nip in unit['staff_data']), None)
+        if not current_unit_data:
+            continue
+        tanggal_obj = datetime.strptime(record['tanggal'], '%Y-%m-%d %H:%M:%S')
+        tanggal_str = tanggal_obj.strftime('%Y-%m-%d')
+        kode = kode_rekap(record['status'], record['keterangan'], record['jam masuk'], record['jam pulang'],
+                        clarif_dict.get((nip, tanggal_str)))
+        if kode:
+            current_unit_data['absensi'][tanggal_obj.day] = kode
+            current_unit_data['summary_counts'][kode] += 1
+    return report_data
+
+
+def ukur(fungsi, ulang=3):
+    terbaik = float('inf')
+    for _ in range(ulang):
+        mulai = time.perf_counter()
+        fungsi()
+        terbaik = min(terbaik, time.perf_counter() - mulai)
+    return terbaik
+
+
+def main():
+    ukuran = [int(n) for n in sys.argv[1:]] or [100, 250, 500, 1000]
+    print(f"{'pegawai':>8} {'sel':>7} | {'lama':>9} {'hitung':>9} {'laporan':>9} | {'us/sel lama':>11} {'hitung':>7} {'laporan':>7}")
+    for jumlah in ukuran:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+            conn.row_factory = sqlite3.Row
+            apply_migrations(conn)
+            sel = isi_data(conn, jumlah)
+
+            t_lama = ukur(lambda: laporan_lama(conn))
+            t_hitung = ukur(lambda: rekap.refresh_rekap(conn, awal=AWAL, akhir=AKHIR))
+            conn.commit()
+            t_laporan = ukur(lambda: rekap.laporan(conn, AWAL, AKHIR))
+            assert not rekap.cek_konsistensi(conn, BULAN)
+            conn.close()
+        print(f"{jumlah:>8} {sel:>7} | {t_lama * 1000:>7.1f}ms {t_hitung * 1000:>7.1f}ms {t_laporan * 1000:>7.1f}ms | "
+              f"{t_lama / sel * 1e6:>11.2f} {t_hitung / sel * 1e6:>7.2f} {t_laporan / sel * 1e6:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# scripts/bench_load.py
+# Load test sederhana: membandingkan requests/detik dengan koneksi buka-tutup per
+# request (DB_POOL_SIZE=0, perilaku lama) dan dengan pool + WAL (DB_POOL_SIZE=8).
+# Setiap mode dijalankan di proses terpisah terhadap salinan database.
+#
+# Pemakaian: python scripts/bench_load.py [durasi_detik] [jumlah_thread]
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARGS = [a for a in sys.argv[1:] if a != "--child"]
+DURASI = float(ARGS[0]) if len(ARGS) > 0 else 5
+THREADS = int(ARGS[1]) if len(ARGS) > 1 else 4
+
+
+def jalankan_beban():
+    # Dijalankan di proses anak: DATABASE & DB_POOL_SIZE sudah di-set oleh induk
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.disable(logging.INFO)
+    from app import app, get_db
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        conn = get_db()
+        dosen = conn.execute("SELECT nip, jurusan FROM users WHERE role = 'Dosen' LIMIT 1").fetchone()
+        atasan = conn.execute("SELECT nip FROM users WHERE role = 'Kajur' LIMIT 1").fetchone()
+
+    urls = ['/dashboard_dosen', f"/get_absensi_summary/{dosen['nip']}"]
+    total = [0]
+    lock = threading.Lock()
+    batas = time.perf_counter() + DURASI
+
+    def pekerja(index):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['user_id'] = atasan['nip']
+            s['user_role'] = 'Kajur'
+            s['user_name'] = 'Bench'
+            s['user_jurusan'] = dosen['jurusan']
+        jumlah = 0
+        while time.perf_counter() < batas:
+            respon = client.get(urls[jumlah % len(urls)])
+            assert respon.status_code == 200, respon.status_code
+            jumlah += 1
+        with lock:
+            total[0] += jumlah
+
+    threads = [threading.Thread(target=pekerja, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"{total[0] / DURASI:.1f}")
+
+
+def main():
+    hasil = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, pool_size in (("tanpa pool (lama)", "0"), ("pool + WAL", "8")):
+            db_path = os.path.join(tmp, f"bench-{pool_size}.db")
+            shutil.copy(os.path.join(ROOT, "database.db"), db_path)
+            env = dict(os.environ, DATABASE=db_path, DB_POOL_SIZE=pool_size, SESSION_TYPE="filesystem")
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", str(DURASI), str(THREADS)],
+                env=env, cwd=tmp, capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            hasil[label] = float(out)
+
+    print(f"Durasi {DURASI:.0f} detik, {THREADS} thread")
+    for label, rps in hasil.items():
+        print(f"  {label:<20} {rps:>8.1f} req/detik")
+
+
+if __name__ == '__main__':
+    if "--child" in sys.argv:
+        jalankan_beban()
+    else:
+        main()
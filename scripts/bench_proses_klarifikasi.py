@@ -0,0 +1,109 @@
+# scripts/bench_proses_klarifikasi.py
+# Benchmark persetujuan klarifikasi lewat Flask test client pada salinan database.db:
+# N klarifikasi diproses satu per satu lewat /proses_klarifikasi dibanding sekali
+# kirim lewat /proses_klarifikasi_batch, untuk ukuran batch 1, 10 dan 100.
+# Dicetak latensi per klarifikasi, jumlah query SQL dan jumlah notifikasi outbox.
+#
+# Pemakaian: python scripts/bench_proses_klarifikasi.py [ukuran_batch ...]
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UKURAN_BATCH = [int(n) for n in sys.argv[1:]] or [1, 10, 100]
+JUMLAH_DOSEN = 5
+
+
+def isi_klarifikasi(conn, approver, dosen, jumlah, bulan):
+    # Klarifikasi sintetis menunggu di approver, tersebar ke beberapa dosen, lengkap
+    # dengan baris attendance berstatus menunggu agar UPDATE absensi ikut terukur
+    ids = []
+    for i in range(jumlah):
+        nip, nama, jurusan = dosen[i % len(dosen)]
+        tanggal = f"{2000 + bulan // 12}-{bulan % 12 + 1:02d}-{i // len(dosen) + 1:02d}"
+        conn.execute("""
+            INSERT INTO attendance (nip, nama_lengkap, jurusan, tanggal, status)
+            VALUES (?, ?, ?, ?, 'Menunggu Persetujuan')
+        """, (nip, nama, jurusan, f"{tanggal} 00:00:00"))
+        cur = conn.execute("""
+            INSERT INTO clarifications (nip_pengaju, nama_lengkap, jurusan, tanggal_klarifikasi, kategori_surat,
+                                        jenis_surat, status_final, nip_approver_sekarang, tanggal_pengajuan)
+            VALUES (?, ?, ?, ?, 'Non Fleksibel', 'Lupa Absen Masuk', 'Diajukan', ?, '2025-08-01 08:00:00')
+        """, (nip, nama, jurusan, f"{tanggal} 00:00:00", approver))
+        ids.append(cur.lastrowid)
+    conn.commit()
+    return ids
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench.db")
+    shutil.copy(os.path.join(ROOT, "database.db"), db_path)
+
+    os.environ['DATABASE'] = db_path
+    os.chdir(tmp)  # folder flask_session ikut dibuat di direktori sementara
+    sys.path.insert(0, ROOT)
+    import db
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+
+    jumlah_query = [0]
+
+    def hitung_query(_):
+        jumlah_query[0] += 1
+
+    asli_connect = db.connect
+
+    def connect_terhitung(*args, **kwargs):
+        conn = asli_connect(*args, **kwargs)
+        conn.set_trace_callback(hitung_query)
+        return conn
+
+    db.connect = connect_terhitung
+    db.pool.close_all()
+
+    conn = sqlite3.connect(db_path)
+    kajur_nip, kajur_jurusan = conn.execute("SELECT nip, jurusan FROM users WHERE role = 'Kajur' ORDER BY nip LIMIT 1").fetchone()
+    dosen = conn.execute("SELECT nip, nama_lengkap, jurusan FROM users WHERE id_atasan = ? ORDER BY nip LIMIT ?",
+                         (kajur_nip, JUMLAH_DOSEN)).fetchall()
+    with client.session_transaction() as s:
+        s.update({'user_id': kajur_nip, 'user_role': 'Kajur', 'user_jurusan': kajur_jurusan, 'user_name': 'Kajur'})
+
+    def outbox():
+        return conn.execute("SELECT COUNT(*) FROM notification_outbox").fetchone()[0]
+
+    print(f"Kajur {kajur_nip}, klarifikasi tersebar ke {len(dosen)} dosen")
+    print(f"{'batch':>5} {'cara':<8} {'total':>10} {'per item':>10} {'query':>6} {'notif':>6}")
+    bulan = 0
+    try:
+        for ukuran in UKURAN_BATCH:
+            for cara in ('satuan', 'batch'):
+                bulan += 1
+                ids = isi_klarifikasi(conn, kajur_nip, dosen, ukuran, bulan)
+                notif_awal = outbox()
+                jumlah_query[0] = 0
+                mulai = time.perf_counter()
+                if cara == 'satuan':
+                    for clarification_id in ids:
+                        response = client.post('/proses_klarifikasi', data={'clarification_id': clarification_id, 'action': 'setuju'},
+                                               headers={'Referer': '/dashboard_kajur'})
+                        assert response.status_code == 302, response.status_code
+                else:
+                    response = client.post('/proses_klarifikasi_batch', json={'ids': ids, 'action': 'setuju'})
+                    assert response.get_json() == {'diproses': ukuran, 'dilewati': 0}, response.get_data(as_text=True)
+                total = time.perf_counter() - mulai
+                sisa = conn.execute(f"SELECT COUNT(*) FROM clarifications WHERE nip_approver_sekarang IS NOT NULL AND id IN ({','.join('?' * len(ids))})", ids).fetchone()[0]
+                assert sisa == 0, f"{sisa} klarifikasi belum diproses"
+                print(f"{ukuran:>5} {cara:<8} {total * 1000:>8.1f}ms {total / ukuran * 1000:>8.2f}ms "
+                      f"{jumlah_query[0]:>6} {outbox() - notif_awal:>6}")
+    finally:
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
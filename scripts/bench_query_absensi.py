@@ -0,0 +1,107 @@
+# scripts/bench_query_absensi.py
+# Benchmark waktu query per-request terhadap tabel attendance untuk data 1, 5 dan 20 tahun.
+# Membandingkan query lama (strftime/date() tanpa indeks) dengan query rentang (indeks).
+#
+# Pemakaian: python scripts/bench_query_absensi.py [jumlah_pegawai]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import apply_migrations  # noqa: E402
+
+JUMLAH_PEGAWAI = int(sys.argv[1]) if len(sys.argv) > 1 else 225
+TAHUN_AKHIR = 2025
+ULANGAN = 20
+
+
+def isi_data(conn, jumlah_tahun):
+    random.seed(42)
+    nips = [f"1990{i:014d}" for i in range(JUMLAH_PEGAWAI)]
+    conn.executemany(
+        "INSERT INTO users (nip, password, nama_lengkap, jurusan, role, id_atasan) VALUES (?, 'x', ?, 'BT', 'Dosen', ?)",
+        [(nip, f"Pegawai {i}", nips[0]) for i, nip in enumerate(nips)]
+    )
+    hari = date(TAHUN_AKHIR - jumlah_tahun + 1, 1, 1)
+    akhir = date(TAHUN_AKHIR, 12, 31)
+    rows = []
+    while hari <= akhir:
+        if hari.weekday() < 5:
+            tanggal = f"{hari.isoformat()} 00:00:00"
+            for nip in nips:
+                status = 'Disetujui (Input Admin)' if random.random() < 0.02 else None
+                keterangan = 'Cuti Tahunan' if status else None
+                rows.append((nip, tanggal, '07:30:00.000000', '16:00:00.000000', status, keterangan))
+        hari += timedelta(days=1)
+    conn.executemany(
+        'INSERT INTO attendance (nip, tanggal, "jam masuk", "jam pulang", status, keterangan) VALUES (?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.executemany(
+        "INSERT INTO clarifications (nip_pengaju, tanggal_klarifikasi, jenis_surat, status_final, nip_approver_sekarang, tanggal_pengajuan) "
+        "VALUES (?, ?, 'Lupa Absen Masuk', 'Diajukan', ?, ?)",
+        [(r[0], r[1], nips[0], r[1]) for r in rows[::50]]
+    )
+    conn.commit()
+    return nips, len(rows)
+
+
+def query_lama(conn, nip):
+    conn.execute("SELECT COUNT(*) FROM attendance WHERE nip = ? AND status LIKE 'Disetujui%' AND keterangan LIKE '%Cuti Tahunan%' AND strftime('%Y', tanggal) = ?", (nip, str(TAHUN_AKHIR))).fetchone()
+    conn.execute("SELECT COUNT(*) FROM clarifications WHERE nip_pengaju = ? AND jenis_surat = 'Lupa Absen Masuk' AND strftime('%Y-%m', tanggal_pengajuan) = ?", (nip, f"{TAHUN_AKHIR}-07")).fetchone()
+    conn.execute("SELECT * FROM attendance WHERE nip = ? AND strftime('%Y-%m', tanggal) = ? ORDER BY tanggal DESC", (nip, f"{TAHUN_AKHIR}-07")).fetchall()
+    conn.execute("SELECT rowid FROM attendance WHERE nip = ? AND date(tanggal) = ?", (nip, f"{TAHUN_AKHIR}-07-15")).fetchone()
+    conn.execute("SELECT * FROM clarifications WHERE nip_approver_sekarang = ?", (nip,)).fetchall()
+
+
+def query_baru(conn, nip):
+    conn.execute("SELECT COUNT(*) FROM attendance WHERE nip = ? AND tanggal >= ? AND tanggal < ? AND status LIKE 'Disetujui%' AND keterangan LIKE '%Cuti Tahunan%'", (nip, f"{TAHUN_AKHIR}-01-01", f"{TAHUN_AKHIR + 1}-01-01")).fetchone()
+    conn.execute("SELECT COUNT(*) FROM clarifications WHERE nip_pengaju = ? AND tanggal_pengajuan >= ? AND tanggal_pengajuan < ? AND jenis_surat = 'Lupa Absen Masuk'", (nip, f"{TAHUN_AKHIR}-07-01", f"{TAHUN_AKHIR}-08-01")).fetchone()
+    conn.execute("SELECT * FROM attendance WHERE nip = ? AND tanggal >= ? AND tanggal < ? ORDER BY tanggal DESC", (nip, f"{TAHUN_AKHIR}-07-01", f"{TAHUN_AKHIR}-08-01")).fetchall()
+    conn.execute("SELECT rowid FROM attendance WHERE nip = ? AND tanggal_hari = ?", (nip, f"{TAHUN_AKHIR}-07-15")).fetchone()
+    conn.execute("SELECT * FROM clarifications WHERE nip_approver_sekarang = ?", (nip,)).fetchall()
+
+
+def rekap_lama(conn):
+    conn.execute("SELECT * FROM attendance WHERE strftime('%Y-%m', tanggal) = ?", (f"{TAHUN_AKHIR}-07",)).fetchall()
+
+
+def rekap_baru(conn):
+    conn.execute("SELECT * FROM attendance WHERE tanggal >= ? AND tanggal < ?", (f"{TAHUN_AKHIR}-07-01", f"{TAHUN_AKHIR}-08-01")).fetchall()
+
+
+def ukur(fungsi, *args):
+    mulai = time.perf_counter()
+    for _ in range(ULANGAN):
+        fungsi(*args)
+    return (time.perf_counter() - mulai) / ULANGAN * 1000
+
+
+def main():
+    print(f"Pegawai: {JUMLAH_PEGAWAI}, ulangan per pengukuran: {ULANGAN}")
+    print(f"{'tahun':>5} {'baris':>10} | {'dosen lama':>11} {'dosen baru':>11} | {'rekap lama':>11} {'rekap baru':>11}  (ms/request)")
+    for jumlah_tahun in (1, 5, 20):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+            apply_migrations(conn, sampai_versi=1)
+            nips, jumlah_baris = isi_data(conn, jumlah_tahun)
+            nip = nips[len(nips) // 2]
+
+            dosen_lama = ukur(query_lama, conn, nip)
+            rekap_lama_ms = ukur(rekap_lama, conn)
+
+            apply_migrations(conn)
+            conn.execute("ANALYZE")
+            dosen_baru = ukur(query_baru, conn, nip)
+            rekap_baru_ms = ukur(rekap_baru, conn)
+            conn.close()
+
+        print(f"{jumlah_tahun:>5} {jumlah_baris:>10} | {dosen_lama:>11.2f} {dosen_baru:>11.2f} | {rekap_lama_ms:>11.2f} {rekap_baru_ms:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# scripts/bench_submit_klarifikasi.py
+# Benchmark pengajuan klarifikasi lewat Flask test client pada salinan database.db:
+# jumlah statement SQL dan latensi /submit_klarifikasi untuk 1 sampai 31 tanggal
+# terpilih. Sebagai pembanding, salinan alur lama (SELECT/INSERT/UPDATE per tanggal)
+# didaftarkan sementara sebagai /submit_klarifikasi_lama.
+# Kolom query dihitung lewat trace callback sqlite3, yang juga mencatat setiap baris
+# executemany; jumlah pemanggilan execute dari Python sendiri jauh lebih kecil.
+#
+# Pemakaian: python scripts/bench_submit_klarifikasi.py [jumlah_tanggal ...]
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JUMLAH_TANGGAL = [int(n) for n in sys.argv[1:]] or [1, 5, 10, 20, 31]
+ULANG = 5
+
+
+def submit_lama():
+    # Salinan alur lama submit_klarifikasi (tanpa upload file)
+    from flask import redirect, request, session
+    from app import get_db, perbarui_data_turunan, enqueue_notification
+    conn = get_db()
+    user_nip = session['user_id']
+    id_atasan = conn.execute("SELECT id_atasan FROM users WHERE nip = ?", (user_nip,)).fetchone()['id_atasan']
+    record_ids = request.form.getlist('record_ids')
+    for record_id in record_ids:
+        attendance_record = conn.execute("SELECT status FROM attendance WHERE rowid = ?", (record_id,)).fetchone()
+        if not attendance_record or (attendance_record['status'] and "Menunggu Persetujuan" in attendance_record['status']):
+            return redirect('/dashboard_dosen')
+    tanggal_diajukan = []
+    for record_id in record_ids:
+        attendance_record = conn.execute("SELECT * FROM attendance WHERE rowid = ?", (record_id,)).fetchone()
+        if attendance_record:
+            tanggal_diajukan.append(attendance_record['tanggal_hari'])
+            conn.execute("""
+                INSERT INTO clarifications (nip_pengaju, nama_lengkap, jurusan, tanggal_klarifikasi, kategori_surat,
+                                            jenis_surat, nip_approver_sekarang, status_final, file_bukti)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_nip, session['user_name'], session['user_jurusan'], attendance_record['tanggal'],
+                  request.form.get('kategori_surat'), request.form.get('jenis_surat'), id_atasan, 'Diajukan', None))
+            conn.execute("UPDATE attendance SET status = 'Menunggu Persetujuan' WHERE rowid = ?", (record_id,))
+    if tanggal_diajukan:
+        perbarui_data_turunan(conn, user_nip, min(tanggal_diajukan), max(tanggal_diajukan))
+    enqueue_notification(conn, target_nip=id_atasan, title="Pengajuan Klarifikasi Baru",
+                         body="Ada pengajuan baru.", url="/dashboard_kajur")
+    conn.commit()
+    return redirect('/dashboard_dosen')
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench.db")
+    shutil.copy(os.path.join(ROOT, "database.db"), db_path)
+
+    os.environ['DATABASE'] = db_path
+    os.chdir(tmp)  # folder flask_session ikut dibuat di direktori sementara
+    sys.path.insert(0, ROOT)
+    import db
+    from app import app
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.add_url_rule('/submit_klarifikasi_lama', 'submit_klarifikasi_lama', submit_lama, methods=['POST'])
+    client = app.test_client()
+
+    jumlah_query = [0]
+
+    def hitung_query(_):
+        jumlah_query[0] += 1
+
+    asli_connect = db.connect
+
+    def connect_terhitung(*args, **kwargs):
+        conn = asli_connect(*args, **kwargs)
+        conn.set_trace_callback(hitung_query)
+        return conn
+
+    db.connect = connect_terhitung
+    db.pool.close_all()
+
+    conn = sqlite3.connect(db_path)
+    nip, nama, jurusan = conn.execute("""
+        SELECT nip, nama_lengkap, jurusan FROM users
+        WHERE role = 'Dosen' AND id_atasan IS NOT NULL AND id_atasan != '' ORDER BY nip LIMIT 1
+    """).fetchone()
+    with client.session_transaction() as s:
+        s.update({'user_id': nip, 'user_role': 'Dosen', 'user_jurusan': jurusan, 'user_name': nama})
+
+    tahun = [0]
+
+    def baris_absensi(jumlah):
+        # Januari (31 hari) tahun sintetis baru per percobaan agar tidak ada tanggal yang sudah diajukan
+        tahun[0] += 1
+        ids = [conn.execute("INSERT INTO attendance (nip, nama_lengkap, jurusan, tanggal) VALUES (?, ?, ?, ?)",
+                            (nip, nama, jurusan, f"{1900 + tahun[0]}-01-{hari:02d} 00:00:00")).lastrowid
+               for hari in range(1, jumlah + 1)]
+        conn.commit()
+        return ids
+
+    print(f"Dosen {nip}, {ULANG} percobaan per ukuran")
+    print(f"{'tanggal':>7} {'cara':<6} {'median':>9} {'query':>6}")
+    try:
+        for jumlah in JUMLAH_TANGGAL:
+            for cara, url in (('lama', '/submit_klarifikasi_lama'), ('baru', '/submit_klarifikasi')):
+                waktu = []
+                for _ in range(ULANG):
+                    ids = baris_absensi(jumlah)
+                    jumlah_query[0] = 0
+                    mulai = time.perf_counter()
+                    response = client.post(url, data={'record_ids': [str(i) for i in ids], 'kategori_surat': 'Non Fleksibel',
+                                                      'jenis_surat': 'Lupa Absen Masuk'})
+                    waktu.append(time.perf_counter() - mulai)
+                    assert response.status_code == 302, response.status_code
+                    menunggu = conn.execute(f"SELECT COUNT(*) FROM attendance WHERE status = 'Menunggu Persetujuan' AND rowid IN ({','.join('?' * len(ids))})", ids).fetchone()[0]
+                    assert menunggu == jumlah, f"{cara}: {menunggu}/{jumlah} tanggal tersimpan"
+                print(f"{jumlah:>7} {cara:<6} {statistics.median(waktu) * 1000:>7.2f}ms {jumlah_query[0]:>6}")
+    finally:
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# scripts/stub_push_server.py
+# Push endpoint lokal untuk menguji dispatcher notifikasi tanpa FCM/Mozilla.
+# Perilaku ditentukan oleh path endpoint subscription:
+#   /ok/...     -> 201 Created
+#   /gone/...   -> 410 Gone (subscription harus dihapus dari database)
+#   /flaky/...  -> 503 pada percobaan pertama, lalu 201 (menguji retry/backoff)
+#   /slow/...   -> 201 setelah jeda 1 detik (menguji pengiriman paralel)
+#
+# Pemakaian:
+#   python scripts/stub_push_server.py            -> jalankan server saja (port 8765)
+#   python scripts/stub_push_server.py --demo     -> uji end-to-end pada database sementara
+import base64
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = int(os.getenv("STUB_PUSH_PORT", "8765"))
+
+diterima = []
+_percobaan = {}
+_lock = threading.Lock()
+
+
+class StubPushHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        panjang = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(panjang)
+        with _lock:
+            _percobaan[self.path] = _percobaan.get(self.path, 0) + 1
+            ke = _percobaan[self.path]
+
+        if self.path.startswith('/gone/'):
+            status = 410
+        elif self.path.startswith('/flaky/') and ke == 1:
+            status = 503
+        else:
+            if self.path.startswith('/slow/'):
+                time.sleep(1)
+            status = 201
+        with _lock:
+            diterima.append((self.path, status))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        print(f"[stub] {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+
+def jalankan_server(port=PORT):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubPushHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def buat_subscription(endpoint):
+    # Kunci klien palsu yang valid secara kriptografis (P-256 + auth secret)
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    kunci = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        encoding=serialization.Encoding.X962,
+        format=serialization.PublicFormat.UncompressedPoint
+    )
+    b64 = lambda b: base64.urlsafe_b64encode(b).rstrip(b'=').decode()
+    return {"endpoint": endpoint, "keys": {"p256dh": b64(kunci), "auth": b64(os.urandom(16))}}
+
+
+def buat_vapid_private_key():
+    from cryptography.hazmat.primitives.asymmetric import ec
+    nilai = ec.generate_private_key(ec.SECP256R1()).private_numbers().private_value.to_bytes(32, 'big')
+    return base64.urlsafe_b64encode(nilai).rstrip(b'=').decode()
+
+
+def demo():
+    import notifications
+    from migrations import apply_migrations
+
+    notifications.VAPID_PRIVATE_KEY = buat_vapid_private_key()
+    notifications.BACKOFF_BASE = 0  # retry langsung agar demo cepat
+    server = jalankan_server()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "demo.db")
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        apply_migrations(conn)
+        # NIP 1004 punya dua perangkat lambat: satu notifikasi disebar ke keduanya
+        skenario = {'1001': ['ok'], '1002': ['gone'], '1003': ['flaky'], '1004': ['slow', 'slow'], '1005': ['ok', 'gone']}
+        for nip, perangkat in skenario.items():
+            conn.execute("INSERT INTO users (nip, password, role, id_atasan) VALUES (?, 'x', 'Dosen', '9000')", (nip,))
+            for i, jenis in enumerate(perangkat):
+                notifications.save_subscription(conn, nip, buat_subscription(f"{base}/{jenis}/{nip}-{i}"))
+        notifications.enqueue_notification_batch(
+            conn, [(nip, "Uji", "Notifikasi untuk semua bawahan", "/dashboard_dosen") for nip in skenario])
+        conn.commit()
+
+        dispatcher = notifications.OutboxDispatcher(database=db_path)
+        mulai = time.perf_counter()
+        dispatcher.run_once()
+        print(f"Batch pertama selesai dalam {time.perf_counter() - mulai:.2f} detik (endpoint lambat dikirim paralel)")
+        dispatcher.run_once()  # retry untuk endpoint flaky
+        dispatcher.close()
+
+        for row in conn.execute("SELECT target_nip, status, attempts, last_error FROM notification_outbox ORDER BY id"):
+            print(f"  NIP {row[0]} ({','.join(skenario[row[0]]):<9}) status={row[1]:<7} percobaan={row[2]} {row[3] or ''}"[:140])
+        print("  Metrik per endpoint:")
+        for stat in notifications.endpoint_stats(conn):
+            print(f"    {stat['endpoint'][len(base):]:<14} sukses={stat['success_count']} gagal={stat['failure_count']} "
+                  f"rata2={stat['avg_latency_ms'] or 0:.0f} ms")
+        sisa = {r[0] for r in conn.execute("SELECT endpoint FROM push_subscriptions")}
+        dihapus = sorted({path for path, _ in diterima if base + path not in sisa})
+        print(f"  Endpoint dihapus (410): {dihapus}")
+        conn.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    if '--demo' in sys.argv:
+        demo()
+    else:
+        jalankan_server()
+        print(f"Stub push endpoint berjalan di http://127.0.0.1:{PORT} (Ctrl+C untuk berhenti)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,58 @@
+# worker.py
+# Proses latar belakang (lihat Procfile: `worker`). Mengirim notifikasi push
+# dari tabel notification_outbox, dan di thread terpisah membangun workbook
+# laporan bulanan (arsip_laporan.py) serta menjalankan job ekspor periode
+# (ekspor_periode.py).
+import logging
+import os
+import signal
+import threading
+from contextlib import closing
+
+import db
+from arsip_laporan import PembuatArsip
+from ekspor_periode import PembuatEkspor
+from migrations import apply_migrations
+from notifications import OutboxDispatcher
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+
+
+def main():
+    with closing(db.connect()) as conn:
+        apply_migrations(conn)
+
+    dispatcher = OutboxDispatcher()
+    pembuat = None
+    if os.getenv("ARSIP_PEMBUAT", "worker") == "worker":
+        pembuat = PembuatArsip()
+        thread_arsip = threading.Thread(target=pembuat.run_forever, name="arsip-laporan")
+        thread_arsip.start()
+    pembuat_ekspor = None
+    if os.getenv("EKSPOR_PEMBUAT", "worker") == "worker":
+        pembuat_ekspor = PembuatEkspor()
+        thread_ekspor = threading.Thread(target=pembuat_ekspor.run_forever, name="ekspor-periode")
+        thread_ekspor.start()
+
+    def berhenti(signum, frame):
+        print("Worker menerima sinyal berhenti, menyelesaikan batch terakhir...")
+        dispatcher.stop()
+        if pembuat is not None:
+            pembuat.stop()
+        if pembuat_ekspor is not None:
+            pembuat_ekspor.stop()
+
+    signal.signal(signal.SIGTERM, berhenti)
+    signal.signal(signal.SIGINT, berhenti)
+    dispatcher.run_forever()
+    if pembuat is not None:
+        thread_arsip.join()
+    if pembuat_ekspor is not None:
+        thread_ekspor.join()
+
+
+if __name__ == '__main__':
+    main()